@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+"""
+Compare the size and Python-side encoding time of the node data formats
+('xml', 'json', 'json-gz') on the example inputs.
+
+Usage: python benchmarks/bench_data_format.py
+"""
+import sys
+import os
+import time
+
+from taxburst import parsers, output
+
+example_dir = os.path.join(os.path.dirname(__file__), "../examples")
+
+examples = [
+    ("SRR11125891.summarized.csv", "csv_summary"),
+    ("SRR11125891.t0.gather.with-lineages.csv", "tax_annotate"),
+    ("SRR11125891.singleM.profile.tsv", "SingleM"),
+    ("SRR11125891.krona.tsv", "krona"),
+    ("SRR11125891.lineages.json", "json"),
+]
+
+
+def main():
+    print(f"{'input':42s} {'format':8s} {'page KB':>9s} {'data KB':>9s} {'encode s':>9s}")
+    for filename, input_format in examples:
+        path = os.path.join(example_dir, filename)
+        top_nodes, name, xtra = parsers.parse_file(path, input_format)
+        x = list(xtra or {})
+
+        for data_format in output.data_formats:
+            start = time.perf_counter()
+            fill, node_data = output._encode_nodes(top_nodes, x, data_format)
+            data_size = len("".join(fill) if node_data is None else node_data)
+            elapsed = time.perf_counter() - start
+
+            page = output.generate_html(
+                top_nodes,
+                name=name,
+                extra_attributes=xtra,
+                viewer="external",
+                data_format=data_format,
+            )
+            print(
+                f"{filename:42s} {data_format:8s} {len(page) / 1024:9.1f} {data_size / 1024:9.1f} {elapsed:9.4f}"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+"""
+Compare full and incremental ('--incremental') re-renders of the
+SRR11125891 'tax annotate' example, after changing the counts of a few
+genomes, as a live monitor would. Each render is a new process.
+
+Usage: python benchmarks/bench_incremental.py [-r 10] [-k 5]
+"""
+import sys
+import os
+import argparse
+import csv
+import subprocess
+import tempfile
+import time
+
+example = os.path.join(
+    os.path.dirname(__file__), "../examples/SRR11125891.t0.gather.with-lineages.csv"
+)
+
+
+def write_changed(filename, n_changed, step):
+    "Write the example with the counts of n_changed genomes changed."
+    with open(example, newline="") as fp:
+        rows = list(csv.DictReader(fp))
+
+    for i in range(n_changed):
+        row = rows[(i * 97 + step) % len(rows)]
+        row["n_unique_weighted_found"] = str(int(row["n_unique_weighted_found"]) + step)
+
+    with open(filename, "w", newline="") as fp:
+        w = csv.DictWriter(fp, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-r", "--repeat", type=int, default=10)
+    p.add_argument("-k", "--changed", type=int, default=5, help="genomes to change")
+    args = p.parse_args()
+
+    python = sys.executable
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_csv = os.path.join(tmpdir, "sample.csv")
+        full_html = os.path.join(tmpdir, "full.html")
+        incr_html = os.path.join(tmpdir, "incr.html")
+        base = [python, "-m", "taxburst", "-F", "tax_annotate", input_csv]
+
+        write_changed(input_csv, args.changed, 0)
+        subprocess.run(base + ["-o", incr_html, "--incremental"], check=True, capture_output=True)
+
+        times = dict(full=[], incremental=[])
+        for step in range(1, args.repeat + 1):
+            write_changed(input_csv, args.changed, step)
+            for label, cmd in [
+                ("full", base + ["-o", full_html]),
+                ("incremental", base + ["-o", incr_html, "--incremental"]),
+            ]:
+                start = time.perf_counter()
+                subprocess.run(cmd, check=True, capture_output=True)
+                times[label].append(time.perf_counter() - start)
+
+            with open(full_html) as fp1, open(incr_html) as fp2:
+                assert fp1.read() == fp2.read(), "incremental output differs!"
+
+        print(f"{args.changed} genome(s) changed per run; best of {args.repeat}")
+        print(f"{'render':12s} {'ms':>8s}")
+        for label, t in times.items():
+            print(f"{label:12s} {min(t) * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+"""
+Compare whole-tree 'json.dump'/'json.load' with the taxburst.jsonio
+streaming writer and the flat ('jsonl') format, on a synthetic tree.
+
+Usage: python benchmarks/bench_json_io.py [-n 200000]
+"""
+import sys
+import os
+import argparse
+import json
+import random
+import tempfile
+
+from taxburst import jsonio
+from bench_merge import make_sample_tree, measure
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--n-species", type=int, default=200000)
+    args = p.parse_args()
+
+    rng = random.Random(1)
+    top_nodes = make_sample_tree(
+        rng, n_species=args.n_species, n_present=args.n_species // 2
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        nested = os.path.join(tmpdir, "tree.json")
+        flat = os.path.join(tmpdir, "tree.jsonl")
+
+        def write_with(func, filename):
+            def write():
+                with open(filename, "wt") as fp:
+                    func(top_nodes, fp)
+
+            return write
+
+        def read_with(func, filename):
+            def read():
+                with open(filename, "rb") as fp:
+                    func(fp)
+
+            return read
+
+        print(f"JSON backend: {jsonio.backend}")
+        print(f"{'operation':32s} {'seconds':>8s} {'peak MB':>8s}")
+        for label, func in [
+            ("write json.dump", write_with(json.dump, nested)),
+            ("read json.load", read_with(json.load, nested)),
+            ("write jsonio.dump_tree", write_with(jsonio.dump_tree, nested)),
+            ("read jsonio.load_tree", read_with(jsonio.load_tree, nested)),
+            ("write jsonio.dump_jsonl", write_with(jsonio.dump_jsonl, flat)),
+            ("read jsonio.load_jsonl", read_with(jsonio.load_jsonl, flat)),
+        ]:
+            elapsed, peak = measure(func)
+            print(f"{label:32s} {elapsed:8.3f} {peak:8.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
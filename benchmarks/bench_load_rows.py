@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+"""
+Compare loading rows with csv.DictReader ('load_rows') against the
+column-projected loader ('iter_rows') on a synthetic, wide gather file.
+
+Usage: python benchmarks/bench_load_rows.py [-n <rows>]
+"""
+import sys
+import os
+import argparse
+import csv
+import tempfile
+import time
+import tracemalloc
+
+from taxburst import parsers
+
+example = os.path.join(
+    os.path.dirname(__file__), "../examples/SRR11125891.t0.gather.with-lineages.csv"
+)
+
+
+def make_gather_csv(filename, n_rows):
+    "Write n_rows synthetic gather rows, using the example file as a template."
+    with open(example, "r", newline="") as fp:
+        r = csv.reader(fp)
+        header = next(r)
+        template = next(r)
+
+    lin_i = header.index("lineage")
+    name_i = header.index("name")
+    with open(filename, "w", newline="") as fp:
+        w = csv.writer(fp)
+        w.writerow(header)
+        for i in range(n_rows):
+            row = list(template)
+            row[lin_i] = (
+                f"d__D{i % 3};p__P{i % 17};c__C{i % 101};o__O{i % 499};"
+                f"f__F{i % 1999};g__G{i % 7919};s__S{i}"
+            )
+            row[name_i] = f"GCF_{i:09d}.1 genome {i}"
+            w.writerow(row)
+
+
+def measure(func):
+    """Run func twice, returning (seconds, peak traced memory in MB).
+
+    Timing is done without tracemalloc, which slows things down a lot.
+    """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024**2
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--rows", type=int, default=50_000)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "gather.with-lineages.csv")
+        make_gather_csv(filename, args.rows)
+        size = os.path.getsize(filename) / 1024**2
+        print(f"{args.rows} rows, {size:.1f} MB")
+
+        pp = parsers.Parse_SourmashTaxAnnotate(filename)
+        paths = {
+            "load_rows (DictReader)": lambda: pp.load_rows(),
+            "iter_rows (projected)": lambda: list(pp.iter_rows()),
+            "iter_rows (lazy)": lambda: sum(1 for _ in pp.iter_rows()),
+            "parse_tax_annotate": lambda: parsers.parse_tax_annotate(filename),
+        }
+        for label, func in paths.items():
+            seconds, peak = measure(func)
+            print(f"{label:25s} {seconds:8.2f}s {peak:10.1f} MB peak")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+"""
+Benchmark merging many sample trees into one aligned cohort tree with
+'merge_trees', and (for smaller cohorts) compare with 'augment_tree'.
+
+Usage: python benchmarks/bench_merge.py [-s 10 100 1000]
+"""
+import sys
+import argparse
+import random
+import time
+import tracemalloc
+
+from taxburst import tree_utils
+
+
+def make_sample_tree(rng, *, n_species=2000, n_present=300):
+    "Build a synthetic sample tree containing a random subset of species."
+    from taxburst.parsers import LineageBuilder, GenericParser
+
+    builder = LineageBuilder(GenericParser.default_ranks)
+    for i in rng.sample(range(n_species), n_present):
+        # each name has exactly one parent: genus = species // 2, etc.
+        ids = [i]
+        for div in (2, 3, 3, 3, 3, 4):
+            ids.append(ids[-1] // div)
+        prefixes = ["s__S", "g__G", "f__F", "o__O", "c__C", "p__P", "d__D"]
+        names = [f"{prefix}{j}" for prefix, j in zip(prefixes, ids)]
+        names.reverse()
+        builder.add(names, rng.randint(1, 1000))
+    return builder.build()
+
+
+def measure(func):
+    "Run func twice, returning (seconds, peak traced memory in MB)."
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024**2
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-s", "--samples", type=int, nargs="+", default=[10, 100, 1000])
+    p.add_argument(
+        "--max-augment",
+        type=int,
+        default=100,
+        help="skip augment_tree for cohorts bigger than this",
+    )
+    args = p.parse_args()
+
+    rng = random.Random(1)
+    for n in args.samples:
+        trees = [make_sample_tree(rng) for _ in range(n)]
+
+        seconds, peak = measure(lambda: tree_utils.merge_trees(trees))
+        print(f"{n:5d} samples  merge_trees  {seconds:8.2f}s {peak:10.1f} MB peak")
+
+        if n <= args.max_augment:
+            seconds, peak = measure(
+                lambda: tree_utils.augment_tree(trees[0], trees[1:])
+            )
+            print(f"{n:5d} samples  augment_tree {seconds:8.2f}s {peak:10.1f} MB peak")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+"""
+Measure the time for short taxburst runs, each in a new process: the
+'import taxburst', '--help', a JSON-only run and a small HTML render.
+
+Usage: python benchmarks/bench_startup.py [-r 20]
+"""
+import sys
+import os
+import argparse
+import subprocess
+import tempfile
+import time
+
+example = os.path.join(
+    os.path.dirname(__file__), "../examples/SRR11125891.summarized.csv"
+)
+
+
+def best_time(cmd, repeat):
+    "Return the best wall time of 'repeat' runs of cmd."
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-r", "--repeat", type=int, default=20)
+    args = p.parse_args()
+
+    python = sys.executable
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_json = os.path.join(tmpdir, "out.json")
+        output_html = os.path.join(tmpdir, "out.html")
+        commands = {
+            "python (no import)": [python, "-c", "pass"],
+            "import taxburst": [python, "-c", "import taxburst"],
+            "taxburst --help": [python, "-m", "taxburst", "--help"],
+            "taxburst --save-json": [
+                python,
+                "-m",
+                "taxburst",
+                example,
+                "--save-json",
+                output_json,
+            ],
+            "taxburst -o": [python, "-m", "taxburst", example, "-o", output_html],
+        }
+
+        print(f"{'command':24s} {'ms':>8s}")
+        for label, cmd in commands.items():
+            elapsed = best_time(cmd, args.repeat)
+            print(f"{label:24s} {elapsed * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#! /usr/bin/env python
+"""
+Time and measure the peak memory of the parsers, tree utilities and HTML
+generation on synthetic inputs, and compare against a saved baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py [-n 20000 -b 10 -d 7]
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+
+With --compare, the exit status is 1 if any benchmark is slower or
+uses more memory than the baseline by more than the thresholds.
+"""
+import sys
+import os
+import argparse
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from taxburst import parsers, tree_utils, checks, output, frozen
+
+from synthetic import Taxonomy
+
+
+def measure(func, *, repeat=3):
+    """Return (best seconds of 'repeat' runs, peak traced memory in MB).
+
+    Timing is done without tracemalloc, which slows things down a lot.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024**2
+
+
+def make_benchmarks(tax, tmpdir):
+    "Return a dictionary of name => function to benchmark."
+    inputs = {}
+    for fmt, write in [
+        ("csv_summary", tax.write_csv_summary),
+        ("tax_annotate", tax.write_tax_annotate),
+        ("SingleM", tax.write_singlem),
+        ("krona", tax.write_krona),
+    ]:
+        filename = os.path.join(tmpdir, f"synthetic.{fmt}")
+        write(filename)
+        inputs[fmt] = filename
+
+    tree = tax.make_tree()
+    nodes_by_tax = tax.nodes_by_tax()
+
+    # a second tree with overlapping but different leaves, for augment_tree.
+    other = Taxonomy(
+        tax.n_rows, breadth=tax.breadth, depth=tax.depth, seed=2
+    ).make_tree()
+
+    frozen_tree = frozen.freeze(tree)
+    flat = tree_utils.flatten_tree(tree)
+    own = tree_utils.unassigned_counts(flat)
+
+    def assign_children():
+        # assign_children modifies the nodes, so give it fresh ones.
+        parsers.assign_children({k: dict(v) for k, v in nodes_by_tax.items()})
+
+    return {
+        "parse_csv_summary": lambda: parsers.parse_csv_summary(inputs["csv_summary"]),
+        "parse_tax_annotate": lambda: parsers.parse_tax_annotate(
+            inputs["tax_annotate"]
+        ),
+        "parse_SingleM": lambda: parsers.parse_SingleM(inputs["SingleM"]),
+        "parse_krona": lambda: parsers.parse_krona(inputs["krona"]),
+        "assign_children": assign_children,
+        "augment_tree": lambda: tree_utils.augment_tree(tree, [other]),
+        "augment_frozen": lambda: tree_utils.augment_tree(frozen_tree, [other]),
+        "copy_tree": lambda: tree_utils.copy_tree(tree),
+        "tree_index": lambda: tree_utils.TreeIndex(tree),
+        "flatten_tree": lambda: tree_utils.flatten_tree(tree),
+        "subtree_sums": lambda: tree_utils.subtree_sums(flat, own),
+        "check_structure": lambda: checks.check_structure(tree),
+        "generate_html": lambda: output.generate_html(tree, name="synthetic"),
+    }
+
+
+def compare(results, baseline, *, time_threshold, memory_threshold):
+    "Print a comparison with the baseline; return the list of regressions."
+    regressions = []
+    print()
+    print(f"{'benchmark':20s} {'time':>8s} {'memory':>8s}  (ratio to baseline)")
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            print(f"{name:20s} {'new':>8s}")
+            continue
+
+        t_ratio = r["seconds"] / b["seconds"] if b["seconds"] else 1.0
+        m_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] else 1.0
+        flags = []
+        if t_ratio > time_threshold:
+            flags.append("SLOWER")
+        if m_ratio > memory_threshold:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append(name)
+        print(f"{name:20s} {t_ratio:8.2f} {m_ratio:8.2f}  {' '.join(flags)}")
+
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--rows", type=int, default=20000, help="number of leaves")
+    p.add_argument(
+        "-b", "--breadth", type=int, default=10, help="children per internal node"
+    )
+    p.add_argument("-d", "--depth", type=int, default=7, help="number of ranks")
+    p.add_argument("-r", "--repeat", type=int, default=3, help="timing runs to take the best of")
+    p.add_argument("-k", "--only", nargs="+", help="run only these benchmarks")
+    p.add_argument("--save", help="save the results as a baseline JSON file")
+    p.add_argument("--compare", help="compare the results with this baseline")
+    p.add_argument(
+        "--time-threshold",
+        type=float,
+        default=1.5,
+        help="report a regression if time is more than this ratio of the baseline",
+    )
+    p.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=1.2,
+        help="report a regression if peak memory is more than this ratio of the baseline",
+    )
+    args = p.parse_args()
+
+    params = dict(rows=args.rows, breadth=args.breadth, depth=args.depth)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if baseline["params"] != params:
+            print(
+                f"WARNING: baseline was run with {baseline['params']}, not {params}"
+            )
+
+    tax = Taxonomy(args.rows, breadth=args.breadth, depth=args.depth)
+    print(f"synthetic taxonomy: {params}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        benchmarks = make_benchmarks(tax, tmpdir)
+        if args.only:
+            benchmarks = {k: v for k, v in benchmarks.items() if k in args.only}
+
+        print(f"{'benchmark':20s} {'seconds':>8s} {'peak MB':>8s}")
+        for name, func in benchmarks.items():
+            seconds, peak = measure(func, repeat=args.repeat)
+            results[name] = dict(seconds=round(seconds, 5), peak_mb=round(peak, 3))
+            print(f"{name:20s} {seconds:8.4f} {peak:8.1f}")
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(
+                dict(params=params, python=platform.python_version(), results=results),
+                fp,
+                indent=2,
+            )
+        print(f"saved baseline to '{args.save}'")
+
+    if baseline is not None:
+        regressions = compare(
+            results,
+            baseline["results"],
+            time_threshold=args.time_threshold,
+            memory_threshold=args.memory_threshold,
+        )
+        if regressions:
+            print(f"\nregressions: {', '.join(regressions)}")
+            return 1
+        print("\nno regressions.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
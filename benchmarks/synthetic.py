@@ -0,0 +1,116 @@
+"""
+Synthetic inputs for the benchmarks: consistent taxonomies of any size,
+written out in each of the input formats, or built directly as trees.
+
+A taxonomy has 'n_rows' leaves at 'depth' ranks; every node at one rank
+has up to 'breadth' children at the next, so leaf i's ancestor at each
+rank is i // breadth, i // breadth**2, and so on.
+"""
+
+import csv
+import random
+
+from taxburst.parsers import GenericParser, LineageBuilder
+
+ranks = GenericParser.default_ranks
+
+
+class Taxonomy:
+    "A synthetic taxonomy with a random count for every leaf."
+
+    def __init__(self, n_rows, *, breadth=10, depth=7, seed=1):
+        assert 1 <= depth <= len(ranks) - 1, "depth must leave room for 'genome'"
+        self.n_rows = n_rows
+        self.breadth = breadth
+        self.depth = depth
+
+        rng = random.Random(seed)
+        self.counts = [rng.randint(1, 1000) for _ in range(n_rows)]
+        self.total = sum(self.counts)
+
+    def lineage(self, i):
+        "Return the list of names from the top rank down to leaf i."
+        names = []
+        j = i
+        for level in range(self.depth - 1, -1, -1):
+            rank = ranks[level]
+            names.append(f"{rank[0]}__{rank}{j}")
+            j //= self.breadth
+        names.reverse()
+        return names
+
+    def iter_leaves(self):
+        "Yield (lineage, count) for every leaf."
+        for i, count in enumerate(self.counts):
+            yield self.lineage(i), count
+
+    def lineage_counts(self):
+        "Return a dictionary of 'a;b;c' => summed count, for every node."
+        sums = {}
+        for names, count in self.iter_leaves():
+            for k in range(1, len(names) + 1):
+                lin = ";".join(names[:k])
+                sums[lin] = sums.get(lin, 0) + count
+        return sums
+
+    def make_tree(self):
+        "Build the tree of node dictionaries directly."
+        builder = LineageBuilder(ranks)
+        for names, count in self.iter_leaves():
+            builder.add(names, count)
+        return builder.build()
+
+    def nodes_by_tax(self):
+        "Return the { lineage: node } input for 'parsers.assign_children'."
+        nodes = {}
+        for lin, count in self.lineage_counts().items():
+            names = lin.split(";")
+            nodes[lin] = dict(name=names[-1], count=count, rank=ranks[len(names) - 1])
+        return nodes
+
+    def write_csv_summary(self, filename):
+        "Write a sourmash 'tax metagenome' csv_summary file."
+        sums = self.lineage_counts()
+        by_level = sorted(sums.items(), key=lambda item: item[0].count(";"))
+        with open(filename, "w", newline="") as fp:
+            w = csv.writer(fp)
+            w.writerow(["query_name", "rank", "fraction", "lineage", "f_weighted_at_rank"])
+            for lin, count in by_level:
+                f = count / self.total
+                rank = ranks[lin.count(";")]
+                w.writerow(["synthetic", rank, f, lin, f])
+
+    def write_tax_annotate(self, filename):
+        "Write a sourmash 'tax annotate' file, with one genome per leaf."
+        with open(filename, "w", newline="") as fp:
+            w = csv.writer(fp)
+            w.writerow(
+                [
+                    "name",
+                    "lineage",
+                    "n_unique_weighted_found",
+                    "median_abund",
+                    "total_weighted_hashes",
+                    "sum_weighted_found",
+                ]
+            )
+            found = 0
+            for i, (names, count) in enumerate(self.iter_leaves()):
+                found += count
+                w.writerow(
+                    [f"genome{i}", ";".join(names), count, 1.0, found * 2, found]
+                )
+
+    def write_singlem(self, filename):
+        "Write a SingleM profile TSV."
+        with open(filename, "w", newline="") as fp:
+            fp.write("sample\tcoverage\ttaxonomy\n")
+            for names, count in self.iter_leaves():
+                fp.write(f"synthetic\t{count / 1000}\tRoot; {'; '.join(names)}\n")
+
+    def write_krona(self, filename):
+        "Write a krona TSV."
+        with open(filename, "w", newline="") as fp:
+            fp.write("\t".join(["fraction"] + ranks[: self.depth]) + "\n")
+            for names, count in self.iter_leaves():
+                fp.write("\t".join([str(count / self.total)] + names) + "\n")
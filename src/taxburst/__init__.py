@@ -1,62 +1,381 @@
 #! /usr/bin/env python
 import sys
-import pprint
-import argparse
-import os.path
-import json
+import importlib
+import contextlib
 
-from . import checks
-from . import parsers
-from .output import generate_html
+
+# subcommands, dispatched on the first argument: name => module.
+subcommands = {
+    "batch": ".batch",
+    "merge": ".merge",
+    "serve": ".serve",
+    "service": ".service",
+}
+
+# submodules and public functions are imported on first use, so that
+# short runs (and '--help') don't pay for importing everything.
+_submodules = [
+    "batch",
+    "cache",
+    "checks",
+    "compact",
+    "fileio",
+    "frozen",
+    "incremental",
+    "jsonio",
+    "merge",
+    "output",
+    "parsers",
+    "serve",
+    "service",
+    "timings",
+    "tree_utils",
+]
+_lazy_attributes = {
+    "generate_html": ".output",
+    "write_html": ".output",
+    "generate_multi_html": ".output",
+    "write_multi_html": ".output",
+    "viewer_modes": ".output",
+    "data_formats": ".output",
+    "prepare_viewer": ".output",
+    "merge_trees": ".tree_utils",
+    "prune_tree": ".tree_utils",
+    "collect_all_nodes": ".tree_utils",
+}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        value = importlib.import_module("." + name, __name__)
+    elif name in _lazy_attributes:
+        module = importlib.import_module(_lazy_attributes[name], __name__)
+        value = getattr(module, name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
 
 
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in subcommands:
+        module = importlib.import_module(subcommands[argv[0]], __name__)
+        return module.main(argv[1:])
+
+    import argparse
+    from . import parsers, timings
+    from .output import viewer_modes, data_formats
+    from .tree_utils import normalize_methods
+
     p = argparse.ArgumentParser()
-    p.add_argument("tax_csv", help="input tax CSV, in sourmash csv_summary format")
+    p.add_argument(
+        "tax_csv",
+        nargs="+",
+        help="input tax CSV, in sourmash csv_summary format; give several to get one dataset per input in the output. Use '-' for stdin",
+    )
     p.add_argument(
         "-F",
         "--input-format",
         default="csv_summary",
         choices=parsers.input_formats,
     )
-    p.add_argument("-o", "--output-html", help="output HTML file to this location.")
-    p.add_argument("--save-json", help="output a JSON file of the taxonomy")
+    p.add_argument(
+        "-o", "--output-html", help="output HTML file to this location; '-' for stdout"
+    )
+    p.add_argument(
+        "--name",
+        action="append",
+        help="name of the dataset, instead of one based on the filename; give once per input",
+    )
+    p.add_argument(
+        "--save-json",
+        help="output a JSON file of the taxonomy; use a .jsonl suffix for one node per line",
+    )
+    p.add_argument(
+        "--viewer",
+        default="inline",
+        choices=viewer_modes,
+        help="include the viewer code in the HTML (inline), load it from shared asset files (external), or output only the node data (data)",
+    )
+    p.add_argument(
+        "--asset-dir",
+        help="with --viewer external, write the viewer assets here; default is next to the output HTML",
+    )
+    p.add_argument(
+        "--asset-url",
+        help="with --viewer external, load the viewer assets from this URL prefix",
+    )
+    p.add_argument(
+        "--data-format",
+        default="xml",
+        choices=data_formats,
+        help="encode the node data as XML, or as compact JSON (optionally gzipped) that is decoded when the page loads",
+    )
+    p.add_argument(
+        "--cache-dir",
+        help="cache parsed input files in this directory, and reuse them when the input is unchanged",
+    )
+    p.add_argument(
+        "--cache-max-mb",
+        type=float,
+        help="remove least recently used cache entries beyond this size (default: 256 MB)",
+    )
+    p.add_argument(
+        "--incremental",
+        action="store_true",
+        help="reuse the unchanged parts of the previous output, saved next to it in '<output>.state'",
+    )
     p.add_argument(
         "--check-tree", help="check that tree makes sense", action="store_true"
     )
+    p.add_argument(
+        "--min-fraction",
+        type=float,
+        help="collapse nodes with less than this fraction of the total count into an 'other' node",
+    )
+    p.add_argument(
+        "--max-children",
+        type=int,
+        help="keep at most this many children per node, collapsing the rest into an 'other' node",
+    )
+    p.add_argument(
+        "--normalize",
+        choices=normalize_methods,
+        help="replace counts by fractions of the total count (total), or of the total count at the same depth in the tree (level)",
+    )
     p.add_argument(
         "--fail-on-error",
         help="fail if tree doesn't pass checks; implies --check-tree",
         action="store_true",
     )
-    if argv is None:
-        args = p.parse_args()
-    else:
-        args = p.parse_args(argv)
+    p.add_argument(
+        "--timings",
+        action="store_true",
+        help="report wall time, CPU time, peak memory and row/node counts for each phase",
+    )
+    p.add_argument(
+        "--timings-json", help="output the per-phase timings as JSON to this file"
+    )
+    p.add_argument("--profile", help="save a cProfile profile of the run to this file")
+    args = p.parse_args(argv)
 
     if not args.output_html and not args.save_json:
         print(f"No output specified?! Error exit.")
         sys.exit(-1)
 
+    outputs = [args.output_html, args.save_json]
+    if outputs.count("-") > 1:
+        print(f"Only one output can go to stdout ('-'). Error exit.", file=sys.stderr)
+        sys.exit(-1)
+    if args.tax_csv.count("-") > 1:
+        print(f"Only one input can come from stdin ('-'). Error exit.", file=sys.stderr)
+        sys.exit(-1)
+    if args.name and len(args.name) != len(args.tax_csv):
+        print(f"--name must be given once per input. Error exit.", file=sys.stderr)
+        sys.exit(-1)
+    if args.incremental and (
+        not args.output_html
+        or args.output_html == "-"
+        or len(args.tax_csv) > 1
+        or args.data_format != "xml"
+    ):
+        print(
+            f"--incremental needs one input, -o to a file, and --data-format xml. Error exit.",
+            file=sys.stderr,
+        )
+        sys.exit(-1)
+
+    # if output goes to stdout, send all messages to stderr instead.
+    stdout = sys.stdout
+    messages = contextlib.nullcontext()
+    if "-" in outputs:
+        messages = contextlib.redirect_stdout(sys.stderr)
+
+    with messages:
+        timer = timings.PhaseTimings()
+        profiler = None
+        if args.profile:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        try:
+            run(args, timer, stdout=stdout)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+                print(f"saved profile to '{args.profile}'")
+
+        if args.timings:
+            timer.report()
+        if args.timings_json:
+            import json
+
+            with open(args.timings_json, "wt") as fp:
+                json.dump(timer.as_dict(), fp, indent=2)
+            print(f"saved timings to '{args.timings_json}'")
+
+
+def run(args, timer, *, stdout=None):
+    """Parse, check, and output, recording the phases in 'timer'.
+
+    Outputs named '-' are written to 'stdout' (default sys.stdout).
+    """
+    from . import checks, parsers, fileio
+    from .tree_utils import (
+        merge_trees,
+        prune_tree,
+        collect_all_nodes,
+        normalize_tree_counts,
+    )
+    from .output import write_html, write_multi_html, prepare_viewer
+
+    count_nodes = args.timings or args.timings_json
+
+    def open_output(filename):
+        if filename == "-":
+            return contextlib.nullcontext(stdout or sys.stdout)
+        return fileio.open_output(filename)
+
+    check_tree = args.check_tree or args.fail_on_error
+
+    parse_file = parsers.parse_file
+    if args.cache_dir:
+        from . import cache
+
+        max_bytes = cache.default_max_bytes
+        if args.cache_max_mb is not None:
+            max_bytes = int(args.cache_max_mb * 1024**2)
+        tree_cache = cache.TreeCache(args.cache_dir, max_bytes=max_bytes)
+        parse_file = tree_cache.parse_file
+
     # parse!
-    top_nodes, name, xtra = parsers.parse_file(args.tax_csv, args.input_format)
-    assert top_nodes is not None
-    checks.check_structure(top_nodes)
+    trees = []
+    names = []
+    extra_attributes = {}
+    reports = []
+    for i, filename in enumerate(args.tax_csv):
+        with timer.phase("parse", files=1) as stats:
+            top_nodes, name, xtra = parse_file(
+                filename, args.input_format, stats=stats
+            )
+            if args.name:
+                name = args.name[i]
+            assert top_nodes is not None
+            if count_nodes:
+                stats["nodes"] = len(collect_all_nodes(top_nodes))
+
+        with timer.phase("check"):
+            if check_tree:
+                # run the structure and count checks in one pass.
+                report = checks.validate(top_nodes, rules=checks.check_tree_rules)
+                checks.raise_structure_findings(report)
+                reports.append(report)
+            else:
+                checks.check_structure(top_nodes)
+
+        trees.append(top_nodes)
+        names.append(name)
+        if xtra:
+            extra_attributes.update(xtra)
+
+    if args.cache_dir:
+        print(
+            f"cache: {tree_cache.hits} hit(s), {tree_cache.misses} miss(es) in '{args.cache_dir}'"
+        )
+
+    if args.min_fraction is not None or args.max_children is not None:
+        with timer.phase("prune") as stats:
+            trees = [
+                prune_tree(
+                    tree,
+                    min_fraction=args.min_fraction,
+                    max_children=args.max_children,
+                )
+                for tree in trees
+            ]
+            top_nodes = trees[0]
+            if count_nodes:
+                stats["nodes"] = sum(len(collect_all_nodes(t)) for t in trees)
+
+    if args.normalize:
+        with timer.phase("normalize"):
+            # in place; top_nodes is one of the trees.
+            for tree in trees:
+                normalize_tree_counts(tree, by=args.normalize)
+
+    xtra = extra_attributes or None
+    if len(trees) > 1:
+        print(f"loaded {len(trees)} datasets: {', '.join(names)}")
 
     if args.save_json:
-        print(f"saving tree in JSON format to '{args.save_json}'")
-        with open(args.save_json, "wt") as fp:
-            json.dump(top_nodes, fp)
+        from . import jsonio
 
-    if args.check_tree or args.fail_on_error:
-        checks.check_all_counts(top_nodes, fail_on_error=args.fail_on_error)
+        with timer.phase("save_json"):
+            if len(trees) > 1:
+                # several datasets: save the aligned tree, with per-dataset counts.
+                top_nodes = merge_trees(trees, attributes=list(extra_attributes))
+            print(f"saving tree in JSON format to '{args.save_json}'")
+            json_name = fileio.strip_compression_suffix(args.save_json)
+            with open_output(args.save_json) as fp:
+                if json_name.endswith(".jsonl"):
+                    jsonio.dump_jsonl(top_nodes, fp)
+                else:
+                    jsonio.dump_tree(top_nodes, fp)
 
-    # build XHTML
-    content = generate_html(top_nodes, name=name, extra_attributes=xtra)
+    for report in reports:
+        checks.print_count_warnings(report, fail_on_error=args.fail_on_error)
 
-    # output!!
+    # build XHTML & output!!
     if args.output_html:
-        with open(args.output_html, "wt") as fp:
-            fp.write(content)
+        # note: 'render' includes the 'node_data' phase.
+        with timer.phase("render"):
+            viewer_args = prepare_viewer(
+                args.viewer,
+                args.output_html,
+                asset_dir=args.asset_dir,
+                asset_url=args.asset_url,
+                data_format=args.data_format,
+            )
+            with open_output(args.output_html) as fp:
+                if len(trees) > 1:
+                    write_multi_html(
+                        trees,
+                        fp,
+                        dataset_names=names,
+                        extra_attributes=xtra,
+                        timer=timer,
+                        **viewer_args,
+                    )
+                elif args.incremental:
+                    from . import incremental
+
+                    stats = incremental.write_html(
+                        top_nodes,
+                        fp,
+                        state_file=incremental.state_filename(args.output_html),
+                        name=name,
+                        extra_attributes=xtra,
+                        timer=timer,
+                        **viewer_args,
+                    )
+                    print(
+                        f"incremental: formatted {stats['formatted']} of {stats['nodes']} nodes"
+                    )
+                else:
+                    write_html(
+                        top_nodes,
+                        fp,
+                        name=name,
+                        extra_attributes=xtra,
+                        timer=timer,
+                        **viewer_args,
+                    )
 
         print(f"wrote output to '{args.output_html}'")
@@ -0,0 +1,297 @@
+"""
+Batch mode: turn many input files into many HTML files in one process.
+
+Usage: taxburst batch [inputs ...] [-m manifest.csv] -d <output dir> -j <N>
+"""
+
+import os
+import argparse
+import csv
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from . import checks
+from . import parsers
+from . import output
+from . import cache
+from . import fileio
+
+
+def load_manifest(filename, *, default_format):
+    """Load a manifest CSV into a list of (input, format, output) jobs.
+
+    The manifest must have an 'input' column, and may have 'format' and
+    'output' columns; empty values fall back to the defaults. Relative
+    input and output paths are relative to the manifest's directory.
+    """
+    jobs = []
+    with open(filename, "r", newline="") as fp:
+        r = csv.DictReader(fp)
+        if r.fieldnames is None or "input" not in r.fieldnames:
+            raise Exception(f"manifest '{filename}' must have an 'input' column")
+
+        dirname = os.path.dirname(filename)
+        for row in r:
+            input_file = row["input"]
+            if not os.path.isabs(input_file):
+                input_file = os.path.join(dirname, input_file)
+            input_format = row.get("format") or default_format
+            output_html = row.get("output") or None
+            if output_html and not os.path.isabs(output_html):
+                output_html = os.path.join(dirname, output_html)
+            jobs.append((input_file, input_format, output_html))
+
+    return jobs
+
+
+def expand_inputs(patterns, *, default_format):
+    "Expand a list of filenames and/or glob patterns into jobs."
+    jobs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            # keep it, so that it's reported as a failure.
+            matches = [pattern]
+        for input_file in matches:
+            jobs.append((input_file, default_format, None))
+
+    return jobs
+
+
+def output_filename(input_file, input_format, output_html, output_dir):
+    "Return the output HTML filename for a job."
+    if output_html is not None:
+        return output_html
+    name = parsers.default_name(input_file, input_format)
+    return os.path.join(output_dir, f"{name}.html")
+
+
+def find_duplicate_outputs(jobs, output_dir):
+    "Return a list of (output, [inputs]) for outputs shared by several jobs."
+    inputs_by_output = {}
+    for input_file, input_format, output_html in jobs:
+        if input_format not in parsers.input_formats:
+            continue  # reported as a failure later.
+        output_html = output_filename(input_file, input_format, output_html, output_dir)
+        key = os.path.normcase(os.path.abspath(output_html))
+        inputs_by_output.setdefault(key, (output_html, []))[1].append(input_file)
+
+    return [v for v in inputs_by_output.values() if len(v[1]) > 1]
+
+
+def _init_worker():
+    "Load the templates once per worker process."
+    output.load_templates()
+
+
+def render_one(
+    input_file,
+    input_format,
+    output_html,
+    output_dir,
+    viewer_opts=None,
+    cache_opts=None,
+):
+    """Parse and render one input file.
+
+    viewer_opts is a dictionary of keyword arguments for 'prepare_viewer';
+    cache_opts, if given, is a dictionary of arguments for 'TreeCache'.
+
+    Returns (input_file, output_html, seconds, error); 'error' is None on
+    success, and a message otherwise. Never raises.
+    """
+    if viewer_opts is None:
+        viewer_opts = dict(viewer="inline")
+
+    start = time.perf_counter()
+    try:
+        if input_format not in parsers.input_formats:
+            raise Exception(f"unknown input format: '{input_format}'")
+
+        parse_file = parsers.parse_file
+        if cache_opts:
+            parse_file = cache.TreeCache(**cache_opts).parse_file
+
+        top_nodes, name, xtra = parse_file(input_file, input_format)
+        checks.check_structure(top_nodes)
+
+        output_html = output_filename(input_file, input_format, output_html, output_dir)
+
+        viewer_args = output.prepare_viewer(output_html=output_html, **viewer_opts)
+        with fileio.open_output(output_html) as fp:
+            output.write_html(
+                top_nodes, fp, name=name, extra_attributes=xtra, **viewer_args
+            )
+    except Exception as exc:
+        msg = str(exc) or exc.__class__.__name__
+        return input_file, output_html, time.perf_counter() - start, msg
+
+    return input_file, output_html, time.perf_counter() - start, None
+
+
+def run_batch(
+    jobs, *, output_dir=".", n_workers=1, viewer_opts=None, cache_opts=None
+):
+    """Run all jobs, yielding results from render_one as they are available.
+
+    With more than one worker, results are yielded in the order that the
+    jobs finish, not the order they were given in. If a worker process
+    dies, its job (and any others lost with the pool) are reported as
+    failures, like any other error.
+    """
+    if n_workers <= 1:
+        _init_worker()
+        for input_file, input_format, output_html in jobs:
+            yield render_one(
+                input_file,
+                input_format,
+                output_html,
+                output_dir,
+                viewer_opts,
+                cache_opts,
+            )
+        return
+
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(
+                render_one,
+                input_file,
+                input_format,
+                output_html,
+                output_dir,
+                viewer_opts,
+                cache_opts,
+            ): (input_file, output_html)
+            for input_file, input_format, output_html in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool as exc:
+                input_file, output_html = futures[future]
+                msg = f"worker process died: {exc}"
+                yield input_file, output_html, 0.0, msg
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="taxburst batch")
+    p.add_argument("inputs", nargs="*", help="input files or glob patterns")
+    p.add_argument(
+        "-m",
+        "--manifest",
+        help="CSV with 'input' and optional 'format' and 'output' columns",
+    )
+    p.add_argument(
+        "-F",
+        "--input-format",
+        default="csv_summary",
+        choices=parsers.input_formats,
+        help="input format for files without one in the manifest",
+    )
+    p.add_argument(
+        "-d", "--output-dir", default=".", help="output HTML files in this directory"
+    )
+    p.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    p.add_argument("--report", help="output a CSV of per-file timings and errors")
+    p.add_argument(
+        "--viewer",
+        default="inline",
+        choices=output.viewer_modes,
+        help="include the viewer code in each HTML file (inline), load it from shared asset files (external), or output only the node data (data)",
+    )
+    p.add_argument(
+        "--asset-dir",
+        help="with --viewer external, write the shared viewer assets here; default is the output directory",
+    )
+    p.add_argument(
+        "--asset-url",
+        help="with --viewer external, load the viewer assets from this URL prefix",
+    )
+    p.add_argument(
+        "--data-format",
+        default="xml",
+        choices=output.data_formats,
+        help="encode the node data as XML, or as compact JSON (optionally gzipped) that is decoded when the page loads",
+    )
+    p.add_argument(
+        "--cache-dir",
+        help="cache parsed input files in this directory, and reuse them when the input is unchanged",
+    )
+    p.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=cache.default_max_bytes / 1024**2,
+        help="remove least recently used cache entries beyond this size (default: %(default)s MB)",
+    )
+    args = p.parse_args(argv)
+
+    jobs = expand_inputs(args.inputs, default_format=args.input_format)
+    if args.manifest:
+        jobs += load_manifest(args.manifest, default_format=args.input_format)
+
+    if not jobs:
+        print(f"No inputs specified?! Error exit.")
+        return -1
+
+    duplicates = find_duplicate_outputs(jobs, args.output_dir)
+    for output_html, inputs in duplicates:
+        print(f"ERROR: {len(inputs)} inputs would all be written to '{output_html}':")
+        for input_file in inputs:
+            print(f"    '{input_file}'")
+    if duplicates:
+        print("Use a manifest to give them different outputs. Error exit.")
+        return -1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    viewer_opts = dict(viewer=args.viewer, data_format=args.data_format)
+    if args.viewer == "external":
+        viewer_opts["asset_dir"] = args.asset_dir or args.output_dir
+        viewer_opts["asset_url"] = args.asset_url
+
+    cache_opts = None
+    if args.cache_dir:
+        cache_opts = dict(
+            cache_dir=args.cache_dir, max_bytes=int(args.cache_max_mb * 1024**2)
+        )
+
+    print(f"rendering {len(jobs)} input file(s) with {args.jobs} worker(s)")
+    start = time.perf_counter()
+    results = []
+    results_iter = run_batch(
+        jobs,
+        output_dir=args.output_dir,
+        n_workers=args.jobs,
+        viewer_opts=viewer_opts,
+        cache_opts=cache_opts,
+    )
+    for result in results_iter:
+        input_file, output_html, seconds, error = result
+        if error is None:
+            print(f"{seconds:8.2f}s  '{input_file}' -> '{output_html}'")
+        else:
+            print(f"{seconds:8.2f}s  FAILED '{input_file}': {error}")
+        results.append(result)
+
+    failed = [r for r in results if r[3] is not None]
+    elapsed = time.perf_counter() - start
+    print(
+        f"done in {elapsed:.2f}s: {len(results) - len(failed)} succeeded, {len(failed)} failed."
+    )
+
+    if args.report:
+        with open(args.report, "w", newline="") as fp:
+            w = csv.writer(fp)
+            w.writerow(["input", "output", "seconds", "error"])
+            for input_file, output_html, seconds, error in results:
+                w.writerow([input_file, output_html or "", f"{seconds:.4f}", error or ""])
+        print(f"wrote per-file report to '{args.report}'")
+
+    if failed:
+        return 1
+    return 0
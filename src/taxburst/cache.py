@@ -0,0 +1,141 @@
+"""
+An on-disk cache of parsed trees, so that repeat renders of the same
+input file skip parsing.
+
+Entries are keyed by the input file's path and contents, the input
+format and the taxburst version, and are stored as zlib-compressed
+pickles. The cache is trimmed to a maximum size by removing the least
+recently used entries.
+
+Entries are pickles, so only use a cache directory that you trust.
+"""
+
+import os
+import os.path
+import hashlib
+import pickle
+import tempfile
+import zlib
+
+from . import parsers
+
+default_max_bytes = 256 * 1024**2
+_suffix = ".tree"
+
+
+def _taxburst_version():
+    # importlib.metadata is slow to import, so only do it when needed.
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return version("taxburst")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class TreeCache:
+    "A directory of cached parse results, trimmed to max_bytes."
+
+    def __init__(self, cache_dir, *, max_bytes=default_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = _taxburst_version()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filename, input_format):
+        "Build the cache key for parsing this file in this format."
+        h = hashlib.sha256()
+        for part in (os.path.abspath(filename), input_format, self.version):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+
+        with open(filename, "rb") as fp:
+            while chunk := fp.read(1024**2):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + _suffix)
+
+    def get(self, key):
+        "Return the cached (top_nodes, name, xtra) for key, or None."
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+            value = pickle.loads(zlib.decompress(data))
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            # a truncated or stale entry; treat as a miss.
+            print(f"WARNING: ignoring bad cache entry '{path}': {exc}")
+            return None
+
+        # mark as recently used, for eviction; another process may have
+        # trimmed the entry since we read it, which is fine.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        "Store (top_nodes, name, xtra) for key, then trim the cache."
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+        # write atomically, so concurrent readers never see partial entries.
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.trim()
+
+    def trim(self):
+        "Remove least recently used entries until under max_bytes."
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(_suffix):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:  # trimmed by another process
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def parse_file(self, filename, input_format, *, stats=None):
+        "Like 'parsers.parse_file', but use the cache if possible."
+        if filename == "-":  # can't read stdin twice.
+            return parsers.parse_file(filename, input_format, stats=stats)
+
+        key = self.key(filename, input_format)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            if stats is not None:
+                stats["cache_hits"] = 1
+            return value
+
+        self.misses += 1
+        value = parsers.parse_file(filename, input_format, stats=stats)
+        self.put(key, value)
+        return value
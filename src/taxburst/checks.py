@@ -1,81 +1,253 @@
+import time
+from collections import namedtuple
+
 from .tree_utils import *
 
 
-def check_count(node, *, fail_on_error=False):
-    "Check for a parent node count that is less than sum of child node counts."
+# a problem found by 'validate': rule name, node name, a message, and
+# the node itself.
+Finding = namedtuple("Finding", ["rule", "name", "message", "node"], defaults=[None])
+
+
+def _count_problem(node):
+    "Return a message if node's count is less than the sum of its children's."
     children = node.get("children", [])
     if not children:
-        return
+        return None
 
     sub_counts = round(sum([float(n["count"]) for n in children]))
     count = round(float(node["count"]), 4)
 
     if count < sub_counts:
-        print(
-            f"WARNING: parent node {node['name']} has count {count}, but nodes beneath sum to {sub_counts}"
-        )
-        print([n["count"] for n in children])
+        return f"parent node {node['name']} has count {count}, but nodes beneath sum to {sub_counts}"
+    return None
+
+
+def check_count(node, *, fail_on_error=False):
+    "Check for a parent node count that is less than sum of child node counts."
+    msg = _count_problem(node)
+    if msg:
+        print(f"WARNING: {msg}")
+        print([n["count"] for n in node["children"]])
         if fail_on_error:
             raise Exception(
                 "ERROR: some counts do not make sense; see warning message above"
             )
 
 
+# validation rules: each takes (node, parent, state) and returns a message
+# or None. 'state' is a dictionary shared by all rules for one validation.
+
+
+def _duplicate_name_message(name):
+    return f"duplicate name: '{name}'"
+
+
+def _rule_duplicate_names(node, parent, state):
+    name = node.get("name")
+    if not name:  # see 'empty_names'
+        return None
+
+    seen = state.setdefault("names", set())
+    if name in seen:
+        return _duplicate_name_message(name)
+    seen.add(name)
+    return None
+
+
+def _rule_missing_fields(node, parent, state):
+    missing = [k for k in ("count", "rank") if node.get(k) is None]
+    if missing:
+        return f"node '{node.get('name')}' is missing {' and '.join(missing)}"
+    return None
+
+
+def _rule_count_consistency(node, parent, state):
+    if node.get("count") is None:  # see 'missing_fields'
+        return None
+    for child in node.get("children", []):
+        if child.get("count") is None:
+            return None
+    return _count_problem(node)
+
+
+def _rule_empty_names(node, parent, state):
+    if not node.get("name"):
+        return "node has empty name!?"
+    return None
+
+
+def _rule_rank_order(node, parent, state):
+    "Child ranks must come after parent ranks; unknown ranks are ignored."
+    if parent is None:
+        return None
+
+    rank = node.get("rank")
+    parent_rank = parent.get("rank")
+    if rank in ranks and parent_rank in ranks:
+        if ranks.index(rank) <= ranks.index(parent_rank):
+            return f"node '{node['name']}' has rank {rank}, but its parent '{parent['name']}' has rank {parent_rank}"
+    return None
+
+
+validation_rules = {
+    "duplicate_names": _rule_duplicate_names,
+    "missing_fields": _rule_missing_fields,
+    "count_consistency": _rule_count_consistency,
+    "empty_names": _rule_empty_names,
+    "rank_order": _rule_rank_order,
+}
+
+
+class ValidationReport:
+    "The findings from 'validate', with optional per-rule timings in seconds."
+
+    def __init__(self, findings, timings):
+        self.findings = findings
+        self.timings = timings
+
+    @property
+    def ok(self):
+        return not self.findings
+
+    def for_rules(self, *rules):
+        "Return the findings for these rules."
+        return [f for f in self.findings if f.rule in rules]
+
+    def print_warnings(self, *rules):
+        "Print a warning for each finding (for these rules, if given)."
+        findings = self.for_rules(*rules) if rules else self.findings
+        for finding in findings:
+            print(f"WARNING: {finding.message}")
+        return findings
+
+
+def validate(top_nodes, *, rules=None, timings=False):
+    """Check a tree against many rules, in a single pass over all nodes.
+
+    'rules' is a list of names from 'validation_rules'; the default is to
+    run all of them. Returns a ValidationReport; nothing is printed or
+    raised. With 'timings', the report includes the time spent per rule.
+    """
+    if rules is None:
+        rules = list(validation_rules)
+    funcs = [(rule, validation_rules[rule]) for rule in rules]
+
+    findings = []
+    rule_times = dict.fromkeys(rules, 0.0)
+    state = {}
+    perf_counter = time.perf_counter
+
+    stack = [(node, None) for node in reversed(top_nodes)]
+    while stack:
+        node, parent = stack.pop()
+        for rule, func in funcs:
+            if timings:
+                start = perf_counter()
+                msg = func(node, parent, state)
+                rule_times[rule] += perf_counter() - start
+            else:
+                msg = func(node, parent, state)
+
+            if msg:
+                findings.append(Finding(rule, node.get("name"), msg, node))
+
+        children = node.get("children")
+        if children:
+            for child in reversed(children):
+                stack.append((child, node))
+
+    return ValidationReport(findings, rule_times if timings else {})
+
+
+# the rules run by '--check-tree': the checks of 'check_structure' and
+# 'check_all_counts', in one pass.
+check_tree_rules = ["duplicate_names", "missing_fields", "count_consistency"]
+
+
+def raise_structure_findings(report):
+    "Fail on the first 'check_structure' problem in a report, if any."
+    findings = report.for_rules("duplicate_names", "missing_fields")
+    if findings:
+        raise Exception(f"ERROR: {findings[0].message}")
+
+
+def print_count_warnings(report, *, fail_on_error=True):
+    "Warn about (and optionally fail on) counts, just like 'check_all_counts'."
+    for finding in report.for_rules("count_consistency"):
+        check_count(finding.node, fail_on_error=fail_on_error)
+
+
 def check_all_counts(top_nodes, *, fail_on_error=True):
     "Check for parent node counts that are less than sum of child node counts."
+    if isinstance(top_nodes, CompactTree):
+        # only look at nodes with children, without building views for all.
+        for i in range(top_nodes.n_nodes):
+            if top_nodes.first_child[i] != -1:
+                check_count(CompactNode(top_nodes, i), fail_on_error=fail_on_error)
+        return
+
     for node in nodes_beneath_top(top_nodes):
         check_count(node, fail_on_error=fail_on_error)
 
 
 def check_names(top_nodes, *, fail_on_error=True):
-    "Check for empty names & duplicate names."
-    names = set()
-    do_fail = False
-    for node in nodes_beneath_top(top_nodes):
-        name = node["name"]
-        if not name:
-            print(f"WARNING: node has empty name!?")
-            do_fail = True
-        elif name in names:
-            print(f"WARNING: duplicate node name: '{name}'")
-            do_fail = True
-        else:
-            names.add(name)
-
-    if do_fail and fail_on_error:
+    """Check for empty names & duplicate names.
+
+    'top_nodes' may be a TreeIndex, whose record of bad names is reused.
+    """
+    index = TreeIndex.of(top_nodes)
+    for node in index.bad_names:
+        msg = _rule_empty_names(node, None, None)
+        if msg is None:
+            msg = _duplicate_name_message(node["name"])
+        print(f"WARNING: {msg}")
+
+    if index.bad_names and fail_on_error:
         raise Exception("ERROR: bad name(s); see warnings above.")
 
 
 def check_structure(nodelist):
-    seen = set()
-    for n in nodelist:
-        name = n["name"]
-        assert name not in seen, f"duplicate name: '{name}'"
-        seen.add(name)
-        for c in nodes_beneath(n, recurse=True):
-            name = c["name"]
-            assert name not in seen, f"duplicate name: '{name}'"
-            assert c.get("count") is not None
-            assert c.get("rank") is not None
-            seen.add(name)
+    "Check for duplicate names and missing counts/ranks; fails with assert."
+    if isinstance(nodelist, CompactTree):
+        # count & rank are always present; names are interned, so any
+        # duplicate name shows up as a repeated name id.
+        if len(set(nodelist.name_id)) != nodelist.n_nodes:
+            seen = set()
+            for name_id in nodelist.name_id:
+                name = nodelist.names[name_id]
+                assert name_id not in seen, f"duplicate name: '{name}'"
+                seen.add(name_id)
+        return
+
+    report = validate(nodelist, rules=["duplicate_names", "missing_fields"])
+    for finding in report.findings:
+        assert 0, finding.message
 
 
 def trees_are_equal(top_nodes1, top_nodes2):
-    "Check that trees are equal in name/count/rank and children."
-    nodelist1 = collect_all_nodes(top_nodes1)
-    nodelist2 = collect_all_nodes(top_nodes2)
-
-    n1_to_nodes = {}
-    n2_to_nodes = {}
-    for n1 in nodelist1:
-        n1_to_nodes[n1["name"]] = n1
-    for n2 in nodelist2:
-        n2_to_nodes[n2["name"]] = n2
-
-    for name in set(n1_to_nodes) | set(n2_to_nodes):
-        n1 = n1_to_nodes[name]
-        n2 = n2_to_nodes[name]
-        assert n1 is not n2, "trees share specific node objects, oops"
+    """Check that trees are equal in name/count/rank and children.
+
+    The trees must not share any nodes, except for frozen nodes (see
+    'taxburst.frozen'), which are immutable and so safe to share. Either
+    tree may be given as a TreeIndex, to reuse its index.
+    """
+    index1 = TreeIndex.of(top_nodes1)
+    index2 = TreeIndex.of(top_nodes2)
+    top_nodes1 = index1.top_nodes
+    top_nodes2 = index2.top_nodes
+
+    assert top_nodes1 is not top_nodes2, "trees are the same object, oops"
+    if isinstance(top_nodes1, CompactTree) and isinstance(top_nodes2, CompactTree):
+        # views are new objects every time, so check the arrays instead.
+        assert top_nodes1.count is not top_nodes2.count, "trees share arrays, oops"
+
+    for name in set(index1.by_name) | set(index2.by_name):
+        n1 = index1[name]
+        n2 = index2[name]
+        if n1 is n2:
+            # frozen nodes can't change, so sharing them is fine.
+            assert isinstance(n1, FrozenNode), "trees share specific node objects, oops"
 
         if n1["name"] != n2["name"]:
             return False
@@ -91,6 +263,16 @@ def trees_are_equal(top_nodes1, top_nodes2):
     return True
 
 
-def check(top_nodes, *, fail_on_error=True):
-    check_all_counts(top_nodes, fail_on_error=fail_on_error)
-    check_names(top_nodes, fail_on_error=fail_on_error)
+def check(top_nodes, *, fail_on_error=True, rules=None):
+    """Check counts and names (or the given rules) in a single pass.
+
+    Prints a warning for each problem found, and optionally fails.
+    """
+    if rules is None:
+        rules = ["count_consistency", "empty_names", "duplicate_names"]
+
+    report = validate(top_nodes, rules=rules)
+    if report.print_warnings() and fail_on_error:
+        raise Exception("ERROR: tree failed checks; see warnings above.")
+
+    return report
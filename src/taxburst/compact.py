@@ -0,0 +1,311 @@
+"""
+A compact, array-backed tree representation.
+
+The rest of taxburst passes trees around as lists of nested node
+dictionaries, which cost hundreds of bytes per node. 'CompactTree'
+stores the same information in parallel arrays, in pre-order, so that
+the subtree beneath node 'i' is the contiguous range of indices
+'i + 1 .. end[i] - 1'.
+
+A CompactTree behaves like a (read-only) list of top nodes, and each
+node is presented as a 'CompactNode' view that behaves like a node
+dictionary, so it can be passed to 'generate_html' and the 'checks' and
+'tree_utils' functions directly. Use 'CompactTree.from_nodes' and
+'to_nodes' to convert to and from the dictionary format.
+"""
+
+from array import array
+from collections.abc import Mapping
+
+# bit flags for CompactTree.flags
+COUNT_IS_INT = 1  # count was an int, not a float
+HAS_CHILDREN_KEY = 2  # node dict had a 'children' key, even if empty
+
+# keys that are stored in the arrays; everything else goes in 'extra'.
+_core_keys = ("name", "count", "rank", "children")
+
+
+class CompactTree:
+    """A tree of nodes stored in parallel arrays, in pre-order.
+
+    Counts are stored as 64-bit floats, converted with 'float()'. Whether
+    a count was an int is remembered, but ints beyond 2**53 lose
+    precision, and counts given as strings come back as floats.
+    """
+
+    def __init__(self):
+        self.parent = array("q")  # -1 for top nodes
+        self.first_child = array("q")  # -1 for leaves
+        self.next_sibling = array("q")  # -1 for last child
+        self.end = array("q")  # index just past this node's subtree
+        self.name_id = array("q")
+        self.rank_id = array("q")
+        self.count = array("d")
+        self.flags = bytearray()
+        self.names = []  # interned names, indexed by name_id
+        self.rank_names = []  # interned ranks, indexed by rank_id
+        self.extra = {}  # node index => dict of any other keys
+        self.top = array("q")  # indices of top nodes
+
+        self._name_ids = {}
+        self._rank_ids = {}
+
+    def __len__(self):
+        return len(self.top)
+
+    def __getitem__(self, i):
+        return CompactNode(self, self.top[i])
+
+    def __iter__(self):
+        for i in self.top:
+            yield CompactNode(self, i)
+
+    @property
+    def n_nodes(self):
+        return len(self.parent)
+
+    def intern_name(self, name):
+        if self._name_ids is None:
+            self._name_ids = {name: i for i, name in enumerate(self.names)}
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def intern_rank(self, rank):
+        rank_id = self._rank_ids.get(rank)
+        if rank_id is None:
+            rank_id = self._rank_ids[rank] = len(self.rank_names)
+            self.rank_names.append(rank)
+        return rank_id
+
+    @classmethod
+    def from_nodes(cls, top_nodes):
+        "Build a CompactTree from a list of node dictionaries."
+        tree = cls()
+        last_top = -1
+
+        # stack of (node, parent index); children pushed in reverse order.
+        stack = [(node, -1) for node in reversed(top_nodes)]
+        last_child = {}  # parent index => index of most recent child
+        while stack:
+            d, parent = stack.pop()
+            i = len(tree.parent)
+
+            tree.parent.append(parent)
+            tree.first_child.append(-1)
+            tree.next_sibling.append(-1)
+            tree.end.append(-1)
+            tree.name_id.append(tree.intern_name(d["name"]))
+            tree.rank_id.append(tree.intern_rank(d["rank"]))
+
+            count = d["count"]
+            flags = 0
+            if isinstance(count, int):
+                flags |= COUNT_IS_INT
+            tree.count.append(float(count))
+
+            if "children" in d:
+                flags |= HAS_CHILDREN_KEY
+            tree.flags.append(flags)
+
+            extra = {k: v for k, v in d.items() if k not in _core_keys}
+            if extra:
+                tree.extra[i] = extra
+
+            # link into parent, or top
+            if parent == -1:
+                if last_top != -1:
+                    tree.next_sibling[last_top] = i
+                tree.top.append(i)
+                last_top = i
+            else:
+                prev = last_child.get(parent, -1)
+                if prev == -1:
+                    tree.first_child[parent] = i
+                else:
+                    tree.next_sibling[prev] = i
+                last_child[parent] = i
+
+            children = d.get("children")
+            if children:
+                for child in reversed(children):
+                    stack.append((child, i))
+
+        # fill in 'end' bottom-up; parents always come before children.
+        n = len(tree.parent)
+        for i in range(n - 1, -1, -1):
+            if tree.end[i] == -1:
+                tree.end[i] = i + 1
+            p = tree.parent[i]
+            if p != -1 and tree.end[i] > tree.end[p]:
+                tree.end[p] = tree.end[i]
+
+        # names are (nearly) all unique, so the lookup table is about as big
+        # as the rest of the tree; rebuild it only if it's needed again.
+        tree._name_ids = None
+
+        return tree
+
+    def get_count(self, i):
+        "Return the count for node i, as int or float like the original."
+        count = self.count[i]
+        if self.flags[i] & COUNT_IS_INT:
+            return int(count)
+        return count
+
+    def child_indices(self, i):
+        "Return the list of indices of the direct children of node i."
+        children = []
+        c = self.first_child[i]
+        while c != -1:
+            children.append(c)
+            c = self.next_sibling[c]
+        return children
+
+    def iter_nodes(self):
+        "Yield a view of every node in the tree, in pre-order."
+        for i in range(len(self.parent)):
+            yield CompactNode(self, i)
+
+    def iter_beneath(self, i, *, recurse=False):
+        "Yield views of the nodes beneath node i."
+        if recurse:
+            for j in range(i + 1, self.end[i]):
+                yield CompactNode(self, j)
+        else:
+            for j in self.child_indices(i):
+                yield CompactNode(self, j)
+
+    def node_dict(self, i):
+        "Return a new dictionary for node i, without children."
+        d = dict(
+            name=self.names[self.name_id[i]],
+            count=self.get_count(i),
+            rank=self.rank_names[self.rank_id[i]],
+        )
+        extra = self.extra.get(i)
+        if extra:
+            d.update(extra)
+        return d
+
+    def to_nodes(self):
+        "Convert back into a list of node dictionaries."
+        dicts = [None] * len(self.parent)
+        top_nodes = []
+        for i in range(len(self.parent)):
+            d = self.node_dict(i)
+            if self.flags[i] & HAS_CHILDREN_KEY:
+                d["children"] = []
+            dicts[i] = d
+
+            p = self.parent[i]
+            if p == -1:
+                top_nodes.append(d)
+            else:
+                parent = dicts[p]
+                if "children" not in parent:
+                    parent["children"] = []
+                parent["children"].append(d)
+
+        return top_nodes
+
+    def copy(self):
+        "Return an independent copy of this tree."
+        tree = CompactTree()
+        for attr in (
+            "parent",
+            "first_child",
+            "next_sibling",
+            "end",
+            "name_id",
+            "rank_id",
+            "count",
+            "top",
+        ):
+            setattr(tree, attr, array(getattr(self, attr).typecode, getattr(self, attr)))
+        tree.flags = bytearray(self.flags)
+        tree.names = list(self.names)
+        tree.rank_names = list(self.rank_names)
+        tree.extra = {i: dict(d) for i, d in self.extra.items()}
+        tree._name_ids = None
+        tree._rank_ids = dict(self._rank_ids)
+        return tree
+
+
+class CompactNode(Mapping):
+    """A view of one node in a CompactTree that behaves like a node dict.
+
+    'count', 'name', 'rank' and extra keys can be set; the tree structure
+    cannot be changed through a view.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, key):
+        tree = self.tree
+        i = self.index
+        if key == "name":
+            return tree.names[tree.name_id[i]]
+        elif key == "count":
+            return tree.get_count(i)
+        elif key == "rank":
+            return tree.rank_names[tree.rank_id[i]]
+        elif key == "children":
+            if tree.first_child[i] == -1 and not tree.flags[i] & HAS_CHILDREN_KEY:
+                raise KeyError(key)
+            return [CompactNode(tree, j) for j in tree.child_indices(i)]
+
+        extra = tree.extra.get(i)
+        if extra is None:
+            raise KeyError(key)
+        return extra[key]
+
+    def __setitem__(self, key, value):
+        tree = self.tree
+        i = self.index
+        if key == "name":
+            tree.name_id[i] = tree.intern_name(value)
+        elif key == "count":
+            tree.count[i] = float(value)
+            if isinstance(value, int):
+                tree.flags[i] |= COUNT_IS_INT
+            else:
+                tree.flags[i] &= ~COUNT_IS_INT
+        elif key == "rank":
+            tree.rank_id[i] = tree.intern_rank(value)
+        elif key == "children":
+            raise TypeError("cannot change children of a CompactTree node")
+        else:
+            tree.extra.setdefault(i, {})[key] = value
+
+    def __iter__(self):
+        yield "name"
+        yield "count"
+        yield "rank"
+        extra = self.tree.extra.get(self.index)
+        if extra:
+            yield from extra
+        if "children" in self:
+            yield "children"
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in ("name", "count", "rank"):
+            return True
+        i = self.index
+        if key == "children":
+            tree = self.tree
+            return tree.first_child[i] != -1 or bool(tree.flags[i] & HAS_CHILDREN_KEY)
+        extra = self.tree.extra.get(i)
+        return extra is not None and key in extra
+
+    def __repr__(self):
+        return f"<CompactNode {self.index}: {self.tree.node_dict(self.index)!r}>"
@@ -0,0 +1,99 @@
+"""
+Opening possibly-compressed input and output files.
+
+Inputs compressed with gzip, bzip2 or xz are detected by their first
+few bytes and decompressed as they are read; outputs are compressed if
+their filename ends in '.gz', '.bz2' or '.xz'. An input filename of
+'-' reads from stdin.
+"""
+
+import sys
+import io
+import os.path
+
+# (leading bytes, compression) for compressed files.
+_magic = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+]
+
+# filename suffix => compression, for outputs.
+compression_suffixes = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+
+
+def detect_compression(filename):
+    "Return 'gzip', 'bz2', 'xz' or None, from the first bytes of a file."
+    with open(filename, "rb") as fp:
+        head = fp.read(6)
+
+    return _compression_for(head)
+
+
+def _compression_for(head):
+    for magic, compression in _magic:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_compression_suffix(filename):
+    "Remove a '.gz', '.bz2' or '.xz' suffix, if present."
+    base, ext = os.path.splitext(filename)
+    if ext in compression_suffixes:
+        return base
+    return filename
+
+
+def _open(filename, mode, compression, **kwargs):
+    "Open a filename, or wrap a binary file object, with this compression."
+    # the compression modules are imported only when needed.
+    if compression is None:
+        if not isinstance(filename, str):
+            if "b" in mode:
+                return filename
+            return io.TextIOWrapper(filename, **kwargs)
+        return open(filename, mode, **kwargs)
+    elif compression == "gzip":
+        import gzip
+
+        if "w" in mode:
+            # level 6 is much faster than the default 9, for little cost.
+            kwargs.setdefault("compresslevel", 6)
+        return gzip.open(filename, mode, **kwargs)
+    elif compression == "bz2":
+        import bz2
+
+        return bz2.open(filename, mode, **kwargs)
+    elif compression == "xz":
+        import lzma
+
+        return lzma.open(filename, mode, **kwargs)
+
+    raise Exception(f"unknown compression: '{compression}'")
+
+
+def open_input(filename, mode="rt", **kwargs):
+    """Open a file for reading, decompressing it on the fly if needed.
+
+    Takes the same mode and keyword arguments (e.g. 'newline') as 'open'.
+    """
+    if filename == "-":
+        # a new file object for stdin, so that closing it leaves stdin open.
+        stdin = open(sys.stdin.fileno(), "rb", closefd=False)
+        # peek doesn't consume anything, but may see fewer than 6 bytes if
+        # the other end of a pipe is slow to start writing.
+        compression = _compression_for(stdin.peek(6)[:6])
+        return _open(stdin, mode, compression, **kwargs)
+
+    return _open(filename, mode, detect_compression(filename), **kwargs)
+
+
+def open_output(filename, mode="wt", **kwargs):
+    "Open a file for writing, compressing it if the suffix asks for it."
+    ext = os.path.splitext(filename)[1]
+    return _open(filename, mode, compression_suffixes.get(ext), **kwargs)
@@ -0,0 +1,134 @@
+"""
+Immutable trees, with structural sharing.
+
+'freeze' converts a tree of node dictionaries into a list of
+'FrozenNode's: read-only nodes that behave like node dictionaries, and
+whose 'children' are tuples of FrozenNodes. Because frozen nodes can't
+be changed, derived trees can share any unchanged subtrees with the
+tree they came from; only the nodes on the path to a change are copied.
+
+'FrozenNode.evolve' and 'replace' make changed copies, and
+'tree_utils.copy_tree' and 'tree_utils.augment_tree' reuse unchanged
+frozen subtrees by reference. 'thaw' converts back to dictionaries.
+"""
+
+from collections.abc import Mapping
+
+
+class FrozenNode(Mapping):
+    "An immutable node; 'children' is a tuple of FrozenNodes."
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        # 'data' is owned by the node from now on; use 'freeze_node' to
+        # convert an arbitrary node dictionary.
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    # the Mapping versions of these work, but are much slower.
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return self._data.items()
+
+    def values(self):
+        return self._data.values()
+
+    def __repr__(self):
+        return f"<FrozenNode {self._data!r}>"
+
+    def evolve(self, **changes):
+        """Return a copy of this node with some keys changed.
+
+        Anything not changed, including the children, is shared.
+        """
+        data = dict(self._data)
+        for key, value in changes.items():
+            data[key] = _freeze_value(key, value)
+        return FrozenNode(data)
+
+
+def _freeze_value(key, value):
+    if key == "children":
+        return tuple([freeze_node(c) for c in value])
+    if isinstance(value, list):  # e.g. per-dataset 'counts'
+        return tuple(value)
+    return value
+
+
+def freeze_node(node):
+    "Return a FrozenNode version of node (and everything beneath it)."
+    if isinstance(node, FrozenNode):
+        return node
+    return FrozenNode({key: _freeze_value(key, value) for key, value in node.items()})
+
+
+def freeze(top_nodes):
+    """Return an immutable version of a tree, as a list of FrozenNodes.
+
+    Nodes that are already frozen are reused, not copied.
+    """
+    return [freeze_node(node) for node in top_nodes]
+
+
+def is_frozen(top_nodes):
+    "Return True if this is a tree of FrozenNodes."
+    return bool(top_nodes) and isinstance(top_nodes[0], FrozenNode)
+
+
+def thaw(top_nodes):
+    "Return a copy of a (frozen) tree as ordinary node dictionaries."
+    new_top_nodes = []
+    for node in top_nodes:
+        new_node = {}
+        for key, value in node.items():
+            if key == "children":
+                value = thaw(value)
+            elif isinstance(value, tuple):
+                value = list(value)
+            new_node[key] = value
+        new_top_nodes.append(new_node)
+    return new_top_nodes
+
+
+def replace(top_nodes, lineage, **changes):
+    """Return a new tree with changes to the node at 'lineage'.
+
+    'lineage' is the list of node names from a top node down to the node
+    to change. Only the nodes along that path are copied; the rest of the
+    new tree is shared with the original, which is not changed.
+    """
+    assert lineage, "lineage must name at least one node"
+
+    def rebuild(siblings, names):
+        name = names[0]
+        for i, node in enumerate(siblings):
+            if node["name"] == name:
+                if len(names) == 1:
+                    new_node = freeze_node(node).evolve(**changes)
+                else:
+                    children = rebuild(node.get("children", ()), names[1:])
+                    new_node = freeze_node(node).evolve(children=children)
+                new_siblings = list(siblings)
+                new_siblings[i] = new_node
+                return new_siblings
+
+        raise Exception(f"no node named '{name}' in lineage {lineage}")
+
+    return freeze(rebuild(top_nodes, lineage))
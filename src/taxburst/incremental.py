@@ -0,0 +1,266 @@
+"""
+Incremental re-rendering, for reports that are regenerated often while
+their tree changes only a little, e.g. by a live sequencing monitor.
+
+A sidecar state file next to the output ('<output>.state') keeps the
+previous render: the document around the node XML, the node XML itself,
+and, for every node, a signature of what its XML depends on and where
+its subtree is in the node XML. On the next render, the new tree is
+diffed against the signatures. Unchanged subtrees that still have the
+same node ids and indentation are copied from the previous node XML;
+only the changed nodes are formatted again. If the name, attributes and
+viewer options are also unchanged, the rest of the document is reused
+as-is, so the templates aren't rendered at all.
+
+The output is the same as from 'output.write_html'. Only single-dataset
+reports with XML node data are supported. State files are pickles, so
+only use them from places that you trust.
+"""
+
+import io
+import os
+import os.path
+import hashlib
+import pickle
+import tempfile
+
+from . import output
+from .tree_utils import flatten_tree
+
+state_suffix = ".state"
+
+# bump this if the state contents change.
+_state_version = 1
+
+# placeholders, filled in when the document is put together.
+_nodes_marker = "taxburst-nodes-placeholder"
+_count_marker = "taxburst-count-sum-placeholder"
+
+
+def state_filename(output_html):
+    "Return the name of the sidecar state file for an output file."
+    return output_html + state_suffix
+
+
+def load_state(filename):
+    "Return the saved render state, or None if there is none (or it's bad)."
+    try:
+        with open(filename, "rb") as fp:
+            state = pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        print(f"WARNING: ignoring bad state file '{filename}': {exc}")
+        return None
+
+    if state.get("version") != _state_version:
+        return None
+    return state
+
+
+def save_state(filename, state):
+    "Save the render state atomically, so a partial file is never seen."
+    dirname = os.path.dirname(filename) or "."
+    # not compressed: most of the state is the viewer code, which is large
+    # and slow to compress, and loading and saving it must be fast.
+    data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _templates_digest():
+    "Return a digest of the templates, so that upgrades invalidate the state."
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(output._template_dir)):
+        with open(os.path.join(output._template_dir, name), "rb") as fp:
+            h.update(fp.read())
+    return h.hexdigest()
+
+
+def _document_parts(name, extra_attributes, viewer, asset_url):
+    "Render the document around the node XML: (prefix, suffix)."
+    fp = io.StringIO()
+    output._write_document(
+        fp,
+        [_nodes_marker],
+        name=name,
+        datasets=["sunburst dataset"],
+        count_sums=[_count_marker],
+        extra_attributes=extra_attributes,
+        viewer=viewer,
+        asset_url=asset_url,
+    )
+    prefix, suffix = fp.getvalue().split(_nodes_marker)
+    assert prefix.count(_count_marker) == 1
+    return prefix, suffix
+
+
+def _signature(d, x):
+    "Everything that a node's own XML depends on, apart from id and indent."
+    return (
+        d["rank"],
+        float(d["count"]),
+        tuple([d.get(attr) for attr in x]),
+        tuple([c["name"] for c in d.get("children", ())]),
+    )
+
+
+def render_node_xml(top_nodes, x, old_nodes, old_xml):
+    """Return (node XML, node entries, number of nodes formatted).
+
+    Like "".join(output.iter_node_xml(top_nodes, x)), but copies unchanged
+    subtrees from old_xml, using the entries from a previous call. Entries
+    are name => (signature, node id, level, start, end), where old_xml
+    [start:end] is the XML for the node's subtree.
+    """
+    flat = flatten_tree(top_nodes)
+    nodes, parents, depths = flat.nodes, flat.parents, flat.depths
+    n = len(nodes)
+
+    # a node is dirty if its own XML changed, or it has a dirty descendant.
+    sigs = [_signature(d, x) for d in nodes]
+    dirty = bytearray(n)
+    for i, d in enumerate(nodes):
+        old = old_nodes.get(d["name"])
+        if old is None or old[0] != sigs[i] or old[1] != i + 1 or old[2] != depths[i]:
+            dirty[i] = 1
+
+    # ends[i] is the index just past node i's subtree.
+    ends = list(range(1, n + 1))
+    for i in range(n - 1, -1, -1):
+        p = parents[i]
+        if p != -1:
+            if dirty[i]:
+                dirty[p] = 1
+            if ends[i] > ends[p]:
+                ends[p] = ends[i]
+
+    out = []
+    pos = 0
+    new_nodes = {}
+    n_formatted = 0
+    closers = []  # (end index, closing text, node index, start)
+
+    def close_until(i):
+        nonlocal pos
+        while closers and closers[-1][0] <= i:
+            _, closing, j, start = closers.pop()
+            out.append(closing)
+            pos += len(closing)
+            new_nodes[nodes[j]["name"]] = (sigs[j], j + 1, depths[j], start, pos)
+
+    i = 0
+    while i < n:
+        close_until(i)
+        if i:
+            out.append("\n")
+            pos += 1
+
+        d = nodes[i]
+        if not dirty[i]:
+            # copy the whole subtree, and move its entries along.
+            _, _, _, start, end = old_nodes[d["name"]]
+            out.append(old_xml[start:end])
+            shift = pos - start
+            for j in range(i, ends[i]):
+                name = nodes[j]["name"]
+                entry = old_nodes[name]
+                if shift:
+                    sig, node_id, level, s, e = entry
+                    entry = (sig, node_id, level, s + shift, e + shift)
+                new_nodes[name] = entry
+            pos += end - start
+            i = ends[i]
+            continue
+
+        opening, closing = output.node_xml_parts(
+            d, x, node_id=i + 1, level=depths[i]
+        )
+        n_formatted += 1
+        closers.append((ends[i], closing, i, pos))
+        out.append(opening)
+        pos += len(opening)
+        i += 1
+
+    close_until(n)
+    return "".join(out), new_nodes, n_formatted
+
+
+def write_html(
+    top_nodes,
+    fp,
+    *,
+    state_file,
+    name=None,
+    extra_attributes=None,
+    viewer="inline",
+    asset_url="",
+    data_format="xml",
+    timer=None,
+):
+    """Like 'output.write_html', reusing what it can from the last render.
+
+    The state is read from and saved to 'state_file'. Returns a dictionary
+    with the number of 'nodes', and how many were 'formatted' again.
+    """
+    assert data_format == "xml", "incremental rendering needs XML node data"
+    if extra_attributes is None:
+        extra_attributes = {}
+    else:
+        extra_attributes = dict(extra_attributes)
+    x = list(extra_attributes)
+
+    # the document around the nodes depends on all the options, but the
+    # node XML only depends on which attributes are included.
+    document_key = (
+        _templates_digest(),
+        name,
+        list(extra_attributes.items()),
+        viewer,
+        asset_url,
+    )
+    nodes_key = x
+
+    state = load_state(state_file)
+    if state is not None and state["document_key"] == document_key:
+        prefix, suffix = state["prefix"], state["suffix"]
+    else:
+        prefix, suffix = _document_parts(name, extra_attributes, viewer, asset_url)
+
+    if state is not None and state["nodes_key"] == nodes_key:
+        old_nodes, old_xml = state["nodes"], state["xml"]
+    else:
+        old_nodes, old_xml = {}, ""
+
+    if timer is not None:
+        with timer.phase("node_data") as stats:
+            xml, nodes, n_formatted = render_node_xml(top_nodes, x, old_nodes, old_xml)
+            stats.update(nodes=len(nodes), formatted=n_formatted)
+    else:
+        xml, nodes, n_formatted = render_node_xml(top_nodes, x, old_nodes, old_xml)
+
+    count_sum = round(sum([float(n["count"]) for n in top_nodes]), 4)
+    fp.write(prefix.replace(_count_marker, str(count_sum)))
+    fp.write(xml)
+    fp.write(suffix)
+
+    save_state(
+        state_file,
+        dict(
+            version=_state_version,
+            document_key=document_key,
+            nodes_key=nodes_key,
+            prefix=prefix,
+            suffix=suffix,
+            xml=xml,
+            nodes=nodes,
+        ),
+    )
+    return dict(nodes=len(nodes), formatted=n_formatted)
@@ -0,0 +1,209 @@
+"""
+Reading and writing trees in JSON.
+
+Two formats are supported:
+
+* the nested format, a list of node dictionaries with 'children' lists,
+  as consumed by '-F json' and produced by '--save-json'. Cohort trees
+  from 'taxburst merge' wrap this as {"samples": [...], "nodes": [...]};
+* a flat, line-delimited format ('jsonl'), with one node per line in
+  pre-order. Each line is a node dictionary without 'children', plus
+  an 'id' and the 'parent' id (null for top nodes). This can be read
+  and written one node at a time.
+
+orjson is used if it is installed, and the standard library otherwise.
+"""
+
+import gc
+import json
+import contextlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# keys added to each node in the flat format.
+_flat_keys = ("id", "parent")
+
+
+if orjson is not None:
+    backend = "orjson"
+    _item_sep = ","
+    _key_sep = ":"
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+    backend = "json"
+    _item_sep = ", "
+    _key_sep = ": "
+
+    loads = json.loads
+
+    def dumps(obj):
+        return json.dumps(obj)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector.
+
+    Building hundreds of thousands of node dictionaries otherwise triggers
+    repeated collections over the whole (growing) tree, which take most of
+    the loading time; node trees contain no reference cycles.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def load_tree(fp):
+    """Load a nested JSON tree from an open file (text or binary).
+
+    Cohort trees are accepted too; only their nodes are returned.
+    """
+    data = fp.read()
+    with _gc_paused():
+        tree = loads(data)
+    if isinstance(tree, dict):
+        if "nodes" not in tree:
+            raise Exception("JSON tree must be a list of nodes, or have a 'nodes' list")
+        tree = tree["nodes"]
+    return tree
+
+
+def iter_tree_json(top_nodes, *, chunk_size=65536):
+    """Yield a nested JSON tree in chunks of about chunk_size characters.
+
+    Walks the tree with an explicit stack, encoding one node at a time, so
+    the full JSON string is never held in memory. Each node's 'children'
+    are written after its other keys.
+    """
+    buf = []
+    size = 0
+
+    # stack of (children iterator, is-first-child) for each open list.
+    buf.append("[")
+    stack = [[iter(top_nodes), True]]
+    while stack:
+        frame = stack[-1]
+        node = next(frame[0], None)
+        if node is None:
+            stack.pop()
+            buf.append("]}" if stack else "]")
+            continue
+
+        if frame[1]:
+            frame[1] = False
+        else:
+            buf.append(_item_sep)
+
+        d = {k: v for k, v in node.items() if k != "children"}
+        encoded = dumps(d)
+        children = node.get("children")
+        if children is None:
+            buf.append(encoded)
+        else:
+            # re-open the node's dictionary, and add its children.
+            if d:
+                buf.append(encoded[:-1] + _item_sep)
+            else:
+                buf.append("{")
+            buf.append('"children"' + _key_sep + "[")
+            stack.append([iter(children), True])
+
+        size += len(encoded)
+        if size >= chunk_size:
+            yield "".join(buf)
+            buf = []
+            size = 0
+
+    yield "".join(buf)
+
+
+def dump_tree(top_nodes, fp):
+    "Write a nested JSON tree to an open text file, piece by piece."
+    for chunk in iter_tree_json(top_nodes):
+        fp.write(chunk)
+
+
+def dump_cohort(samples, top_nodes, fp):
+    "Write a cohort tree, with its list of sample names, piece by piece."
+    fp.write('{"samples"' + _key_sep + dumps(list(samples)) + _item_sep)
+    fp.write('"nodes"' + _key_sep)
+    dump_tree(top_nodes, fp)
+    fp.write("}")
+
+
+def iter_flat_nodes(top_nodes):
+    "Yield a flat node dictionary, with 'id' and 'parent', for every node."
+    node_id = 0
+    stack = [(node, None) for node in reversed(top_nodes)]
+    while stack:
+        node, parent = stack.pop()
+        flat = {"id": node_id, "parent": parent}
+        for k, v in node.items():
+            if k != "children":
+                assert k not in _flat_keys, f"node '{node['name']}' has a '{k}' key"
+                flat[k] = v
+        yield flat
+
+        children = node.get("children")
+        if children:
+            for child in reversed(children):
+                stack.append((child, node_id))
+        node_id += 1
+
+
+def dump_jsonl(top_nodes, fp):
+    "Write a tree to an open text file in the flat format, one node per line."
+    for flat in iter_flat_nodes(top_nodes):
+        fp.write(dumps(flat))
+        fp.write("\n")
+
+
+def iter_jsonl(fp):
+    "Yield (id, parent id, node dictionary) for each line in a flat file."
+    for lineno, line in enumerate(fp, start=1):
+        if not line.strip():
+            continue
+        node = loads(line)
+        try:
+            node_id = node.pop("id")
+            parent = node.pop("parent")
+        except KeyError:
+            raise Exception(f"line {lineno}: node is missing 'id' or 'parent'")
+        yield node_id, parent, node
+
+
+def load_jsonl(fp):
+    "Load a nested tree from a flat file; parents must come before children."
+    top_nodes = []
+    nodes_by_id = {}
+    with _gc_paused():
+        for node_id, parent, node in iter_jsonl(fp):
+            if node_id in nodes_by_id:
+                raise Exception(f"duplicate node id: {node_id}")
+            nodes_by_id[node_id] = node
+
+            if parent is None:
+                top_nodes.append(node)
+                continue
+
+            parent_node = nodes_by_id.get(parent)
+            if parent_node is None:
+                raise Exception(
+                    f"node {node_id} comes before its parent {parent}; nodes must be in pre-order"
+                )
+            parent_node.setdefault("children", []).append(node)
+
+    return top_nodes
@@ -0,0 +1,61 @@
+"""
+Merge many samples into one aligned cohort tree, saved as JSON.
+
+Usage: taxburst merge -F <format> <input> [<input> ...] -o <cohort.json>
+"""
+
+import argparse
+
+from . import checks
+from . import parsers
+from . import fileio
+from . import jsonio
+from .tree_utils import merge_trees
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="taxburst merge")
+    p.add_argument("inputs", nargs="+", help="input files, one per sample")
+    p.add_argument(
+        "-F",
+        "--input-format",
+        default="csv_summary",
+        choices=parsers.input_formats,
+    )
+    p.add_argument(
+        "-o", "--output-json", required=True, help="output the cohort tree here"
+    )
+    p.add_argument(
+        "--names",
+        nargs="+",
+        help="sample names, in input order; default is based on the filenames",
+    )
+    args = p.parse_args(argv)
+
+    if args.names and len(args.names) != len(args.inputs):
+        print(f"--names must give one name per input. Error exit.")
+        return -1
+
+    trees = []
+    names = []
+    attributes = set()
+    for filename in args.inputs:
+        top_nodes, name, xtra = parsers.parse_file(filename, args.input_format)
+        checks.check_structure(top_nodes)
+        trees.append(top_nodes)
+        names.append(name)
+        if xtra:
+            attributes.update(xtra)
+
+    if args.names:
+        names = args.names
+
+    print(f"merging {len(trees)} samples")
+    merged = merge_trees(trees, attributes=sorted(attributes))
+    checks.check_structure(merged)
+
+    with fileio.open_output(args.output_json) as fp:
+        jsonio.dump_cohort(names, merged, fp)
+
+    print(f"wrote cohort tree to '{args.output_json}'")
+    return 0
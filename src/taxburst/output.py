@@ -1,11 +1,59 @@
+import io
+import os
 import os.path
-from jinja2 import Environment, PackageLoader, select_autoescape, StrictUndefined
+import re
+import base64
+import hashlib
+import functools
+import contextlib
+import gzip
+import json
+
+_template_dir = os.path.join(os.path.dirname(__file__), "templates")
+
+
+@functools.cache
+def get_env():
+    "Create the Jinja2 environment on first use; importing jinja2 is slow."
+    from jinja2 import Environment, PackageLoader, select_autoescape, StrictUndefined
+
+    return Environment(
+        loader=PackageLoader("taxburst"),
+        autoescape=select_autoescape(),
+        undefined=StrictUndefined,
+    )
+
+
+def __getattr__(name):
+    # 'env' used to be created at import time; keep it available.
+    if name == "env":
+        return get_env()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.cache
+def _static_template(name):
+    """Return the contents of a template without any Jinja2 markup.
+
+    The viewer header is large, and always the same; writing it out
+    directly avoids having Jinja2 parse and compile it in every process.
+    """
+    with open(os.path.join(_template_dir, name), "rt", encoding="utf-8") as fp:
+        source = fp.read()
+
+    # Jinja2 drops a single trailing newline ('keep_trailing_newline').
+    if source.endswith("\n"):
+        source = source[:-1]
+    return source
+
+
+def load_templates():
+    "Load and compile all templates ahead of time, e.g. in worker processes."
+    _static_template("krona-header.html")
+    _static_template("krona-footer.html")
+    for name in ("krona-data.html", "krona-external-header.html"):
+        get_env().get_template(name)
 
-env = Environment(
-    loader=PackageLoader("taxburst"),
-    autoescape=select_autoescape(),
-    undefined=StrictUndefined,
-)
 
 # this one was standard in Krona but is no longer default in taxburst.
 #    'score': 'display="Avg. confidence"',
@@ -18,72 +66,507 @@ basic_node_attributes = {
 }
 
 
-def generate_html(top_nodes, *, name=None, extra_attributes=None):
-    template = env.get_template("krona.html")
+# ways to include the viewer code in the output:
+# * inline: a self-contained HTML page, with the viewer code included.
+# * external: a slim HTML page that loads the viewer code from separate,
+#   shared asset files; see 'write_viewer_assets'.
+# * data: just the <krona> XML containing the node data.
+viewer_modes = ["inline", "external", "data"]
+
+# ways to encode the node data in the page:
+# * xml: <node> elements, as read by the Krona viewer.
+# * json: compact columnar JSON, turned into <node> elements on page load.
+# * json-gz: the same JSON, gzipped and base64-encoded.
+data_formats = ["xml", "json", "json-gz"]
+
 
+def generate_html(top_nodes, *, name=None, extra_attributes=None, **viewer_args):
+    "Build the full HTML document for a tree, and return it as a string."
+    fp = io.StringIO()
+    write_html(
+        top_nodes, fp, name=name, extra_attributes=extra_attributes, **viewer_args
+    )
+    return fp.getvalue()
+
+
+def write_html(
+    top_nodes,
+    fp,
+    *,
+    name=None,
+    extra_attributes=None,
+    viewer="inline",
+    asset_url="",
+    data_format="xml",
+    timer=None,
+):
+    """Write the HTML document for a tree to an open file, piece by piece.
+
+    Node XML is produced lazily while the template is rendered, so memory
+    use depends on the depth of the tree rather than the size of the output.
+
+    'viewer' is one of 'viewer_modes'; for 'external', 'asset_url' is
+    prepended to the asset filenames, and should end in '/'. 'data_format'
+    is one of 'data_formats'. If 'timer' is a 'timings.PhaseTimings', the
+    time spent encoding the node data is recorded as a 'node_data' phase.
+    """
     if extra_attributes is None:
         extra_attributes = {}
     else:
         extra_attributes = dict(extra_attributes)
 
+    fill, node_data = _encode_nodes(
+        top_nodes, list(extra_attributes), data_format, timer=timer
+    )
+
+    count_sum = round(sum([float(n["count"]) for n in top_nodes]), 4)
+
+    _write_document(
+        fp,
+        fill,
+        name=name,
+        datasets=["sunburst dataset"],
+        count_sums=[count_sum],
+        extra_attributes=extra_attributes,
+        viewer=viewer,
+        asset_url=asset_url,
+        node_data=node_data,
+        data_format=data_format,
+    )
+
+
+def generate_multi_html(
+    trees, *, dataset_names, name=None, extra_attributes=None, **viewer_args
+):
+    "Build one HTML document with a dataset selector for several trees."
+    fp = io.StringIO()
+    write_multi_html(
+        trees,
+        fp,
+        dataset_names=dataset_names,
+        name=name,
+        extra_attributes=extra_attributes,
+        **viewer_args,
+    )
+    return fp.getvalue()
+
+
+def write_multi_html(
+    trees,
+    fp,
+    *,
+    dataset_names,
+    name=None,
+    extra_attributes=None,
+    viewer="inline",
+    asset_url="",
+    data_format="xml",
+    timer=None,
+):
+    """Write one HTML document for several trees, one per dataset.
+
+    The trees are aligned with 'merge_trees', and each node gets one
+    value per dataset, so the viewer can switch between datasets.
+    """
+    from .tree_utils import merge_trees
+
+    assert len(trees) == len(dataset_names)
+
+    if extra_attributes is None:
+        extra_attributes = {}
+    else:
+        extra_attributes = dict(extra_attributes)
+
+    merged = merge_trees(trees, attributes=list(extra_attributes))
+    fill, node_data = _encode_nodes(
+        merged,
+        list(extra_attributes),
+        data_format,
+        n_datasets=len(trees),
+        timer=timer,
+    )
+
+    count_sums = [
+        round(sum([float(n["counts"][i]) for n in merged]), 4)
+        for i in range(len(trees))
+    ]
+
+    _write_document(
+        fp,
+        fill,
+        name=name,
+        datasets=dataset_names,
+        count_sums=count_sums,
+        extra_attributes=extra_attributes,
+        viewer=viewer,
+        asset_url=asset_url,
+        node_data=node_data,
+        data_format=data_format,
+    )
+
+
+def _encode_nodes(top_nodes, x, data_format, *, n_datasets=1, timer=None):
+    """Return (node XML chunks, JSON node data) for this data format.
+
+    Exactly one of the two is used; the other is empty/None.
+    """
+    assert data_format in data_formats, f"unknown data format: '{data_format}'"
+    if data_format == "xml":
+        fill = iter_node_xml(top_nodes, x, n_datasets=n_datasets)
+        if timer is not None:
+            # node XML is produced lazily, while the template is rendered.
+            fill = timer.timed_iter("node_data", fill)
+        return fill, None
+
+    phase = contextlib.nullcontext()
+    if timer is not None:
+        phase = timer.phase("node_data")
+
+    with phase:
+        node_data = node_data_json(top_nodes, x, n_datasets=n_datasets)
+        if data_format == "json-gz":
+            compressed = gzip.compress(node_data.encode("ascii"), mtime=0)
+            node_data = base64.b64encode(compressed).decode("ascii")
+
+    return [], node_data
+
+
+def _format_count(count):
+    """Format a count for the <count> XML element.
+
+    Counts are written with one decimal place, but counts below 1 (e.g.
+    from '--normalize') keep four significant digits, so that they don't
+    all come out as '0.0'.
+    """
+    count = float(count)
+    if count and abs(count) < 1:
+        return f"{count:.4g}"
+    return f"{count:.01f}"
+
+
+def _short_number(value):
+    """Round a count to one decimal place, dropping the '.0' where possible.
+
+    As in '_format_count', counts below 1 keep four significant digits.
+    """
+    value = float(value)
+    if value and abs(value) < 1:
+        return float(f"{value:.4g}")
+    value = round(value, 1)
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+def node_data_json(top_nodes, x, *, n_datasets=1):
+    """Encode a tree as compact, columnar JSON. x is list of attributes.
+
+    Nodes are listed in pre-order, with the index of their parent (-1 for
+    top nodes), an index into 'rank_names', and 'datasets' counts and
+    attribute values per node. Safe to embed in a <script> element.
+    """
+    names = []
+    parents = []
+    ranks = []
+    rank_names = []
+    rank_ids = {}
+    counts = []
+    extra = {attr: [] for attr in x}
+
+    stack = [(node, -1) for node in reversed(top_nodes)]
+    while stack:
+        d, parent = stack.pop()
+        i = len(names)
+
+        names.append(d["name"])
+        parents.append(parent)
+
+        rank = d["rank"]
+        rank_id = rank_ids.get(rank)
+        if rank_id is None:
+            rank_id = rank_ids[rank] = len(rank_names)
+            rank_names.append(rank)
+        ranks.append(rank_id)
+
+        if n_datasets == 1:
+            counts.append(_short_number(d["count"]))
+        else:
+            counts.extend([_short_number(c) for c in d["counts"]])
+
+        for attr in x:
+            val = d.get(attr)
+            if n_datasets == 1:
+                val = [val]
+            elif val is None:
+                val = [None] * n_datasets
+            extra[attr].extend([None if v is None else str(v) for v in val])
+
+        children = d.get("children")
+        if children:
+            for child in reversed(children):
+                stack.append((child, i))
+
+    data = dict(
+        datasets=n_datasets,
+        names=names,
+        parents=parents,
+        rank_names=rank_names,
+        ranks=ranks,
+        counts=counts,
+        extra=extra,
+    )
+    data = json.dumps(data, separators=(",", ":"))
+
+    # make it safe to put inside a <script> element.
+    data = data.replace("<", "\\u003c").replace(">", "\\u003e")
+    return data.replace("&", "\\u0026")
+
+
+def _write_document(
+    fp,
+    fill,
+    *,
+    name,
+    datasets,
+    count_sums,
+    extra_attributes,
+    viewer,
+    asset_url,
+    node_data=None,
+    data_format="xml",
+):
+    """Write the viewer header, node data, and footer to fp.
+
+    The node data is rendered with the 'krona-data.html' template, around
+    an iterable of node XML chunks.
+    """
+    assert viewer in viewer_modes, f"unknown viewer mode: '{viewer}'"
+
     node_attributes = dict(basic_node_attributes)
     node_attributes.update(extra_attributes)
 
-    fill = [make_node_xml(n, list(extra_attributes)) for n in top_nodes]
-    fill = "\n".join(fill)
-
     # build top node
     if name is None:
         name = "all"
 
-    count_sum = round(sum([float(n["count"]) for n in top_nodes]), 4)
+    env = get_env()
+    if viewer == "inline":
+        fp.write(_static_template("krona-header.html"))
+        fp.write("\n\n")
+    elif viewer == "external":
+        header = env.get_template("krona-external-header.html")
+        fp.write(header.render(assets=viewer_asset_names(), asset_url=asset_url))
+        fp.write("\n\n")
 
-    return template.render(
-        nodes=fill, name=name, count_sum=count_sum, node_attributes=node_attributes
+    template = env.get_template("krona-data.html")
+    chunks = template.generate(
+        nodes=fill,
+        name=name,
+        datasets=datasets,
+        count_sums=count_sums,
+        node_attributes=node_attributes,
+        node_data=node_data,
+        node_data_encoding="gzip+base64" if data_format == "json-gz" else "json",
     )
+    for chunk in chunks:
+        fp.write(chunk)
 
+    if viewer == "data":
+        fp.write("\n")
+    else:
+        fp.write("\n\n")
+        fp.write(_static_template("krona-footer.html"))
 
-# track total node count, for distinguishing purposes
-node_count = 1
 
+@functools.cache
+def _viewer_assets():
+    """Split the self-contained viewer header into separate assets.
+
+    Returns a dictionary of key => (filename, content bytes), where the
+    filenames contain a hash of the content, so they can be cached forever.
+    """
+    header = _static_template("krona-header.html")
+
+    contents = {}
+    m = re.search(
+        r'<script language="javascript" type="text/javascript">\n(.*)\n\s*</script>\s*</head>',
+        header,
+        re.DOTALL,
+    )
+    contents["js"] = ("js", m.group(1).encode("utf-8"))
+
+    m = re.search(r'<link rel="shortcut icon" href="data:image/x-icon;base64,([^"]+)"', header)
+    contents["favicon"] = ("ico", base64.b64decode(m.group(1)))
+
+    for m in re.finditer(r'<img id="(\w+)" src="data:image/(\w+);base64,([^"]+)"', header):
+        key, ext, data = m.groups()
+        contents[key] = (ext, base64.b64decode(data))
+
+    assets = {}
+    for key, (ext, content) in contents.items():
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        if key == "js":
+            filename = f"taxburst-viewer.{digest}.js"
+        else:
+            filename = f"taxburst-{key}.{digest}.{ext}"
+        assets[key] = (filename, content)
+
+    return assets
+
+
+def viewer_asset_names():
+    "Return a dictionary of key => filename for the external viewer assets."
+    return {key: filename for key, (filename, _) in _viewer_assets().items()}
+
+
+def write_viewer_assets(asset_dir):
+    """Write the external viewer assets into asset_dir, if not already there.
+
+    Returns a list of the asset filenames.
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    filenames = []
+    for filename, content in _viewer_assets().values():
+        path = os.path.join(asset_dir, filename)
+        if not os.path.exists(path):
+            # write to a temp file first, in case of concurrent writers.
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fp:
+                fp.write(content)
+            os.replace(tmp_path, path)
+        filenames.append(filename)
+
+    return filenames
 
-def make_node_xml(d, x, *, indent=0):
-    "Turn a given node dict into a <node>. x is list of attributes to add."
-    global node_count
 
-    # any children?
-    children = d.get("children", [])
-    child_nodes = []
-    if children:
-        for dd in children:
-            xml = make_node_xml(dd, x, indent=indent + 1)
-            child_nodes.append(xml)
+def asset_url_for(asset_dir, output_html):
+    "Return the URL prefix for asset_dir, relative to the output HTML file."
+    output_dir = os.path.dirname(os.path.abspath(output_html))
+    relpath = os.path.relpath(os.path.abspath(asset_dir), output_dir)
+    if relpath == ".":
+        return ""
+    return relpath.replace(os.sep, "/") + "/"
 
+
+def prepare_viewer(
+    viewer, output_html, *, asset_dir=None, asset_url=None, data_format="xml"
+):
+    """Return keyword arguments for 'write_html' for this viewer mode.
+
+    For 'external', writes the viewer assets into asset_dir (by default,
+    next to output_html) and, unless asset_url is given, points the page
+    at them with a relative URL.
+    """
+    if viewer != "external":
+        return dict(viewer=viewer, data_format=data_format)
+
+    if asset_dir is None:
+        asset_dir = os.path.dirname(output_html) or "."
+    write_viewer_assets(asset_dir)
+
+    if asset_url is None:
+        asset_url = asset_url_for(asset_dir, output_html)
+    elif asset_url and not asset_url.endswith("/"):
+        asset_url += "/"
+
+    return dict(viewer=viewer, asset_url=asset_url, data_format=data_format)
+
+
+def iter_node_xml(top_nodes, x, *, indent=0, chunk_size=65536, n_datasets=1):
+    """Yield the XML for a list of top nodes, in chunks. x is list of attributes.
+
+    Walks the tree with an explicit stack rather than recursion, so deep
+    trees are fine. Node ids are numbered from 1 on every call, so output
+    is deterministic and calls in different threads do not interact.
+
+    If n_datasets is more than 1, nodes must come from 'merge_trees', and
+    one value per dataset is written from 'counts' and the attribute lists.
+    """
+    buf = io.StringIO()
+    node_id = 1
+
+    # stack holds either (node, indent, add_newline) or closing text.
+    stack = []
+    for i in reversed(range(len(top_nodes))):
+        stack.append((top_nodes[i], indent, i > 0))
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            buf.write(item)
+            continue
+
+        d, level, add_newline = item
+        opening, closing = node_xml_parts(
+            d, x, node_id=node_id, level=level, n_datasets=n_datasets
+        )
+        node_id += 1
+
+        if add_newline:
+            buf.write("\n")
+        buf.write(opening)
+
+        # closing text goes out after all the children
+        stack.append(closing)
+
+        children = d.get("children", [])
+        for i in reversed(range(len(children))):
+            stack.append((children[i], level + 1, True))
+
+        if buf.tell() >= chunk_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def node_xml_parts(d, x, *, node_id, level, n_datasets=1):
+    """Return the XML for one node that goes (before, after) its children.
+
+    x is list of attributes. See 'iter_node_xml'.
+    """
     # grab & format values
     name = d["name"]
-    count = float(d["count"])
     rank = d["rank"]
-    child_out = ""
-    if child_nodes:
-        child_out = "\n" + "\n".join(child_nodes)
 
     # indent nicely, 'cause why not
-    spc = "  " * indent
+    spc = "  " * level
+
+    if n_datasets == 1:
+        members = f"<val>node{node_id}.members.0.js</val>"
+        ranks = f"<val>{rank}</val>"
+        counts = f"<val>{_format_count(d['count'])}</val>"
+    else:
+        members = "".join(
+            [f"<val>node{node_id}.members.{i}.js</val>" for i in range(n_datasets)]
+        )
+        ranks = f"<val>{rank}</val>" * n_datasets
+        counts = "".join([f"<val>{_format_count(c)}</val>" for c in d["counts"]])
+
+    opening = f"""\
+{spc}<node name="{name}">
+{spc}    <members>{members}</members>
+{spc}    <rank>{ranks}</rank>
+{spc}    <count>{counts}</count>"""
 
     # add in extra attributes, if (1) list given and (2) node has them
     extra = ""
     for attr in x:
         val = d.get(attr)
-        if val is not None:
-            extra += f"{spc}    <{attr}><val>{val}</val></{attr}>\n"
+        if n_datasets == 1:
+            if val is not None:
+                extra += f"{spc}    <{attr}><val>{val}</val></{attr}>\n"
+        elif val is not None and any(v is not None for v in val):
+            vals = "".join(
+                [f"<val>{v}</val>" if v is not None else "<val></val>" for v in val]
+            )
+            extra += f"{spc}    <{attr}>{vals}</{attr}>\n"
 
-    x = f"""\
-{spc}<node name="{name}">
-{spc}    <members><val>node{node_count}.members.0.js</val></members>
-{spc}    <rank><val>{rank}</val></rank>
-{spc}    <count><val>{count:.01f}</val></count>{child_out}
-{extra}{spc}</node>"""
-    # increment global node count
-    node_count += 1
-
-    return x
+    return opening, f"\n{extra}{spc}</node>"
+
+
+def make_node_xml(d, x, *, indent=0):
+    "Turn a given node dict into a <node>. x is list of attributes to add."
+    return "".join(iter_node_xml([d], x, indent=indent))
@@ -8,7 +8,8 @@ guidance on writing a new parser.
 import csv
 import os
 from collections import defaultdict
-import json
+
+from .fileio import open_input, strip_compression_suffix
 
 
 input_formats = [
@@ -17,42 +18,76 @@ input_formats = [
     "SingleM",
     "krona",
     "json",
+    "jsonl",
 ]
 
 
-def parse_file(filename, input_format):
-    "Parse a variety of input formats. Top level function."
+def parse_file(filename, input_format, *, stats=None):
+    """Parse a variety of input formats. Top level function.
+
+    A filename of '-' reads from stdin. If 'stats' is a dictionary, the
+    number of input rows is put in it.
+    """
     top_nodes = None
-    name = None
     xtra = None
+    pp = None
 
     assert input_format in input_formats
     if input_format == "csv_summary":
-        top_nodes = parse_csv_summary(filename)
-        name = _strip_suffix(filename, [".csv", ".csv_summary"])
+        pp = Parse_SourmashCSVSummary(filename)
+        top_nodes = pp.build()
     elif input_format == "tax_annotate":
-        top_nodes = parse_tax_annotate(filename)
-        name = _strip_suffix(filename, [".csv", ".with-lineages"])
+        pp = Parse_SourmashTaxAnnotate(filename)
+        top_nodes = pp.build()
         xtra = {"abund": 'display="Est abund"'}
     elif input_format.lower() == "singlem":
-        top_nodes = parse_SingleM(filename)
-        name = _strip_suffix(filename, [".tsv", ".profile"])
+        pp = Parse_SingleMProfile(filename, sep="\t")
+        top_nodes = pp.build()
     elif input_format.lower() == "krona":
-        top_nodes = parse_krona(filename)
-        name = _strip_suffix(filename, [".tsv", ".krona"])
+        pp = Parse_Krona(filename, sep="\t")
+        top_nodes = pp.build()
     elif input_format.lower() == "json":
-        with open(filename, "rb") as fp:
-            top_nodes = json.load(fp)
-        name = _strip_suffix(filename, [".json"])
+        from . import jsonio
+
+        with open_input(filename, "rb") as fp:
+            top_nodes = jsonio.load_tree(fp)
+    elif input_format.lower() == "jsonl":
+        from . import jsonio
+
+        with open_input(filename, "rb") as fp:
+            top_nodes = jsonio.load_jsonl(fp)
     else:
         assert 0, f"unknown input format specified: {input_format}"
 
+    name = default_name(filename, input_format)
+
+    if stats is not None and pp is not None:
+        stats["rows"] = pp.n_rows
+
     return top_nodes, name, xtra
 
 
+# suffixes removed from filenames to name datasets, by lower-case format.
+_name_suffixes = {
+    "csv_summary": [".csv", ".csv_summary"],
+    "tax_annotate": [".csv", ".with-lineages"],
+    "singlem": [".tsv", ".profile"],
+    "krona": [".tsv", ".krona"],
+    "json": [".json"],
+    "jsonl": [".jsonl"],
+}
+
+
+def default_name(filename, input_format):
+    "Return the dataset name that 'parse_file' gives to this file."
+    if filename == "-":
+        return "stdin"
+    return _strip_suffix(filename, _name_suffixes[input_format.lower()])
+
+
 def _strip_suffix(filename, endings):
-    "Remove endings if present, in order of list."
-    filename = os.path.basename(filename)
+    "Remove endings if present, in order of list, after any compression suffix."
+    filename = strip_compression_suffix(os.path.basename(filename))
 
     for ending in endings:
         if filename.endswith(ending):
@@ -94,10 +129,84 @@ def assign_children(nodes_by_tax):
     return top_nodes
 
 
+class LineageBuilder:
+    """Incrementally build a tree of node dictionaries from lineages.
+
+    Lineages are given as lists of names, from the top rank on down; the
+    rank of each node is taken from its depth. Nodes are looked up name
+    by name in a trie, so no sublineage strings are built, and top nodes
+    and children are kept in order of first appearance. Call 'build()' to
+    assign children and get the top nodes.
+    """
+
+    def __init__(self, ranks):
+        self.ranks = ranks
+        self.top_nodes = []
+        self.all_nodes = []  # list of (node, children), in creation order
+        self._lookup = {}  # name => (node, children, lookup for children)
+
+    def _make_entry(self, node, siblings, lookup):
+        children = []
+        entry = (node, children, {})
+        siblings.append(node)
+        lookup[node["name"]] = entry
+        self.all_nodes.append((node, children))
+        return entry
+
+    def path(self, names):
+        "Return the nodes along this lineage, creating any that are missing."
+        siblings = self.top_nodes
+        lookup = self._lookup
+        nodes = []
+        for depth, name in enumerate(names):
+            entry = lookup.get(name)
+            if entry is None:
+                node = dict(name=name, rank=self.ranks[depth], count=0.0)
+                entry = self._make_entry(node, siblings, lookup)
+
+            node, siblings, lookup = entry
+            nodes.append(node)
+
+        return nodes
+
+    def add(self, names, count):
+        "Add 'count' to every node along this lineage; return those nodes."
+        nodes = self.path(names)
+        for node in nodes:
+            node["count"] += count
+        return nodes
+
+    def add_node(self, names, node):
+        """Add a pre-built node for this lineage; its parent must exist.
+
+        For formats that have one row per lineage, with counts included.
+        """
+        *parent_names, name = names
+        siblings = self.top_nodes
+        lookup = self._lookup
+        for parent_name in parent_names:
+            entry = lookup.get(parent_name)
+            assert (
+                entry is not None
+            ), f"'{';'.join(names)}' is missing its parent lineage - this is not allowed!"
+            _, siblings, lookup = entry
+
+        assert name not in lookup, f"duplicate lineage: '{';'.join(names)}'"
+        self._make_entry(node, siblings, lookup)
+
+    def build(self):
+        "Assign children to all nodes, and return the top nodes."
+        for node, children in self.all_nodes:
+            node["children"] = children
+
+        return self.top_nodes
+
+
 class GenericParser:
     """Generic parser for turning CSV/TSV into internal nodes dictionaries.
 
-    For row-oriented formats, should only need to implement 'build()'.
+    For row-oriented formats, should only need to set 'columns' and
+    implement 'build()'.
     """
 
     default_ranks = [
@@ -112,55 +221,95 @@ class GenericParser:
         "genome",  # CTB: do we use this?
     ]
 
+    # columns used by 'build()'; see 'select_columns' and 'iter_rows'.
+    columns = []
+
     def __init__(self, filename, *, sep=",", ranks=None):
         self.filename = filename
         self.sep = sep
         if ranks is None:
             ranks = self.default_ranks
         self.ranks = ranks
+        self.n_rows = None  # set by 'iter_rows'
 
     def load_rows(self):
-        with open(self.filename, "r", newline="") as fp:
+        "Load all rows, as dictionaries containing every column."
+        with open_input(self.filename, "rt", newline="") as fp:
             r = csv.DictReader(fp, delimiter=self.sep)
             rows = list(r)
 
         return rows
 
+    def select_columns(self, header):
+        """Pick the columns to load, given the header row of the file.
+
+        Override this when the columns depend on the file contents.
+        """
+        return self.columns
+
+    def iter_rows(self):
+        """Lazily yield rows as tuples of the values in 'select_columns()'.
+
+        Only the selected columns are kept, so this uses much less memory
+        than 'load_rows()' for files with many columns and rows.
+        """
+        with open_input(self.filename, "rt", newline="") as fp:
+            r = csv.reader(fp, delimiter=self.sep)
+            header = next(r, None)
+            if header is None:
+                return
+
+            columns = self.select_columns(header)
+            missing = [c for c in columns if c not in header]
+            if missing:
+                raise Exception(
+                    f"missing required column(s) {missing} in '{self.filename}'"
+                )
+
+            indices = [header.index(c) for c in columns]
+            n_fields = max(indices) + 1 if indices else 0
+            n_rows = 0
+            for row in r:
+                if not row:  # skip blank lines, like csv.DictReader
+                    continue
+                if len(row) < n_fields:
+                    raise ValueError(
+                        f"'{self.filename}' line {r.line_num}: expected at least {n_fields} fields, found {len(row)}"
+                    )
+                n_rows += 1
+                yield tuple([row[i] for i in indices])
+
+            self.n_rows = n_rows
+
     def build(self):
         raise NotImplementedError
 
 
 class Parse_SourmashCSVSummary(GenericParser):
-    def build(self):
-        rows = self.load_rows()
+    columns = ["lineage", "rank", "f_weighted_at_rank", "fraction"]
 
-        # turn rows into list of (lineage, row) tuples
-        tax_rows = []
-        for row in rows:
-            lineage = row["lineage"]
+    def build(self):
+        # build nodes
+        builder = LineageBuilder(self.ranks)
+        for lin, row_rank, f_weighted, fraction in self.iter_rows():
             # eliminate all unclassified that are not top-level
-            if lineage == "unclassified" and row["rank"] != "superkingdom":
+            if lin == "unclassified" and row_rank != "superkingdom":
                 continue
 
-            tax_rows.append((lineage, row))
-
-        # build nodes
-        nodes_by_tax = {}
-        for lin, row in tax_rows:
-            name = lin.rsplit(";")[-1]
-            rank = self.ranks[lin.count(";")]
-            assert row["rank"] == rank
+            names = lin.split(";")
+            rank = self.ranks[len(names) - 1]
+            assert row_rank == rank
 
             node = dict(
-                name=name,
-                count=1000 * float(row["f_weighted_at_rank"]),
-                rank=row["rank"],
-                score=row["fraction"],
+                name=names[-1],
+                count=1000 * float(f_weighted),
+                rank=row_rank,
+                score=fraction,
             )
 
-            nodes_by_tax[lin] = node
+            builder.add_node(names, node)
 
-        return assign_children(nodes_by_tax)
+        return builder.build()
 
 
 def parse_csv_summary(tax_csv):
@@ -170,63 +319,53 @@ def parse_csv_summary(tax_csv):
 
 
 class Parse_SourmashTaxAnnotate(GenericParser):
-    def build(self):
-        # load in all tax rows.
-        tax_rows = []
-        rows = self.load_rows()
-
-        rows_by_tax = defaultdict(list)
+    def select_columns(self, header):
         name_col = "match_name"
-        if name_col not in rows[0].keys():
+        if name_col not in header:
             name_col = "name"
 
-        for row in rows:
-            # add genome onto lineage
-            orig_lin = row["lineage"]
-            if not orig_lin:
-                print(f'IGNORING row with empty lineage: name={row["name"]}')
-                continue
-            orig_lin = orig_lin + ";" + row[name_col]
-
-            lin = orig_lin
-            first = True
-            last = None
-            while first or last:
-                first = False
-                assert lin
-                rows_by_tax[lin].append(row)
-
-                if ";" not in lin:
-                    break
-                lin, last = lin.rsplit(";", 1)
-                if not last:
-                    # CTB test!
-                    raise Exception(
-                        f"error!? missing taxonomic entry in row '{orig_lin}'; this is not handled by taxburst"
-                    )
+        return [
+            "lineage",
+            name_col,
+            "n_unique_weighted_found",
+            "median_abund",
+            "total_weighted_hashes",
+            "sum_weighted_found",
+        ]
 
-        # make nodes
-        nodes_by_tax = {}
-        for lin, rows in rows_by_tax.items():
-            name = lin.rsplit(";")[-1]
+    def build(self):
+        # load in all tax rows, adding counts along each lineage.
+        builder = LineageBuilder(self.ranks)
+        last_row = None
+        for row in self.iter_rows():
+            last_row = row
+            lin, match_name, n_found, median_abund = row[:4]
+            if not lin:
+                print(f"IGNORING row with empty lineage: name={match_name}")
+                continue
 
-            rank = self.ranks[lin.count(";")]
-            count = 0.0
-            for row in rows:
-                count += int(row["n_unique_weighted_found"])
+            # add genome onto lineage
+            names = lin.split(";")
+            names.append(match_name)
+            if not all(names):
+                # CTB test!
+                raise Exception(
+                    f"error!? missing taxonomic entry in row '{';'.join(names)}'; this is not handled by taxburst"
+                )
 
-            node = dict(name=name, rank=rank, count=count)
-            if rank == "genome" or rank == "strain":
-                node["abund"] = row["median_abund"]
+            for node in builder.add(names, int(n_found)):
+                rank = node["rank"]
+                if rank == "genome" or rank == "strain":
+                    node["abund"] = median_abund
 
-            nodes_by_tax[lin] = node
+        if last_row is None:
+            raise Exception(f"no rows in '{self.filename}'")
 
-        top_nodes = assign_children(nodes_by_tax)
+        top_nodes = builder.build()
 
         # calc unassigned...
-        last_row = rows[-1]
-        total = int(last_row["total_weighted_hashes"])
-        found = int(last_row["sum_weighted_found"])
+        total = int(last_row[4])
+        found = int(last_row[5])
 
         top_nodes.append(
             dict(
@@ -246,50 +385,27 @@ def parse_tax_annotate(tax_csv):
 
 
 class Parse_SingleMProfile(GenericParser):
-    def build(self):
-        tax_rows = self.load_rows()
-
-        rows_by_tax = defaultdict(list)
-        for row in tax_rows:
-            lin = row["taxonomy"]
+    columns = ["taxonomy", "coverage"]
 
+    def build(self):
+        builder = LineageBuilder(self.ranks)
+        for lin, coverage in self.iter_rows():
             # every row starts with Root; remove!
             assert lin.startswith("Root; ")
             orig_lin = lin[len("Root; ") :]
 
-            # create sublineages to root for every lineage
-            lin = orig_lin
-            first = True
-            last = None
-            while first or last:
-                first = False
-                rows_by_tax[lin].append(row)
-
-                # no more lineages? break up.
-                if ";" not in lin:
-                    break
-                lin, last = lin.rsplit(";", 1)
-                last = last.strip()
-                if not last:
-                    # CTB test!
-                    raise Exception(
-                        f"error!? missing taxonomic entry in row '{orig_lin}'; this is not handled by taxburst"
-                    )
-
-        # make nodes containing information for each lineage entry
-        nodes_by_tax = {}
-        for lin, rows in rows_by_tax.items():
-            name = lin.rsplit(";")[-1].strip()
-            rank = self.ranks[lin.count(";")]
-            count = 0.0
-            for row in rows:
-                count += float(row["coverage"]) * 1000
+            # add coverage to every sublineage
+            names = [name.strip() for name in orig_lin.split(";")]
+            if not all(names):
+                # CTB test!
+                raise Exception(
+                    f"error!? missing taxonomic entry in row '{orig_lin}'; this is not handled by taxburst"
+                )
 
-            node = dict(name=name, rank=rank, count=count)
-            nodes_by_tax[lin] = node
+            builder.add(names, float(coverage) * 1000)
 
         # assign children & find top nodes
-        return assign_children(nodes_by_tax)
+        return builder.build()
 
 
 def parse_SingleM(singleM_tsv):
@@ -299,49 +415,31 @@ def parse_SingleM(singleM_tsv):
 
 
 class Parse_Krona(GenericParser):
-    def build(self):
-        tax_rows = self.load_rows()
-
-        rows_by_tax = defaultdict(list)
-        available_ranks = None
-        for row in tax_rows:
-            # initialize list of available ranks from file itself.
-            if available_ranks is None:
-                available_ranks = []
-                for rank in self.ranks:
-                    if rank not in row:
-                        break
-                    available_ranks.append(rank)
+    def select_columns(self, header):
+        # initialize list of available ranks from file itself.
+        available_ranks = []
+        for rank in self.ranks:
+            if rank not in header:
+                break
+            available_ranks.append(rank)
+
+        return ["fraction"] + available_ranks
 
+    def build(self):
+        builder = LineageBuilder(self.ranks)
+        for row in self.iter_rows():
             # for each line, get values for each available rank
-            get_ranks = list(reversed(available_ranks))
-            lineage = []
-            while get_ranks:
-                rank = get_ranks.pop()
-                lineage.append(row[rank])
+            count = float(row[0]) * 1000
+            lineage = [name.strip() for name in row[1:]]
 
             # special case unclassified: skip building sublineages
-            if row[rank] == "unclassified":
-                rows_by_tax["unclassified"].append(row)
+            if lineage[-1] == "unclassified":
+                builder.add(["unclassified"], count)
                 continue
 
-            for i in range(0, len(lineage)):
-                lin = ";".join(lineage[: i + 1])
-                rows_by_tax[lin].append(row)
-
-        # make nodes
-        nodes_by_tax = {}
-        for lin, rows in rows_by_tax.items():
-            name = lin.rsplit(";")[-1].strip()
-            rank = self.ranks[lin.count(";")]
-            count = 0.0
-            for row in rows:
-                count += float(row["fraction"]) * 1000
-
-            node = dict(name=name, rank=rank, count=count)
-            nodes_by_tax[lin] = node
+            builder.add(lineage, count)
 
-        return assign_children(nodes_by_tax)
+        return builder.build()
 
 
 def parse_krona(krona_tsv):
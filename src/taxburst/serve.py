@@ -0,0 +1,308 @@
+"""
+Serve a report over HTTP, and reload it in the browser when the input
+file changes.
+
+Usage: taxburst serve <input> -F <format> [--port 8000]
+
+The input file is checked every '--interval' seconds: first by mtime and
+size, and then, if those changed, by a hash of its contents. It is only
+parsed and rendered again when the contents change. The rendered page is
+kept in memory (plain and gzipped), and open pages are told to reload
+with server-sent events from '/events'.
+"""
+
+import os
+import argparse
+import gzip
+import hashlib
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from . import checks
+from . import parsers
+from . import output
+
+# added to the page, to reload it when a new version is rendered.
+_reload_script = """\
+<script>
+(function() {
+  var version = "%(version)s";
+  var events = new EventSource("/events");
+  events.onmessage = function(e) {
+    if (e.data != version) { location.reload(); }
+  };
+})();
+</script>
+"""
+
+# seconds between keep-alive messages to waiting event streams.
+_keepalive = 15
+
+
+def accepts_gzip(accept_encoding):
+    """Return True if an 'Accept-Encoding' header value allows gzip.
+
+    Honours q-values, so 'gzip;q=0' refuses gzip; '*' covers gzip if
+    gzip isn't listed itself.
+    """
+    q_gzip = q_any = None
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ("gzip", "x-gzip"):
+            q_gzip = max(q, q_gzip or 0.0)
+        elif coding == "*":
+            q_any = q
+
+    if q_gzip is None:
+        q_gzip = q_any
+    return bool(q_gzip)
+
+
+class FileWatcher:
+    "Notice when a file's contents change, checking mtime and size first."
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stat_key = None
+        self.digest = None
+
+    def check(self):
+        "Return True if the contents changed since the last check."
+        st = os.stat(self.filename)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self.stat_key:
+            return False
+        self.stat_key = stat_key
+
+        h = hashlib.sha256()
+        with open(self.filename, "rb") as fp:
+            while chunk := fp.read(1024**2):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if digest == self.digest:  # e.g. touched, but not changed.
+            return False
+        self.digest = digest
+        return True
+
+
+class LiveReport:
+    """The rendered report for one input file, re-rendered when it changes.
+
+    'current' is a (version, tag, page, gzipped page) tuple, replaced as a
+    whole so that request threads always see a consistent page. The tag
+    identifies the version and contents, for ETags and event streams.
+    """
+
+    def __init__(self, filename, input_format, *, name=None, data_format="xml"):
+        self.filename = filename
+        self.input_format = input_format
+        self.name = name
+        self.data_format = data_format
+        self.watcher = FileWatcher(filename)
+        self.current = None
+        self.closed = False
+        self.last_error = None
+        self.changed = threading.Condition()
+
+    @property
+    def version(self):
+        return self.current[0] if self.current else 0
+
+    def refresh(self):
+        "Re-render the page if the input changed; return True if it was."
+        start = time.perf_counter()
+        try:
+            if not self.watcher.check():
+                return False
+            top_nodes, name, xtra = parsers.parse_file(
+                self.filename, self.input_format
+            )
+            checks.check_structure(top_nodes)
+            html = output.generate_html(
+                top_nodes,
+                name=self.name or name,
+                extra_attributes=xtra,
+                data_format=self.data_format,
+            )
+        except Exception as exc:
+            # e.g. the file is being rewritten; keep serving the last page.
+            msg = f"WARNING: could not render '{self.filename}': {exc}"
+            if msg != self.last_error:
+                print(msg)
+                self.last_error = msg
+            self.watcher.stat_key = None  # try again next time.
+            return False
+        self.last_error = None
+
+        version = self.version + 1
+        tag = f"{version}-{self.watcher.digest[:16]}"
+        script = _reload_script % dict(version=tag)
+        head, body_end, tail = html.rpartition("</body>")
+        if body_end:
+            html = head + script + body_end + tail
+        else:
+            html = html + script
+        page = html.encode("utf-8")
+        page_gz = gzip.compress(page, compresslevel=6, mtime=0)
+
+        with self.changed:
+            self.current = (version, tag, page, page_gz)
+            self.changed.notify_all()
+
+        elapsed = time.perf_counter() - start
+        print(f"rendered '{self.filename}' (version {version}) in {elapsed:.2f}s")
+        return True
+
+    def wait_for_change(self, version, timeout):
+        "Wait until the version is not 'version', or timeout; return the version."
+        with self.changed:
+            self.changed.wait_for(
+                lambda: self.version != version or self.closed, timeout
+            )
+            return self.version
+
+    def watch(self, interval):
+        "Check for changes every 'interval' seconds, until closed."
+        while not self.closed:
+            time.sleep(interval)
+            self.refresh()
+
+    def close(self):
+        "Stop watching, and end any event streams."
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    "Serve the page from 'self.server.report' at '/', and reloads at '/events'."
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/":
+            self.send_page()
+        elif path == "/events":
+            self.send_events()
+        else:
+            self.send_error(404)
+
+    def send_page(self):
+        version, tag, page, page_gz = self.server.report.current
+        use_gzip = accepts_gzip(self.headers.get("Accept-Encoding", ""))
+        if use_gzip:
+            # a different body, so it needs a different ETag.
+            page = page_gz
+            tag += "-gz"
+        etag = f'"{tag}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def send_events(self):
+        report = self.server.report
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            version, tag = report.current[:2]
+            self.wfile.write(f"data: {tag}\n\n".encode())
+            self.wfile.flush()
+            while not report.closed:
+                if report.wait_for_change(version, _keepalive) != version:
+                    version, tag = report.current[:2]
+                    self.wfile.write(f"data: {tag}\n\n".encode())
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the page was closed or reloaded.
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(report, host="127.0.0.1", port=8000, *, verbose=False):
+    "Create (but don't start) an HTTP server for a LiveReport."
+    server = ThreadingHTTPServer((host, port), ReportHandler)
+    server.daemon_threads = True
+    server.report = report
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="taxburst serve")
+    p.add_argument("input", help="input file to serve a report for")
+    p.add_argument(
+        "-F",
+        "--input-format",
+        default="csv_summary",
+        choices=parsers.input_formats,
+    )
+    p.add_argument("--name", help="name of the dataset; default is based on the filename")
+    p.add_argument(
+        "--data-format",
+        default="xml",
+        choices=output.data_formats,
+        help="encode the node data as XML, or as compact JSON (optionally gzipped) that is decoded when the page loads",
+    )
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    p.add_argument("--port", type=int, default=8000, help="port to listen on")
+    p.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="seconds between checks of the input file for changes",
+    )
+    p.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = p.parse_args(argv)
+
+    report = LiveReport(
+        args.input, args.input_format, name=args.name, data_format=args.data_format
+    )
+    if not report.refresh():
+        print(f"Cannot render '{args.input}'. Error exit.")
+        return -1
+
+    server = make_server(report, args.host, args.port, verbose=args.verbose)
+    watcher = threading.Thread(target=report.watch, args=(args.interval,), daemon=True)
+    watcher.start()
+
+    host, port = server.server_address[:2]
+    print(f"serving '{args.input}' at http://{host}:{port}/ - press Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        report.close()
+        server.server_close()
+
+    return 0
@@ -0,0 +1,432 @@
+"""
+Report service: POST an input file, get back the HTML report.
+
+Usage: taxburst service [-F <format>] [--port 8080] [-j <N>]
+
+    curl --data-binary @sample.with-lineages.csv \\
+        'http://127.0.0.1:8080/render?format=tax_annotate&name=sample'
+
+The server runs on asyncio, and parsing and rendering run in a pool of
+worker processes (or threads, with '--threads'). At most '--jobs'
+renders run at once, and at most '--max-pending' distinct renders may be
+waiting or running; beyond that, requests get '503 Service Unavailable'
+right away rather than queueing without bound.
+
+Rendered pages are kept in an in-memory LRU cache, keyed by a hash of
+the uploaded contents and the options, so repeated requests for the
+same sample are answered without rendering. Identical requests that
+arrive while a render is in progress wait for that render rather than
+starting another.
+
+'GET /stats' returns counts of requests, renders, cache hits and so on,
+as JSON.
+"""
+
+import os
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from . import checks
+from . import parsers
+from . import output
+from .serve import accepts_gzip
+
+default_max_bytes = 256 * 1024**2
+default_max_upload = 64 * 1024**2
+
+
+def render_upload(data, input_format, name=None, data_format="xml"):
+    """Parse and render the contents of an input file.
+
+    Returns (page, gzipped page), as bytes. Runs in the worker pool.
+    """
+    if input_format not in parsers.input_formats:
+        raise Exception(f"unknown input format: '{input_format}'")
+
+    # the parsers read files; this also lets them detect compression.
+    fd, filename = tempfile.mkstemp(prefix="taxburst-upload-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        top_nodes, _, xtra = parsers.parse_file(filename, input_format)
+    finally:
+        os.unlink(filename)
+
+    checks.check_structure(top_nodes)
+    html = output.generate_html(
+        top_nodes, name=name, extra_attributes=xtra, data_format=data_format
+    )
+    page = html.encode("utf-8")
+    return page, gzip.compress(page, compresslevel=6, mtime=0)
+
+
+def _init_worker():
+    "Load the templates once per worker process."
+    output.load_templates()
+
+
+class PageCache:
+    "An in-memory LRU cache of rendered pages, trimmed to max_bytes."
+
+    def __init__(self, *, max_bytes=default_max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        "Return the cached (page, gzipped page) for key, or None."
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        "Cache a (page, gzipped page), evicting least recently used pages."
+        size = sum(map(len, value))
+        if size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= sum(map(len, old))
+        self.entries[key] = value
+        self.nbytes += size
+
+        while self.nbytes > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= sum(map(len, old))
+
+
+class ReportService:
+    """Render uploaded inputs in 'executor', with bounded concurrency.
+
+    At most 'max_concurrent' renders are handed to the executor at once,
+    and at most 'max_pending' distinct renders may be waiting or running.
+    """
+
+    def __init__(
+        self,
+        executor,
+        *,
+        max_concurrent=1,
+        max_pending=16,
+        cache=None,
+        max_upload=default_max_upload,
+        default_format="csv_summary",
+        data_format="xml",
+        verbose=False,
+    ):
+        assert max_concurrent >= 1 and max_pending >= 1
+        self.executor = executor
+        self.max_pending = max_pending
+        self.cache = cache if cache is not None else PageCache()
+        self.max_upload = max_upload
+        self.default_format = default_format
+        self.data_format = data_format
+        self.verbose = verbose
+
+        self.limit = asyncio.Semaphore(max_concurrent)
+        self.in_flight = {}  # key => task
+        self.counts = dict(
+            requests=0, renders=0, cache_hits=0, shared=0, rejected=0, errors=0
+        )
+
+    @staticmethod
+    def key(data, input_format, name, data_format):
+        "Build the cache key for rendering this input with these options."
+        h = hashlib.sha256()
+        for part in (input_format, name or "", data_format):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        h.update(data)
+        return h.hexdigest()
+
+    async def render(self, data, input_format, *, name=None, data_format="xml"):
+        """Return ((page, gzipped page), how) for an uploaded input.
+
+        'how' is 'cache' for a cache hit, 'shared' if an identical render
+        was already in progress, or 'rendered'. If too many renders are
+        pending, returns (None, 'busy') without waiting.
+        """
+        key = self.key(data, input_format, name, data_format)
+        value = self.cache.get(key)
+        if value is not None:
+            self.counts["cache_hits"] += 1
+            return value, "cache"
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.counts["shared"] += 1
+            how = "shared"
+        elif len(self.in_flight) >= self.max_pending:
+            self.counts["rejected"] += 1
+            return None, "busy"
+        else:
+            task = asyncio.create_task(
+                self._render(key, data, input_format, name, data_format)
+            )
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            how = "rendered"
+
+        # shielded, so that one client going away doesn't cancel the
+        # render for others waiting on it.
+        value = await asyncio.shield(task)
+        return value, how
+
+    async def _render(self, key, data, input_format, name, data_format):
+        async with self.limit:
+            loop = asyncio.get_running_loop()
+            value = await loop.run_in_executor(
+                self.executor, render_upload, data, input_format, name, data_format
+            )
+        self.counts["renders"] += 1
+        self.cache.put(key, value)
+        return value
+
+    def _done(self, key, task):
+        del self.in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.counts["errors"] += 1
+
+    def stats(self):
+        "Return a dictionary of request counts and cache usage."
+        d = dict(self.counts)
+        d.update(
+            in_flight=len(self.in_flight),
+            cache_entries=len(self.cache),
+            cache_bytes=self.cache.nbytes,
+        )
+        return d
+
+    async def handle_connection(self, reader, writer):
+        "Serve HTTP/1.1 requests on one connection, until it is closed."
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away.
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader, writer):
+        "Read and answer one request; return False to close the connection."
+        try:
+            line = await reader.readline()
+            if not line:
+                return False
+            method, target, _ = line.decode("latin-1").split()
+
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+        except ValueError:  # a bad request line, or a line that's too long.
+            await self._send(writer, HTTPStatus.BAD_REQUEST, b"bad request\n")
+            return False
+
+        start = time.perf_counter()
+        self.counts["requests"] += 1
+        url = urlsplit(target)
+        keep_alive = headers.get("connection", "").lower() != "close"
+
+        if url.path == "/render" and method == "POST":
+            if "content-length" not in headers:
+                status, body = HTTPStatus.LENGTH_REQUIRED, b"Content-Length required\n"
+                await self._send(writer, status, body)
+                return False
+            length = headers["content-length"]
+            if not length.isdecimal():  # e.g. negative, or not a number
+                status, body = HTTPStatus.BAD_REQUEST, b"bad Content-Length\n"
+                await self._send(writer, status, body)
+                return False
+            length = int(length)
+            if length > self.max_upload:
+                status, body = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, b"upload too large\n"
+                await self._send(writer, status, body)
+                return False
+
+            data = await reader.readexactly(length)
+            status = await self._render_request(writer, url, headers, data)
+        elif url.path == "/stats" and method == "GET":
+            body = json.dumps(self.stats()).encode("utf-8") + b"\n"
+            status = HTTPStatus.OK
+            await self._send(writer, status, body, content_type="application/json")
+        elif url.path in ("/render", "/stats"):
+            status = HTTPStatus.METHOD_NOT_ALLOWED
+            await self._send(writer, status, b"method not allowed\n")
+        else:
+            status = HTTPStatus.NOT_FOUND
+            await self._send(writer, status, b"not found\n")
+
+        if self.verbose:
+            elapsed = time.perf_counter() - start
+            print(f"{method} {target} {status.value} {elapsed:.3f}s")
+        return keep_alive
+
+    async def _render_request(self, writer, url, headers, data):
+        "Render an upload and send the page; return the response status."
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        input_format = query.get("format", self.default_format)
+        data_format = query.get("data_format", self.data_format)
+        if input_format not in parsers.input_formats:
+            status = HTTPStatus.BAD_REQUEST
+            msg = f"unknown input format: '{input_format}'\n"
+            await self._send(writer, status, msg.encode("utf-8"))
+            return status
+        if data_format not in output.data_formats:
+            status = HTTPStatus.BAD_REQUEST
+            msg = f"unknown data format: '{data_format}'\n"
+            await self._send(writer, status, msg.encode("utf-8"))
+            return status
+
+        try:
+            value, how = await self.render(
+                data, input_format, name=query.get("name"), data_format=data_format
+            )
+        except Exception as exc:
+            status = HTTPStatus.UNPROCESSABLE_ENTITY
+            msg = f"cannot render input: {str(exc) or exc.__class__.__name__}\n"
+            await self._send(writer, status, msg.encode("utf-8"))
+            return status
+
+        if value is None:
+            status = HTTPStatus.SERVICE_UNAVAILABLE
+            await self._send(
+                writer, status, b"too many renders pending\n", extra={"Retry-After": "1"}
+            )
+            return status
+
+        page, page_gz = value
+        tag = self.key(data, input_format, query.get("name"), data_format)[:32]
+        extra = {"X-Taxburst-Render": how, "Vary": "Accept-Encoding"}
+        if accepts_gzip(headers.get("accept-encoding", "")):
+            page = page_gz
+            tag += "-gz"
+            extra["Content-Encoding"] = "gzip"
+        extra["ETag"] = f'"{tag}"'
+        status = HTTPStatus.OK
+        await self._send(
+            writer, status, page, content_type="text/html; charset=utf-8", extra=extra
+        )
+        return status
+
+    async def _send(
+        self, writer, status, body, *, content_type="text/plain; charset=utf-8", extra=None
+    ):
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+        ]
+        if extra:
+            lines += [f"{k}: {v}" for k, v in extra.items()]
+        head = "\r\n".join(lines) + "\r\n\r\n"
+        writer.write(head.encode("latin-1"))
+        writer.write(body)
+        await writer.drain()
+
+
+def make_executor(n_workers, *, threads=False):
+    "Create the worker pool that parses and renders uploads."
+    if threads:
+        output.load_templates()
+        return ThreadPoolExecutor(n_workers)
+    return ProcessPoolExecutor(n_workers, initializer=_init_worker)
+
+
+async def serve(service, host="127.0.0.1", port=8080):
+    "Serve requests until cancelled."
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"serving reports at http://{host}:{port}/render - press Ctrl-C to stop")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="taxburst service")
+    p.add_argument(
+        "-F",
+        "--input-format",
+        default="csv_summary",
+        choices=parsers.input_formats,
+        help="input format for requests without a 'format' parameter",
+    )
+    p.add_argument(
+        "--data-format",
+        default="xml",
+        choices=output.data_formats,
+        help="node data format for requests without a 'data_format' parameter",
+    )
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    p.add_argument("--port", type=int, default=8080, help="port to listen on")
+    p.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of renders to run at once"
+    )
+    p.add_argument(
+        "--threads",
+        action="store_true",
+        help="render in threads rather than worker processes",
+    )
+    p.add_argument(
+        "--max-pending",
+        type=int,
+        default=16,
+        help="refuse new renders when this many are waiting or running (default: %(default)s)",
+    )
+    p.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=default_max_bytes / 1024**2,
+        help="keep at most this much rendered HTML in memory (default: %(default)s MB)",
+    )
+    p.add_argument(
+        "--max-upload-mb",
+        type=float,
+        default=default_max_upload / 1024**2,
+        help="refuse uploads larger than this (default: %(default)s MB)",
+    )
+    p.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = p.parse_args(argv)
+
+    if args.jobs < 1 or args.max_pending < 1:
+        print(f"--jobs and --max-pending must be at least 1. Error exit.")
+        return -1
+
+    executor = make_executor(args.jobs, threads=args.threads)
+    cache = PageCache(max_bytes=int(args.cache_max_mb * 1024**2))
+
+    async def run():
+        service = ReportService(
+            executor,
+            max_concurrent=args.jobs,
+            max_pending=args.max_pending,
+            cache=cache,
+            max_upload=int(args.max_upload_mb * 1024**2),
+            default_format=args.input_format,
+            data_format=args.data_format,
+            verbose=args.verbose,
+        )
+        await serve(service, args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    return 0
@@ -0,0 +1,100 @@
+"""
+Per-phase timings for the taxburst command line: wall time, CPU time,
+peak RSS, and row/node counts for each phase of a run.
+"""
+
+import sys
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    "Return the peak resident set size of this process so far, in MB."
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, KB elsewhere
+        return maxrss / 1024**2
+    return maxrss / 1024
+
+
+class PhaseTimings:
+    """Accumulate timings and counts for named phases, in order.
+
+    Phases with the same name (e.g. parsing several input files) are
+    added together.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def phase(self, name, **counts):
+        """Time a phase. Yields a dictionary, to which counts can be added.
+
+        Counts are summed over repeated phases; other values are replaced.
+        """
+        entry = self.phases.setdefault(name, dict(wall_s=0.0, cpu_s=0.0))
+        counts = dict(counts)
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield counts
+        finally:
+            entry["wall_s"] += time.perf_counter() - wall
+            entry["cpu_s"] += time.process_time() - cpu
+            entry["peak_rss_mb"] = peak_rss_mb()
+            for key, value in counts.items():
+                if isinstance(value, (int, float)) and key in entry:
+                    entry[key] += value
+                else:
+                    entry[key] = value
+
+    def timed_iter(self, name, iterable):
+        "Yield from iterable, adding the time spent producing items to a phase."
+        it = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def as_dict(self):
+        "Return all phases, and the totals so far, as a JSON-able dictionary."
+        phases = [dict(name=name, **entry) for name, entry in self.phases.items()]
+        total = dict(
+            wall_s=time.perf_counter() - self.start_wall,
+            cpu_s=time.process_time() - self.start_cpu,
+            peak_rss_mb=peak_rss_mb(),
+        )
+        return dict(phases=phases, total=total)
+
+    def report(self, fp=None):
+        "Print a table of the phases, to stdout by default."
+        if fp is None:
+            fp = sys.stdout  # looked up now, so that redirection works.
+        d = self.as_dict()
+        print(
+            f"{'phase':14s} {'wall s':>9s} {'cpu s':>9s} {'peak RSS MB':>12s}  counts",
+            file=fp,
+        )
+        for entry in d["phases"] + [dict(name="total", **d["total"])]:
+            rss = entry["peak_rss_mb"]
+            rss = "-" if rss is None else f"{rss:.1f}"
+            counts = ", ".join(
+                f"{k}={v}"
+                for k, v in entry.items()
+                if k not in ("name", "wall_s", "cpu_s", "peak_rss_mb")
+            )
+            line = f"{entry['name']:14s} {entry['wall_s']:9.3f} {entry['cpu_s']:9.3f} {rss:>12s}  {counts}"
+            print(line.rstrip(), file=fp)
@@ -1,4 +1,8 @@
-from collections import defaultdict
+from array import array
+from collections import defaultdict, namedtuple
+
+from .compact import CompactTree, CompactNode
+from .frozen import FrozenNode, is_frozen
 
 
 ranks = [
@@ -18,6 +22,10 @@ def nodes_beneath_top(top_nodes):
     """
     Yield all nodes beneath a list of nodes (including the nodes in the list).
     """
+    if isinstance(top_nodes, CompactTree):
+        yield from top_nodes.iter_nodes()
+        return
+
     for node in top_nodes:
         yield node
         for n in nodes_beneath(node, recurse=True):
@@ -26,6 +34,10 @@ def nodes_beneath_top(top_nodes):
 
 def nodes_beneath(node, *, recurse=False):
     "Yield all nodes directly under this node, with optional recursion."
+    if isinstance(node, CompactNode):
+        yield from node.tree.iter_beneath(node.index, recurse=recurse)
+        return
+
     for child in node.get("children", []):
         yield child
         if recurse:
@@ -35,6 +47,9 @@ def nodes_beneath(node, *, recurse=False):
 
 def collect_all_nodes(top_nodes_list):
     "Return a _list_ of all nodes."
+    if isinstance(top_nodes_list, CompactTree):
+        return list(top_nodes_list.iter_nodes())
+
     nodes = []
     for top_node in top_nodes_list:
         nodes.append(top_node)
@@ -45,6 +60,12 @@ def collect_all_nodes(top_nodes_list):
 
 def copy_tree(nodelist):
     "Make a copy of a list of nodes (recursively)"
+    if isinstance(nodelist, CompactTree):
+        return nodelist.copy()
+    if is_frozen(nodelist):
+        # frozen nodes can't change, so they can be shared.
+        return list(nodelist)
+
     new_nodelist = []
     for n in nodelist:
         new_node = dict(n)  # copy
@@ -56,24 +77,207 @@ def copy_tree(nodelist):
     return new_nodelist
 
 
-def augment_node(node, names_to_nodes):
-    "Augment a node with child nodes from other trees."
-    name = node["name"]
-    rank = node["rank"]
+class TreeIndex:
+    """An index of a tree's nodes by name, lineage, and rank.
+
+    Built in a single pass over the tree, and then answers "which node is
+    named X", "what is the lineage of X", and "which nodes are at rank R"
+    with dictionary lookups. Names are assumed to be unique; nodes with
+    an empty or already-seen name are not indexed, but are listed in
+    'bad_names' (in pre-order), and 'all_named' finds duplicates too.
+
+    'add', 'remove' and 'update' change the tree and the index together.
+    If the tree is changed any other way, call 'rebuild'.
+    """
+
+    def __init__(self, top_nodes):
+        self.top_nodes = top_nodes
+        self.rebuild()
+
+    @classmethod
+    def of(cls, top_nodes):
+        "Return top_nodes if it is already a TreeIndex, or else index it."
+        if isinstance(top_nodes, cls):
+            return top_nodes
+        return cls(top_nodes)
+
+    def rebuild(self):
+        "Re-index the whole tree."
+        self.by_name = {}  # name => node
+        self.parents = {}  # name => parent node, or None for top nodes
+        self.depths = {}  # name => depth; 0 for top nodes
+        self.by_rank = defaultdict(dict)  # rank => { name: node }
+        self.bad_names = []  # nodes with empty or duplicate names
+        self.duplicates = defaultdict(list)  # name => later nodes with it
+        self._index_subtrees(self.top_nodes, None, 0)
+
+    def _index_subtrees(self, nodes, parent, depth):
+        stack = [(node, parent, depth) for node in reversed(nodes)]
+        while stack:
+            node, parent, depth = stack.pop()
+            name = node.get("name")
+            if not name or name in self.by_name:
+                self.bad_names.append(node)
+                if name:
+                    self.duplicates[name].append(node)
+            else:
+                self.by_name[name] = node
+                self.parents[name] = parent
+                self.depths[name] = depth
+                self.by_rank[node.get("rank")][name] = node
+
+            children = node.get("children")
+            if children:
+                for child in reversed(children):
+                    stack.append((child, node, depth + 1))
+
+    def _unindex_subtree(self, node):
+        removed = set()
+        for n in nodes_beneath_top([node]):
+            removed.add(id(n))
+            name = n.get("name")
+            if self.by_name.get(name) is n:
+                del self.by_name[name]
+                del self.parents[name]
+                del self.depths[name]
+                del self.by_rank[n.get("rank")][name]
+
+        if self.bad_names:
+            self.bad_names = [n for n in self.bad_names if id(n) not in removed]
+            for name, nodes in list(self.duplicates.items()):
+                nodes = [n for n in nodes if id(n) not in removed]
+                if nodes:
+                    self.duplicates[name] = nodes
+                else:
+                    del self.duplicates[name]
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def all_named(self, name):
+        "Return all nodes with this name: the indexed one, then any duplicates."
+        node = self.by_name.get(name)
+        nodes = [] if node is None else [node]
+        if name in self.duplicates:
+            nodes += self.duplicates[name]
+        return nodes
+
+    def parent(self, name):
+        "Return the parent node of the node with this name, or None."
+        return self.parents[name]
+
+    def depth(self, name):
+        "Return the depth of the node with this name; 0 for top nodes."
+        return self.depths[name]
+
+    def lineage(self, name):
+        "Return the list of names from the top node down to this node."
+        names = [name]
+        parent = self.parents[name]
+        while parent is not None:
+            names.append(parent["name"])
+            parent = self.parents[parent["name"]]
+        names.reverse()
+        return names
+
+    def find(self, lineage):
+        """Return the node at this lineage, or None.
+
+        'lineage' is a list of names from the top down, or a string of
+        names separated by ';'.
+        """
+        if isinstance(lineage, str):
+            lineage = lineage.split(";")
+        node = self.by_name.get(lineage[-1])
+        if node is None or self.depths[lineage[-1]] != len(lineage) - 1:
+            return None
+        if self.lineage(lineage[-1]) != list(lineage):
+            return None
+        return node
+
+    def at_rank(self, rank):
+        "Return the list of nodes at this rank, in the order they were indexed."
+        return list(self.by_rank.get(rank, {}).values())
+
+    def add(self, node, parent_name=None):
+        "Add a node (and its subtree) under the named parent, or at the top."
+        if parent_name is None:
+            parent = None
+            self.top_nodes.append(node)
+            depth = 0
+        else:
+            parent = self.by_name[parent_name]
+            parent.setdefault("children", []).append(node)
+            depth = self.depths[parent_name] + 1
+        self._index_subtrees([node], parent, depth)
+
+    def remove(self, name):
+        "Remove the named node and its subtree from the tree; return the node."
+        node = self.by_name[name]
+        parent = self.parents[name]
+        siblings = self.top_nodes if parent is None else parent["children"]
+        for i, sibling in enumerate(siblings):
+            if sibling is node:
+                del siblings[i]
+                break
+
+        self._unindex_subtree(node)
+        return node
 
+    def update(self, name, /, **changes):
+        "Change keys of the named node, e.g. its count, name or rank."
+        assert "children" not in changes, "use 'add' and 'remove' for children"
+        node = self.by_name[name]
+        new_name = changes.get("name", name)
+        if new_name != name:
+            assert new_name and new_name not in self.by_name, new_name
+
+        old_rank = node.get("rank")
+        for key, value in changes.items():
+            node[key] = value
+
+        if new_name != name or node.get("rank") != old_rank:
+            del self.by_rank[old_rank][name]
+            self.by_rank[node.get("rank")][new_name] = node
+        if new_name != name:
+            self.by_name[new_name] = self.by_name.pop(name)
+            self.parents[new_name] = self.parents.pop(name)
+            self.depths[new_name] = self.depths.pop(name)
+
+
+def _child_names(name, indexes):
+    """Return the names of the children of the named node, across all indexes.
+
+    If a tree has several nodes with this name, their children are combined.
+    """
     child_names = set()
-    for other_node in names_to_nodes[name]:
-        for child in other_node.get("children", []):
-            child_name = child["name"]
-            child_names.add(child_name)
+    for index in indexes:
+        for other_node in index.all_named(name):
+            for child in other_node.get("children", []):
+                child_names.add(child["name"])
+    return child_names
 
-    remaining = set(child_names)
+
+def augment_node(node, indexes):
+    "Augment a node with child nodes from other trees (given as TreeIndexes)."
+    rank = node["rank"]
+
+    remaining = _child_names(node["name"], indexes)
     children = node.get("children", [])  # make a copy
     new_children = []
     for child in children:
-        remaining.remove(child["name"])
+        remaining.discard(child["name"])  # siblings may share a name
         child = dict(child)  # make a copy
-        augment_node(child, names_to_nodes)
+        augment_node(child, indexes)
         new_children.append(child)
 
     if remaining:
@@ -84,33 +288,66 @@ def augment_node(node, names_to_nodes):
             new_child = dict(name=missing_child, count=0, rank=child_rank)
             # add children from others?
             new_children.append(new_child)
-            augment_node(new_child, names_to_nodes)
+            augment_node(new_child, indexes)
 
     if new_children:
         node["children"] = new_children
 
 
+def _augment_frozen_node(node, indexes):
+    """Like 'augment_node', for a FrozenNode.
+
+    Returns the node itself if nothing beneath it changes, and otherwise a
+    new node; unchanged subtrees are shared, not copied.
+    """
+    child_names = _child_names(node["name"], indexes)
+    children = node.get("children", ())
+    new_children = [_augment_frozen_node(c, indexes) for c in children]
+    remaining = child_names - {c["name"] for c in children}
+
+    if remaining:
+        this_rank_i = ranks.index(node["rank"])
+        child_rank = ranks[this_rank_i + 1]
+
+        for missing_child in remaining:
+            new_child = FrozenNode(dict(name=missing_child, count=0, rank=child_rank))
+            new_children.append(_augment_frozen_node(new_child, indexes))
+    elif all(new is old for new, old in zip(new_children, children)):
+        return node
+
+    return node.evolve(children=new_children)
+
+
 def augment_tree(first_top_nodes, other_top_nodes):
-    "Augment a set of top nodes with child nodes from other trees."
-    names_to_nodes = defaultdict(list)
-    for top_nodes in [first_top_nodes] + other_top_nodes:
-        for node in nodes_beneath_top(top_nodes):
-            name = node["name"]
-            assert name  # don't allow names to be empty
-            names_to_nodes[name].append(node)
+    """Augment a set of top nodes with child nodes from other trees.
+
+    If the first tree is frozen (see 'taxburst.frozen'), so is the new
+    tree, and it shares all unchanged subtrees with the first tree. Any
+    of the trees may be given as a TreeIndex, to reuse its index.
+    """
+    indexes = [TreeIndex.of(t) for t in [first_top_nodes] + other_top_nodes]
+    for index in indexes:
+        for node in index.bad_names:
+            assert node.get("name")  # don't allow names to be empty
+    first_top_nodes = indexes[0].top_nodes
 
     names = set()
     found = set()
-    for nodelist in other_top_nodes:
-        for top_node in nodelist:
+    for index in indexes[1:]:
+        for top_node in index.top_nodes:
             names.add(top_node.get("name"))
 
+    frozen = is_frozen(first_top_nodes)
+
     # augment existing top node
     new_top_nodes = []
     for top_node in first_top_nodes:
-        top_node = dict(top_node)
         found.add(top_node["name"])
-        augment_node(top_node, names_to_nodes)
+        if frozen:
+            top_node = _augment_frozen_node(top_node, indexes)
+        else:
+            top_node = dict(top_node)
+            augment_node(top_node, indexes)
 
         new_top_nodes.append(top_node)
 
@@ -118,21 +355,332 @@ def augment_tree(first_top_nodes, other_top_nodes):
 
     # add missing top nodes
     for missing_name in names - found:
-        new_node = dict(name=missing_name, count=0, rank=top_rank)
-        augment_node(new_node, names_to_nodes)
+        if frozen:
+            new_node = FrozenNode(dict(name=missing_name, count=0, rank=top_rank))
+            new_node = _augment_frozen_node(new_node, indexes)
+        else:
+            new_node = dict(name=missing_name, count=0, rank=top_rank)
+            augment_node(new_node, indexes)
         new_top_nodes.append(new_node)
 
     return new_top_nodes
 
 
-def normalize_tree_counts(top_nodes):
-    """Normalize all the counts in the tree to a sum of 1 (across each layer)
+def merge_trees(trees, *, attributes=()):
+    """Merge many trees into one aligned tree, with per-sample counts.
 
-    NOTE: Changes tree in place. Returns None.
+    Nodes are matched by name, as in 'augment_tree'. Each merged node has
+    a 'counts' list with one count per tree (0 where the tree lacks the
+    node), and a 'count' that is the sum across trees. Any keys listed in
+    'attributes' are also collected into per-tree lists, with None for
+    missing values. A node that appears under different parents in
+    different trees is placed under the parent it was first seen with.
+
+    Each tree is walked once, using a single name => merged node index.
+    """
+    n_samples = len(trees)
+    merged_top = []
+    merged_by_name = {}
+
+    for sample_i, top_nodes in enumerate(trees):
+        stack = [(node, merged_top) for node in reversed(top_nodes)]
+        while stack:
+            node, siblings = stack.pop()
+            name = node["name"]
+            assert name  # don't allow names to be empty
+
+            merged = merged_by_name.get(name)
+            if merged is None:
+                merged = dict(
+                    name=name,
+                    count=0,
+                    rank=node["rank"],
+                    counts=[0] * n_samples,
+                )
+                for attr in attributes:
+                    merged[attr] = [None] * n_samples
+                merged["children"] = []
+                merged_by_name[name] = merged
+                siblings.append(merged)
+
+            count = node["count"]
+            merged["counts"][sample_i] += count
+            merged["count"] += count
+            for attr in attributes:
+                val = node.get(attr)
+                if val is not None:
+                    merged[attr][sample_i] = val
+
+            children = node.get("children")
+            if children:
+                for child in reversed(children):
+                    stack.append((child, merged["children"]))
+
+    return merged_top
+
+
+def prune_tree(
+    top_nodes, *, min_fraction=None, max_children=None, other_name="other"
+):
+    """Collapse small subtrees into aggregated 'other' nodes.
+
+    A node is collapsed if its count is less than 'min_fraction' of the
+    total count of the top nodes, or if it is not among the
+    'max_children' largest children of its parent. All of the collapsed
+    children of a parent are replaced by one node, named e.g.
+    'other (g__Escherichia)', whose count (and per-dataset 'counts', if
+    present) is the sum of theirs.
 
-    @CTB test me.
+    Returns a new tree; the original is not changed. Collapsed subtrees
+    are never visited, so this is fast even for huge trees.
     """
-    sum_counts = sum([ n["count"] for n in top_nodes ])
+    total = sum([float(n["count"]) for n in top_nodes])
+    min_count = None
+    if min_fraction is not None:
+        min_count = min_fraction * total
+
+    def select(nodes, parent_name):
+        "Return the kept nodes, plus an 'other' node if any were collapsed."
+        # iterate once: CompactTree makes new node views on each iteration,
+        # so kept nodes are only recognizable by id() within this list.
+        nodes = list(nodes)
+        keep = nodes
+        if min_count is not None:
+            keep = [n for n in keep if float(n["count"]) >= min_count]
+        if max_children is not None and len(keep) > max_children:
+            keep = sorted(keep, key=lambda n: float(n["count"]), reverse=True)
+            keep = keep[:max_children]
+
+        if len(keep) == len(nodes):
+            return keep, None
+
+        # keep original order, and sum up the rest
+        kept_ids = {id(n) for n in keep}
+        keep = [n for n in nodes if id(n) in kept_ids]
+        rest = [n for n in nodes if id(n) not in kept_ids]
+
+        name = other_name
+        if parent_name is not None:
+            name = f"{other_name} ({parent_name})"
+        count = sum([n["count"] for n in rest])
+        other = dict(name=name, count=count, rank=rest[0]["rank"])
+        if "counts" in rest[0]:
+            other["counts"] = [sum(c) for c in zip(*[n["counts"] for n in rest])]
+        return keep, other
+
+    new_top_nodes = []
+    stack = [(top_nodes, None, new_top_nodes)]
+    while stack:
+        nodes, parent_name, new_siblings = stack.pop()
+        keep, other = select(nodes, parent_name)
+        for node in keep:
+            new_node = dict(node)
+            children = node.get("children")
+            if children:
+                new_node["children"] = []
+                stack.append((children, node["name"], new_node["children"]))
+            new_siblings.append(new_node)
+        if other is not None:
+            new_siblings.append(other)
+
+    return new_top_nodes
+
+
+# Vectorized aggregation over flattened trees.
+#
+# Trees are flattened to a list of nodes in pre-order, plus arrays of
+# each node's parent index (-1 for top nodes), depth (0 for top nodes)
+# and count. Because parents always come before their children, sums can
+# be pushed up the tree one level at a time. NumPy is used if it is
+# installed, and pure Python otherwise; 'use_numpy=False' forces the
+# latter. The arrays are 'array.array's, as in CompactTree, so that NumPy
+# can use them without copying.
+
+FlatTree = namedtuple("FlatTree", ["nodes", "parents", "depths", "counts"])
+
+
+def _numpy(use_numpy=None):
+    "Return the numpy module, or None if it isn't installed or not wanted."
+    if use_numpy is False:
+        return None
+    try:
+        import numpy
+    except ImportError:
+        if use_numpy:
+            raise
+        return None
+    return numpy
+
+
+def flatten_tree(top_nodes):
+    "Return a FlatTree of all nodes in pre-order, with parents, depths and counts."
+    if isinstance(top_nodes, CompactTree):
+        nodes = list(top_nodes.iter_nodes())
+        parents = array("q", top_nodes.parent)
+        depths = array("q", bytes(8 * len(parents)))
+        for i, p in enumerate(parents):
+            if p != -1:
+                depths[i] = depths[p] + 1
+        return FlatTree(nodes, parents, depths, array("d", top_nodes.count))
+
+    nodes = []
+    parents = array("q")
+    depths = array("q")
+    stack = [(node, -1, 0) for node in reversed(top_nodes)]
+    while stack:
+        node, parent, depth = stack.pop()
+        i = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        depths.append(depth)
+        children = node.get("children")
+        if children:
+            for child in reversed(children):
+                stack.append((child, i, depth + 1))
+
+    counts = array("d", [float(n["count"]) for n in nodes])
+    return FlatTree(nodes, parents, depths, counts)
+
+
+def _arrays(np, flat):
+    "Return (parents, depths, counts) of a FlatTree as NumPy arrays."
+    return (
+        np.frombuffer(flat.parents, dtype=np.int64),
+        np.frombuffer(flat.depths, dtype=np.int64),
+        np.frombuffer(flat.counts, dtype=np.float64),
+    )
+
+
+def subtree_sums(flat, values, *, use_numpy=None):
+    """Return, for each node, the sum of 'values' over it and its descendants.
+
+    'values' has one entry per node of 'flat', e.g. the counts assigned
+    directly to each node by 'unassigned_counts'.
+    """
+    np = _numpy(use_numpy)
+    if np is None:
+        totals = [float(v) for v in values]
+        parents = flat.parents
+        for i in range(len(totals) - 1, -1, -1):
+            p = parents[i]
+            if p != -1:
+                totals[p] += totals[i]
+        return totals
+
+    if not flat.nodes:
+        return []
+    parents, depths, _ = _arrays(np, flat)
+    totals = np.array(values, dtype=np.float64)
+
+    # group the nodes by depth, then add each level into the one above.
+    max_depth = int(depths.max())
+    order = np.argsort(depths, kind="stable")
+    bounds = np.searchsorted(depths[order], np.arange(max_depth + 2))
+    for d in range(max_depth, 0, -1):
+        idx = order[bounds[d] : bounds[d + 1]]
+        totals += np.bincount(parents[idx], weights=totals[idx], minlength=len(totals))
+    return totals.tolist()
+
+
+def unassigned_counts(flat, *, use_numpy=None):
+    """Return, for each node, its count minus the summed counts of its children.
+
+    This is the count assigned to the node itself rather than to any child;
+    'subtree_sums' of these gives back the original counts.
+    """
+    np = _numpy(use_numpy)
+    if np is None:
+        counts = flat.counts
+        own = counts.tolist()
+        for i, p in enumerate(flat.parents):
+            if p != -1:
+                own[p] -= counts[i]
+        return own
+
+    if not flat.nodes:
+        return []
+    parents, _, counts = _arrays(np, flat)
+    has_parent = parents != -1
+    child_sums = np.bincount(
+        parents[has_parent], weights=counts[has_parent], minlength=len(counts)
+    )
+    return (counts - child_sums).tolist()
+
+
+def level_totals(flat, *, use_numpy=None):
+    "Return a list of the summed counts at each depth, starting with the top."
+    np = _numpy(use_numpy)
+    if np is None:
+        totals = [0.0] * (max(flat.depths, default=-1) + 1)
+        for count, depth in zip(flat.counts, flat.depths):
+            totals[depth] += count
+        return totals
+
+    if not flat.nodes:
+        return []
+    _, depths, counts = _arrays(np, flat)
+    return np.bincount(depths, weights=counts).tolist()
+
+
+def rank_totals(top_nodes, *, use_numpy=None):
+    "Return a dictionary of rank => summed count of all nodes at that rank."
+    flat = flatten_tree(top_nodes)
+    rank_ids = {}
+    ids = [rank_ids.setdefault(n["rank"], len(rank_ids)) for n in flat.nodes]
+
+    np = _numpy(use_numpy)
+    if np is None:
+        totals = [0.0] * len(rank_ids)
+        for count, i in zip(flat.counts, ids):
+            totals[i] += count
+    else:
+        totals = np.bincount(ids, weights=flat.counts).tolist() if ids else []
+
+    return {rank: totals[i] for rank, i in rank_ids.items()}
+
+
+def relative_abundance(flat, *, use_numpy=None):
+    "Return each node's count as a fraction of the summed count of the top nodes."
+    # the top counts are summed in Python, in order, so that the result
+    # doesn't depend on whether NumPy is used.
+    np = _numpy(use_numpy)
+    if np is None:
+        total = sum([c for c, p in zip(flat.counts, flat.parents) if p == -1])
+        return [c / total for c in flat.counts]
+
+    parents, _, counts = _arrays(np, flat)
+    total = sum(counts[parents == -1].tolist())
+    return (counts / total).tolist()
+
+
+normalize_methods = ["total", "level"]
+
+
+def normalize_tree_counts(top_nodes, *, by="total", use_numpy=None):
+    """Normalize all the counts in the tree.
+
+    With by="total", divide every count by the sum of the top nodes'
+    counts, giving relative abundances; with by="level", divide every
+    count by the sum of the counts at its depth, so that each layer of
+    the tree sums to 1. Levels with a total of 0 are left at 0.
+
+    NOTE: Changes tree in place. Returns None.
+    """
+    flat = flatten_tree(top_nodes)
+    if by == "total":
+        values = relative_abundance(flat, use_numpy=use_numpy)
+    elif by == "level":
+        totals = level_totals(flat, use_numpy=use_numpy)
+        totals = [t if t else 1.0 for t in totals]
+        np = _numpy(use_numpy)
+        if np is None:
+            values = [c / totals[d] for c, d in zip(flat.counts, flat.depths)]
+        else:
+            _, depths, counts = _arrays(np, flat)
+            values = (counts / np.array(totals)[depths]).tolist()
+    else:
+        raise Exception(f"unknown normalization: '{by}'")
+
+    for node, value in zip(flat.nodes, values):
+        node["count"] = value
 
-    for n in nodes_beneath_top(top_nodes):
-        n["count"] /= sum_counts
@@ -67,3 +67,81 @@ def test_assign_children_empty_superkingdom():
         parsers.assign_children(nodes_by_tax)
 
     assert 'has empty sublineage' in str(e.value)
+
+
+def test_iter_rows_projects_columns(tmp_path):
+    csvfile = tmp_path / "x.csv"
+    csvfile.write_text("a,b,c\n1,2,3\n\n4,5,6\n")
+
+    class P(parsers.GenericParser):
+        columns = ["c", "a"]
+
+    rows = list(P(str(csvfile)).iter_rows())
+    assert rows == [("3", "1"), ("6", "4")]
+
+
+def test_iter_rows_counts_rows(tmp_path):
+    csvfile = tmp_path / "x.csv"
+    csvfile.write_text('a,b\n1,"two\nlines"\n\n3,4\n')
+
+    class P(parsers.GenericParser):
+        columns = ["a", "b"]
+
+    p = P(str(csvfile))
+    rows = list(p.iter_rows())
+    assert rows == [("1", "two\nlines"), ("3", "4")]
+    assert p.n_rows == 2
+
+
+def test_iter_rows_short_row(tmp_path):
+    csvfile = tmp_path / "x.csv"
+    csvfile.write_text("a,b,c\n1,2,3\n4,5\n")
+
+    class P(parsers.GenericParser):
+        columns = ["c", "a"]
+
+    with pytest.raises(ValueError) as e:
+        list(P(str(csvfile)).iter_rows())
+
+    assert "x.csv' line 3" in str(e.value)
+
+
+def test_iter_rows_missing_column(tmp_path):
+    csvfile = tmp_path / "x.csv"
+    csvfile.write_text("lineage,rank\nd__Bacteria,superkingdom\n")
+
+    with pytest.raises(Exception) as e:
+        parsers.parse_csv_summary(str(csvfile))
+
+    assert "missing required column(s)" in str(e.value)
+    assert "f_weighted_at_rank" in str(e.value)
+
+
+def test_lineage_builder_add():
+    builder = parsers.LineageBuilder(parsers.GenericParser.default_ranks)
+    builder.add(["d__A", "p__B"], 2)
+    builder.add(["d__A", "p__C"], 3)
+    builder.add(["d__D"], 1)
+    top_nodes = builder.build()
+
+    assert [n["name"] for n in top_nodes] == ["d__A", "d__D"]
+    a = top_nodes[0]
+    assert a["count"] == 5
+    assert a["rank"] == "superkingdom"
+    assert [(c["name"], c["count"], c["rank"]) for c in a["children"]] == [
+        ("p__B", 2, "phylum"),
+        ("p__C", 3, "phylum"),
+    ]
+    assert top_nodes[1]["children"] == []
+
+
+def test_lineage_builder_add_node_missing_parent():
+    builder = parsers.LineageBuilder(parsers.GenericParser.default_ranks)
+    builder.add_node(["d__A"], dict(name="d__A", count=1, rank="superkingdom"))
+
+    with pytest.raises(AssertionError) as e:
+        builder.add_node(
+            ["d__B", "p__C"], dict(name="p__C", count=1, rank="phylum")
+        )
+
+    assert "missing its parent lineage" in str(e.value)
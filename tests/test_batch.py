@@ -0,0 +1,115 @@
+"Test batch mode."
+
+import os
+import shutil
+
+import taxburst
+from taxburst import batch
+from taxburst_tst_utils import get_example_filepath
+
+
+def test_batch_glob(tmp_path):
+    pattern = get_example_filepath("SRR11125891.summarized.csv")
+    outdir = tmp_path / "out"
+
+    status = taxburst.main(["batch", pattern, "-d", str(outdir)])
+
+    assert status == 0
+    assert os.path.exists(outdir / "SRR11125891.summarized.html")
+
+
+def test_batch_manifest(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    with open(manifest, "wt") as fp:
+        fp.write("input,format,output\n")
+        fp.write(
+            f"{get_example_filepath('SRR11125891.singleM.profile.tsv')},SingleM,\n"
+        )
+        # relative to the manifest's directory.
+        fp.write(f"{get_example_filepath('SRR11125891.krona.tsv')},krona,k.html\n")
+        fp.write(f"{get_example_filepath('SRR11125891.lineages.json')},,\n")
+
+    report = tmp_path / "report.csv"
+    status = taxburst.main(
+        [
+            "batch",
+            "-m",
+            str(manifest),
+            "-F",
+            "json",
+            "-d",
+            str(tmp_path),
+            "--report",
+            str(report),
+        ]
+    )
+
+    assert status == 0
+    assert os.path.exists(tmp_path / "SRR11125891.singleM.html")
+    assert os.path.exists(tmp_path / "k.html")
+    assert os.path.exists(tmp_path / "SRR11125891.lineages.html")
+    with open(report) as fp:
+        assert len(fp.readlines()) == 4
+
+
+def test_batch_failure_does_not_abort(tmp_path, capsys):
+    good = get_example_filepath("SRR11125891.summarized.csv")
+    bad = str(tmp_path / "does-not-exist.csv")
+
+    status = taxburst.main(["batch", bad, good, "-d", str(tmp_path)])
+
+    assert status == 1
+    assert os.path.exists(tmp_path / "SRR11125891.summarized.html")
+    captured = capsys.readouterr()
+    assert "FAILED" in captured.out
+    assert "1 succeeded, 1 failed" in captured.out
+
+
+def test_batch_worker_pool(tmp_path):
+    jobs = [
+        (get_example_filepath("SRR11125891.summarized.csv"), "csv_summary", None),
+        (get_example_filepath("SRR11125891.krona.tsv"), "krona", None),
+    ]
+    results = list(batch.run_batch(jobs, output_dir=str(tmp_path), n_workers=2))
+
+    # results come back as jobs finish, so in any order.
+    assert sorted(r[0] for r in results) == sorted(j[0] for j in jobs)
+    assert [r[3] for r in results] == [None, None]
+    assert os.path.exists(tmp_path / "SRR11125891.summarized.html")
+    assert os.path.exists(tmp_path / "SRR11125891.html")
+
+
+def test_batch_duplicate_outputs(tmp_path, capsys):
+    for subdir in ("a", "b"):
+        os.makedirs(tmp_path / subdir)
+        shutil.copy(
+            get_example_filepath("SRR11125891.summarized.csv"), tmp_path / subdir
+        )
+    outdir = tmp_path / "out"
+
+    status = taxburst.main(
+        ["batch", str(tmp_path / "*" / "*.csv"), "-d", str(outdir)]
+    )
+
+    assert status == -1
+    assert "2 inputs would all be written to" in capsys.readouterr().out
+    assert not os.path.exists(outdir)
+
+
+def crash_worker(input_file, *args):
+    "Stand-in for 'render_one' that kills its worker process."
+    os._exit(1)
+
+
+def test_batch_worker_crash(tmp_path, monkeypatch):
+    # worker processes are forked, and so see the patched 'render_one'.
+    monkeypatch.setattr(batch, "render_one", crash_worker)
+    jobs = [
+        (get_example_filepath("SRR11125891.summarized.csv"), "csv_summary", None),
+        (get_example_filepath("SRR11125891.krona.tsv"), "krona", None),
+    ]
+    results = list(batch.run_batch(jobs, output_dir=str(tmp_path), n_workers=2))
+
+    assert sorted(r[0] for r in results) == sorted(j[0] for j in jobs)
+    for input_file, output_html, seconds, error in results:
+        assert error.startswith("worker process died")
@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import taxburst
+from taxburst import cache, checks
+from taxburst_tst_utils import get_example_filepath
+
+
+def test_cache_hit(tmp_path):
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    tc = cache.TreeCache(tmp_path / "cache")
+
+    top_nodes, name, xtra = tc.parse_file(path, "csv_summary")
+    assert (tc.hits, tc.misses) == (0, 1)
+
+    top_nodes2, name2, xtra2 = tc.parse_file(path, "csv_summary")
+    assert (tc.hits, tc.misses) == (1, 1)
+    assert name2 == name == "SRR11125891.summarized"
+    assert top_nodes2 == top_nodes
+    assert checks.trees_are_equal(top_nodes, top_nodes2)
+
+
+def test_cache_key_changes(tmp_path):
+    path = tmp_path / "x.csv"
+    shutil.copy(get_example_filepath("SRR11125891.summarized.csv"), path)
+    tc = cache.TreeCache(tmp_path / "cache")
+
+    key = tc.key(path, "csv_summary")
+    assert tc.key(path, "csv_summary") == key
+    assert tc.key(path, "krona") != key
+
+    with open(path, "a") as fp:
+        fp.write("\n")
+    assert tc.key(path, "csv_summary") != key
+
+
+def test_cache_eviction(tmp_path):
+    tc = cache.TreeCache(tmp_path)
+    tc.put("a", ([], "a", None))
+    tc.put("b", ([], "b", None))
+    os.utime(tmp_path / "a.tree", (1, 1))
+    os.utime(tmp_path / "b.tree", (2, 2))
+
+    # reading 'a' marks it as recently used, so 'b' is evicted.
+    assert tc.get("a") == ([], "a", None)
+    tc.max_bytes = os.path.getsize(tmp_path / "a.tree")
+    tc.trim()
+    assert tc.get("b") is None
+    assert tc.get("a") is not None
+
+
+def test_cache_bad_entry(tmp_path):
+    tc = cache.TreeCache(tmp_path)
+    (tmp_path / "a.tree").write_bytes(b"not a pickle")
+    assert tc.get("a") is None
+
+
+def test_cache_entry_removed_while_reading(tmp_path, monkeypatch):
+    tc = cache.TreeCache(tmp_path)
+    tc.put("a", ([], "a", None))
+
+    def utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    # e.g. another process trims the entry just after it is read.
+    monkeypatch.setattr(os, "utime", utime)
+    assert tc.get("a") == ([], "a", None)
+
+
+def test_main_cache_dir(tmp_path):
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    cache_dir = tmp_path / "cache"
+    for i in range(2):
+        output = tmp_path / f"out{i}.html"
+        taxburst.main(
+            [path, "-F", "tax_annotate", "-o", str(output), "--cache-dir", str(cache_dir)]
+        )
+    assert len(os.listdir(cache_dir)) == 1
+    assert (tmp_path / "out0.html").read_text() == (tmp_path / "out1.html").read_text()
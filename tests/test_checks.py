@@ -32,3 +32,49 @@ def test_check_structure_2():
 def test_check_fail_if_tree_shares_objects():
     with pytest.raises(AssertionError):
         checks.trees_are_equal(good_nodes, good_nodes)
+
+
+def test_validate_ok():
+    report = checks.validate(good_nodes, timings=True)
+    assert report.ok
+    assert set(report.timings) == set(checks.validation_rules)
+
+
+def test_validate_findings():
+    bad = checks.copy_tree(good_nodes)
+    bad[0]["count"] = 2  # less than children
+    bad[0]["children"][0]["name"] = "C"  # duplicate
+    del bad[0]["children"][1]["rank"]
+
+    report = checks.validate(bad)
+    assert not report.ok
+    rules = sorted(f.rule for f in report.findings)
+    assert rules == ["count_consistency", "duplicate_names", "missing_fields"]
+
+    # unknown ranks are ignored by rank_order; known ones are checked.
+    bad[0]["rank"] = "phylum"
+    bad[0]["children"][1]["rank"] = "superkingdom"
+    report = checks.validate(bad, rules=["rank_order"])
+    assert [f.name for f in report.findings] == ["C"]
+
+
+def test_validate_empty_name():
+    bad = checks.copy_tree(good_nodes)
+    bad[0]["children"][0]["name"] = ""
+    report = checks.validate(bad)
+    assert [f.rule for f in report.findings] == ["empty_names"]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_check_all_counts_warning(capsys, compact):
+    bad = checks.copy_tree(good_nodes)
+    bad[0]["count"] = 2
+    if compact:
+        bad = checks.CompactTree.from_nodes(bad)
+
+    checks.check_all_counts(bad, fail_on_error=False)
+    out = capsys.readouterr().out
+    assert out == (
+        "WARNING: parent node A has count 2.0, but nodes beneath sum to 4\n"
+        "[3, 1]\n"
+    )
@@ -0,0 +1,137 @@
+"Test the compact array-backed tree representation."
+
+import pytest
+
+from taxburst import checks, parsers, tree_utils, output
+from taxburst.compact import CompactTree
+from taxburst_tst_utils import get_example_filepath
+
+good_nodes = [
+    {
+        "name": "A",
+        "count": 5,
+        "score": 0.831,
+        "rank": "Phylum",
+        "children": [
+            {"name": "B", "count": 3, "score": 0.2, "rank": "Class"},
+            {"name": "C", "count": 1.5, "rank": "Class", "children": []},
+        ],
+    },
+    {"name": "D", "count": 2, "rank": "Phylum"},
+]
+
+examples = [
+    ("SRR11125891.summarized.csv", "csv_summary"),
+    ("SRR11125891.t0.gather.with-lineages.csv", "tax_annotate"),
+    ("SRR11125891.singleM.profile.tsv", "SingleM"),
+    ("SRR11125891.krona.tsv", "krona"),
+    ("SRR11125891.lineages.json", "json"),
+]
+
+
+def test_roundtrip_simple():
+    tree = CompactTree.from_nodes(good_nodes)
+    assert tree.n_nodes == 4
+    assert len(tree) == 2
+    assert tree.to_nodes() == good_nodes
+
+    # int-ness of counts is kept
+    assert type(tree.to_nodes()[0]["count"]) is int
+    assert type(tree.to_nodes()[0]["children"][1]["count"]) is float
+
+
+def test_count_conversion():
+    nodes = [
+        {"name": "A", "count": "2.5", "rank": "Phylum"},
+        {"name": "B", "count": 2**53 + 1, "rank": "Phylum"},
+    ]
+    tree = CompactTree.from_nodes(nodes)
+    assert tree[0]["count"] == 2.5
+
+    # stored as a float: large ints lose precision, but stay ints.
+    assert tree[1]["count"] == 2**53
+    assert type(tree[1]["count"]) is int
+
+    tree[0]["count"] = "7"
+    assert tree[0]["count"] == 7.0
+
+
+@pytest.mark.parametrize("filename,input_format", examples)
+def test_roundtrip_examples(filename, input_format):
+    top_nodes, name, xtra = parsers.parse_file(
+        get_example_filepath(filename), input_format
+    )
+    tree = CompactTree.from_nodes(top_nodes)
+
+    assert tree.to_nodes() == top_nodes
+    assert tree.n_nodes == len(tree_utils.collect_all_nodes(top_nodes))
+
+
+def test_views_behave_like_dicts():
+    tree = CompactTree.from_nodes(good_nodes)
+    a = tree[0]
+
+    assert a["name"] == "A"
+    assert a.get("score") == 0.831
+    assert a.get("missing") is None
+    assert [c["name"] for c in a["children"]] == ["B", "C"]
+    assert "children" not in tree[1]
+    assert tree[1].get("children", []) == []
+    assert dict(a["children"][0]) == good_nodes[0]["children"][0]
+
+    with pytest.raises(TypeError):
+        a["children"] = []
+
+
+def test_tree_utils_accept_compact():
+    tree = CompactTree.from_nodes(good_nodes)
+
+    names = [n["name"] for n in tree_utils.nodes_beneath_top(tree)]
+    assert names == ["A", "B", "C", "D"]
+    names = [n["name"] for n in tree_utils.nodes_beneath(tree[0], recurse=True)]
+    assert names == ["B", "C"]
+
+    copy = tree_utils.copy_tree(tree)
+    assert checks.trees_are_equal(tree, copy)
+
+    tree_utils.normalize_tree_counts(copy)
+    assert copy[0]["count"] == 5 / 7
+    assert tree[0]["count"] == 5
+
+
+@pytest.mark.parametrize("filename,input_format", examples)
+def test_prune_tree_accepts_compact(filename, input_format):
+    top_nodes, name, xtra = parsers.parse_file(
+        get_example_filepath(filename), input_format
+    )
+    tree = CompactTree.from_nodes(top_nodes)
+
+    expected = tree_utils.prune_tree(top_nodes, min_fraction=0.01, max_children=3)
+    pruned = tree_utils.prune_tree(tree, min_fraction=0.01, max_children=3)
+    assert checks.trees_are_equal(pruned, expected)
+
+
+def test_checks_accept_compact():
+    tree = CompactTree.from_nodes(good_nodes)
+    checks.check_structure(tree)
+    checks.check(tree)
+
+    bad = tree_utils.copy_tree(tree)
+    bad[0]["children"][1]["name"] = "B"
+    with pytest.raises(AssertionError):
+        checks.check_structure(bad)
+
+    bad = tree_utils.copy_tree(tree)
+    bad[0]["count"] = 1
+    with pytest.raises(Exception):
+        checks.check_all_counts(bad, fail_on_error=True)
+
+
+def test_generate_html_accepts_compact():
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    top_nodes, name, xtra = parsers.parse_file(path, "tax_annotate")
+    tree = CompactTree.from_nodes(top_nodes)
+
+    expected = output.generate_html(top_nodes, name=name, extra_attributes=xtra)
+    content = output.generate_html(tree, name=name, extra_attributes=xtra)
+    assert content == expected
@@ -0,0 +1,66 @@
+import bz2
+import gzip
+import lzma
+import shutil
+
+import pytest
+
+import taxburst
+from taxburst import fileio, parsers, checks
+from taxburst_tst_utils import get_example_filepath
+
+compressors = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def compress_to(src, dest):
+    with open(src, "rb") as infp, compressors[dest.suffix](dest, "wb") as outfp:
+        shutil.copyfileobj(infp, outfp)
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz"])
+def test_parse_compressed(tmp_path, suffix):
+    path = get_example_filepath("SRR11125891.singleM.profile.tsv")
+    dest = tmp_path / ("SRR11125891.singleM.profile.tsv" + suffix)
+    compress_to(path, dest)
+
+    assert fileio.detect_compression(dest) == {
+        ".gz": "gzip",
+        ".bz2": "bz2",
+        ".xz": "xz",
+    }[suffix]
+
+    top_nodes, name, _ = parsers.parse_file(str(dest), "SingleM")
+    assert name == "SRR11125891.singleM"
+
+    orig, _, _ = parsers.parse_file(path, "SingleM")
+    assert checks.trees_are_equal(orig, top_nodes)
+
+
+def test_detect_by_content_not_name(tmp_path):
+    # a gzipped file without a .gz suffix is still detected.
+    path = get_example_filepath("SRR11125891.lineages.json")
+    dest = tmp_path / "lineages.json"
+    with open(path, "rb") as infp, gzip.open(dest, "wb") as outfp:
+        shutil.copyfileobj(infp, outfp)
+
+    assert fileio.detect_compression(dest) == "gzip"
+    top_nodes, _, _ = parsers.parse_file(str(dest), "json")
+    assert len(top_nodes) == 4
+
+    assert fileio.detect_compression(path) is None
+
+
+def test_main_compressed_outputs(tmp_path):
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    html = tmp_path / "xxx.html.gz"
+    save = tmp_path / "xxx.jsonl.bz2"
+    taxburst.main([path, "-o", str(html), "--save-json", str(save)])
+
+    with gzip.open(html, "rt") as fp:
+        assert fp.read().startswith("<!DOCTYPE html")
+
+    # saved as compressed jsonl, based on the suffix before '.bz2'.
+    top_nodes, name, _ = parsers.parse_file(str(save), "jsonl")
+    assert name == "xxx"
+    orig, _, _ = parsers.parse_file(path, "csv_summary")
+    assert checks.trees_are_equal(orig, top_nodes)
@@ -0,0 +1,157 @@
+"Test immutable trees with structural sharing."
+
+import io
+import pickle
+
+import pytest
+
+from taxburst import checks, parsers, tree_utils, output, jsonio
+from taxburst.frozen import freeze, thaw, replace, is_frozen
+from taxburst_tst_utils import get_example_filepath
+
+good_nodes = [
+    {
+        "name": "A",
+        "count": 5,
+        "score": 0.831,
+        "rank": "phylum",
+        "children": [
+            {"name": "B", "count": 3, "score": 0.2, "rank": "class"},
+            {"name": "C", "count": 2, "rank": "class", "children": []},
+        ],
+    },
+    {"name": "D", "count": 2, "rank": "phylum", "counts": [1, 1]},
+]
+
+examples = [
+    ("SRR11125891.summarized.csv", "csv_summary"),
+    ("SRR11125891.t0.gather.with-lineages.csv", "tax_annotate"),
+    ("SRR11125891.singleM.profile.tsv", "SingleM"),
+    ("SRR11125891.krona.tsv", "krona"),
+    ("SRR11125891.lineages.json", "json"),
+]
+
+
+def test_freeze_thaw_roundtrip():
+    tree = freeze(good_nodes)
+    assert is_frozen(tree)
+    assert not is_frozen(good_nodes)
+    assert isinstance(tree[0]["children"], tuple)
+    assert tree[1]["counts"] == (1, 1)
+    assert thaw(tree) == good_nodes
+
+    # freezing again shares everything
+    again = freeze(tree)
+    assert again is not tree
+    assert all(a is b for a, b in zip(again, tree))
+
+
+def test_frozen_nodes_are_immutable():
+    tree = freeze(good_nodes)
+    a = tree[0]
+    with pytest.raises(TypeError):
+        a["count"] = 1
+    with pytest.raises(TypeError):
+        a["children"][0] = a
+    assert dict(a["children"][0]) == good_nodes[0]["children"][0]
+    assert a.get("missing") is None
+    assert "score" in a
+    assert pickle.loads(pickle.dumps(tree)) == tree
+
+
+def test_evolve_shares_children():
+    a = freeze(good_nodes)[0]
+    b = a.evolve(count=6)
+    assert b["count"] == 6
+    assert a["count"] == 5
+    assert b["children"] is a["children"]
+
+
+def test_replace_copies_only_path():
+    tree = freeze(good_nodes)
+    new_tree = replace(tree, ["A", "B"], count=4)
+
+    assert new_tree[0]["children"][0]["count"] == 4
+    assert tree[0]["children"][0]["count"] == 3
+    assert new_tree[0] is not tree[0]
+    assert new_tree[0]["children"][1] is tree[0]["children"][1]
+    assert new_tree[1] is tree[1]
+
+    assert not checks.trees_are_equal(tree, new_tree)
+
+    with pytest.raises(Exception):
+        replace(tree, ["A", "nope"], count=1)
+
+
+def test_copy_tree_shares_frozen_nodes():
+    tree = freeze(good_nodes)
+    copy = tree_utils.copy_tree(tree)
+    assert copy is not tree
+    assert copy[0] is tree[0]
+    assert checks.trees_are_equal(tree, copy)
+
+    # ...but sharing mutable nodes is still caught.
+    with pytest.raises(AssertionError):
+        checks.trees_are_equal(good_nodes, list(good_nodes))
+
+
+def test_augment_tree_frozen_shares_unchanged():
+    tree1 = freeze(good_nodes)
+    other = [
+        {
+            "name": "A",
+            "count": 1,
+            "rank": "phylum",
+            "children": [{"name": "E", "count": 1, "rank": "class"}],
+        },
+        {"name": "F", "count": 1, "rank": "phylum"},
+    ]
+    aug = tree_utils.augment_tree(tree1, [other])
+
+    assert is_frozen(aug)
+    assert [n["name"] for n in aug] == ["A", "D", "F"]
+    assert [c["name"] for c in aug[0]["children"]] == ["B", "C", "E"]
+    assert aug[0]["children"][0] is tree1[0]["children"][0]
+    assert aug[1] is tree1[1]
+    assert len(tree1[0]["children"]) == 2  # original is unchanged
+
+
+@pytest.mark.parametrize("filename,input_format", examples)
+def test_frozen_examples(filename, input_format):
+    path = get_example_filepath(filename)
+    top_nodes, name, xtra = parsers.parse_file(path, input_format)
+    tree = freeze(top_nodes)
+    assert thaw(tree) == top_nodes
+
+    checks.check_structure(tree)
+    assert checks.trees_are_equal(top_nodes, tree)
+
+    expected = output.generate_html(top_nodes, name=name, extra_attributes=xtra)
+    content = output.generate_html(tree, name=name, extra_attributes=xtra)
+    assert content == expected
+
+    fp1, fp2 = io.StringIO(), io.StringIO()
+    jsonio.dump_tree(top_nodes, fp1)
+    jsonio.dump_tree(tree, fp2)
+    assert fp1.getvalue() == fp2.getvalue()
+
+
+def test_augment_tree_frozen_examples():
+    tree1 = parsers.parse_file(
+        get_example_filepath("SRR11125891.singleM.profile.tsv"), "SingleM"
+    )[0]
+    tree2 = parsers.parse_file(
+        get_example_filepath("SRR11125891.summarized.csv"), "csv_summary"
+    )[0]
+
+    expected = tree_utils.augment_tree(tree1, [tree2])
+    frozen1 = freeze(tree1)
+    aug = tree_utils.augment_tree(frozen1, [tree2])
+    assert checks.trees_are_equal(expected, aug)
+    assert checks.trees_are_equal(frozen1, freeze(tree1))
+
+    # only the changed paths are new nodes.
+    old_ids = {id(n) for n in tree_utils.nodes_beneath_top(frozen1)}
+    aug_nodes = tree_utils.collect_all_nodes(aug)
+    n_new = sum(1 for n in aug_nodes if id(n) not in old_ids)
+    assert 0 < n_new < len(aug_nodes)
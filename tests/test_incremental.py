@@ -0,0 +1,132 @@
+"Test incremental re-rendering."
+
+import csv
+import io
+
+import pytest
+
+import taxburst
+from taxburst import incremental, output, parsers
+from taxburst_tst_utils import get_example_filepath
+
+example = "SRR11125891.t0.gather.with-lineages.csv"
+
+
+def load_rows():
+    with open(get_example_filepath(example), newline="") as fp:
+        return list(csv.DictReader(fp))
+
+
+def parse_rows(tmp_path, rows):
+    "Write rows as a 'tax annotate' CSV, and parse it."
+    filename = tmp_path / "sample.csv"
+    with open(filename, "w", newline="") as fp:
+        w = csv.DictWriter(fp, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    return parsers.parse_file(str(filename), "tax_annotate")
+
+
+def render(top_nodes, state_file, **kwargs):
+    fp = io.StringIO()
+    stats = incremental.write_html(top_nodes, fp, state_file=state_file, **kwargs)
+    return fp.getvalue(), stats
+
+
+def check_render(top_nodes, state_file, **kwargs):
+    "Render incrementally; check it matches a full render, and return stats."
+    content, stats = render(top_nodes, state_file, **kwargs)
+    assert content == output.generate_html(top_nodes, **kwargs)
+    return stats
+
+
+@pytest.mark.parametrize("viewer", output.viewer_modes)
+def test_incremental_unchanged(tmp_path, viewer):
+    top_nodes, name, xtra = parsers.parse_file(
+        get_example_filepath(example), "tax_annotate"
+    )
+    state_file = str(tmp_path / "out.html.state")
+    opts = dict(name=name, extra_attributes=xtra, viewer=viewer)
+
+    stats = check_render(top_nodes, state_file, **opts)
+    assert stats["formatted"] == stats["nodes"]
+
+    stats = check_render(top_nodes, state_file, **opts)
+    assert stats["formatted"] == 0
+
+
+def test_incremental_changed_counts(tmp_path):
+    rows = load_rows()
+    state_file = str(tmp_path / "out.html.state")
+    top_nodes, name, xtra = parse_rows(tmp_path, rows)
+    check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+
+    for i in (10, 500, 1000):
+        rows[i]["n_unique_weighted_found"] = str(
+            int(rows[i]["n_unique_weighted_found"]) + 5000
+        )
+    top_nodes, name, xtra = parse_rows(tmp_path, rows)
+    stats = check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+    assert 0 < stats["formatted"] < stats["nodes"] / 10
+
+
+def test_incremental_added_and_removed(tmp_path):
+    rows = load_rows()
+    state_file = str(tmp_path / "out.html.state")
+    top_nodes, name, xtra = parse_rows(tmp_path, rows)
+    check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+
+    # a new genome, at the end...
+    new_row = dict(rows[-1])
+    new_row["name"] = "GCA_000000000.1 new genome"
+    rows.append(new_row)
+    top_nodes, name, xtra = parse_rows(tmp_path, rows)
+    stats = check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+    assert stats["formatted"] < stats["nodes"]
+
+    # ...and one removed, near the start.
+    del rows[3]
+    top_nodes, name, xtra = parse_rows(tmp_path, rows)
+    check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+
+
+def test_incremental_options_changed(tmp_path):
+    top_nodes, name, xtra = parsers.parse_file(
+        get_example_filepath(example), "tax_annotate"
+    )
+    state_file = str(tmp_path / "out.html.state")
+    check_render(top_nodes, state_file, name=name, extra_attributes=xtra)
+
+    stats = check_render(top_nodes, state_file, name="other", extra_attributes=xtra)
+    assert stats["formatted"] == 0  # the node XML is the same
+
+    stats = check_render(top_nodes, state_file, name="other")
+    assert stats["formatted"] == stats["nodes"]
+
+
+def test_incremental_bad_state(tmp_path, capsys):
+    top_nodes, name, xtra = parsers.parse_file(
+        get_example_filepath(example), "tax_annotate"
+    )
+    state_file = tmp_path / "out.html.state"
+    state_file.write_bytes(b"not a pickle")
+
+    stats = check_render(top_nodes, str(state_file), name=name)
+    assert stats["formatted"] == stats["nodes"]
+    assert "WARNING: ignoring bad state file" in capsys.readouterr().out
+
+
+def test_incremental_main(tmp_path):
+    path = get_example_filepath(example)
+    output_html = tmp_path / "out.html"
+    args = [path, "-F", "tax_annotate", "-o", str(output_html), "--incremental"]
+
+    taxburst.main(args)
+    first = output_html.read_text()
+    assert (tmp_path / "out.html.state").exists()
+
+    taxburst.main(args)
+    assert output_html.read_text() == first
+
+    with pytest.raises(SystemExit):
+        taxburst.main(args + [path])
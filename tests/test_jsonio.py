@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+import taxburst
+from taxburst import jsonio, parsers, checks
+from taxburst_tst_utils import get_example_filepath
+
+nodes = [
+    {
+        "name": "A",
+        "count": 5,
+        "rank": "Phylum",
+        "children": [
+            {"name": "B", "count": 3, "score": 0.2, "rank": "Class"},
+            {"name": "C", "count": 1, "rank": "Class", "children": []},
+        ],
+    },
+    {"name": "D", "count": 1.5, "rank": "Phylum"},
+]
+
+
+def test_dump_tree():
+    fp = io.StringIO()
+    jsonio.dump_tree(nodes, fp)
+    assert json.loads(fp.getvalue()) == nodes
+
+
+def test_dump_tree_chunks():
+    # small chunks must join up into the same JSON.
+    chunks = list(jsonio.iter_tree_json(nodes, chunk_size=1))
+    assert len(chunks) > 1
+    assert json.loads("".join(chunks)) == nodes
+
+
+def test_dump_tree_empty():
+    assert json.loads("".join(jsonio.iter_tree_json([]))) == []
+
+
+def test_jsonl_roundtrip():
+    fp = io.StringIO()
+    jsonio.dump_jsonl(nodes, fp)
+    lines = fp.getvalue().splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[1]) == {
+        "id": 1,
+        "parent": 0,
+        "name": "B",
+        "count": 3,
+        "score": 0.2,
+        "rank": "Class",
+    }
+
+    fp.seek(0)
+    loaded = jsonio.load_jsonl(fp)
+    assert checks.trees_are_equal(nodes, loaded)
+    assert loaded[0]["children"][1] == {"name": "C", "count": 1, "rank": "Class"}
+
+
+def test_jsonl_parent_missing():
+    fp = io.StringIO('{"id": 1, "parent": 0, "name": "B"}\n')
+    with pytest.raises(Exception, match="before its parent"):
+        jsonio.load_jsonl(fp)
+
+
+def test_main_save_jsonl(tmp_path):
+    path = get_example_filepath("SRR11125891.lineages.json")
+    output = tmp_path / "xxx.jsonl"
+    taxburst.main([path, "-F", "json", "--save-json", str(output)])
+
+    top_nodes, name, _ = parsers.parse_file(str(output), "jsonl")
+    assert name == "xxx"
+    orig, _, _ = parsers.parse_file(path, "json")
+    assert checks.trees_are_equal(orig, top_nodes)
+
+    html = tmp_path / "xxx.html"
+    taxburst.main([str(output), "-F", "jsonl", "-o", str(html)])
+    assert html.exists()
@@ -30,6 +30,7 @@ def test_output_required(tmp_path):
         taxburst.main([path, "-F", "json"])
 
     assert e.value.code == -1
+    assert not os.path.exists(output)
 
 
 def test_output_json_ok(tmp_path):
@@ -86,3 +87,218 @@ def test_krona(tmp_path):
     taxburst.main([path, "-o", str(output), "-F", "krona", "--check-tree"])
 
     assert os.path.exists(output)
+
+
+def test_merge(tmp_path):
+    import json
+
+    paths = [
+        get_example_filepath("SRR11125891.summarized.csv"),
+        get_example_filepath("SRR11125891.summarized.csv"),
+    ]
+    output = tmp_path / "cohort.json"
+    status = taxburst.main(
+        ["merge", *paths, "-o", str(output), "--names", "s1", "s2"]
+    )
+
+    assert status == 0
+    with open(output) as fp:
+        cohort = json.load(fp)
+    assert cohort["samples"] == ["s1", "s2"]
+    for node in cohort["nodes"]:
+        assert node["counts"][0] == node["counts"][1]
+        assert node["count"] == sum(node["counts"])
+
+    # the cohort tree can be read back in, and rendered.
+    top_nodes, name, xtra = parsers.parse_file(str(output), "json")
+    assert top_nodes == cohort["nodes"]
+    output_html = tmp_path / "cohort.html"
+    taxburst.main([str(output), "-F", "json", "-o", str(output_html)])
+    assert os.path.exists(output_html)
+
+
+def test_multiple_datasets(tmp_path):
+    path = get_example_filepath("SRR11125891.singleM.profile.tsv")
+    output = tmp_path / "xxx.html"
+    output_json = tmp_path / "xxx.json"
+    taxburst.main(
+        [
+            path,
+            path,
+            "-o",
+            str(output),
+            "-F",
+            "SingleM",
+            "--save-json",
+            str(output_json),
+            "--check-tree",
+        ]
+    )
+
+    assert os.path.exists(output)
+    content = output.read_text()
+    assert content.count("<dataset>SRR11125891.singleM</dataset>") == 2
+    assert os.path.exists(output_json)
+
+
+def test_viewer_external(tmp_path):
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    output = tmp_path / "xxx.html"
+    taxburst.main(
+        [path, "-o", str(output), "--viewer", "external", "--asset-url", "/static"]
+    )
+
+    content = output.read_text()
+    assert '<script src="/static/taxburst-viewer.' in content
+    assert len(list(tmp_path.glob("taxburst-viewer.*.js"))) == 1
+
+
+def test_prune_options(tmp_path):
+    import json
+
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    output = tmp_path / "xxx.json"
+    taxburst.main(
+        [
+            path,
+            "-F",
+            "tax_annotate",
+            "--save-json",
+            str(output),
+            "--min-fraction",
+            "0.05",
+        ]
+    )
+
+    with open(output) as fp:
+        top_nodes = json.load(fp)
+    assert len(checks.collect_all_nodes(top_nodes)) < 100
+
+
+def test_normalize_option(tmp_path):
+    import json
+
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    output = tmp_path / "xxx.json"
+    taxburst.main([path, "--save-json", str(output), "--normalize", "total"])
+
+    with open(output) as fp:
+        top_nodes = json.load(fp)
+    assert sum(n["count"] for n in top_nodes) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("data_format", ["xml", "json"])
+def test_normalize_option_html(tmp_path, data_format):
+    # normalized counts are all below 1; they shouldn't be rendered as 0.0.
+    import re
+    import json
+
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    output = tmp_path / "xxx.html"
+    taxburst.main(
+        [path, "-F", "tax_annotate", "-o", str(output), "--normalize", "total"]
+        + ["--data-format", data_format]
+    )
+
+    with open(output) as fp:
+        html = fp.read()
+
+    if data_format == "xml":
+        counts = [float(c) for c in re.findall(r"<count><val>(.*?)</val>", html)]
+    else:
+        m = re.search(r'<script type="application/json"[^>]*>(.*?)</script>', html)
+        counts = json.loads(m.group(1))["counts"]
+    assert len(counts) > 1000
+    assert all(0 < c <= 1 for c in counts)
+
+
+def test_stdin_to_stdout(monkeypatch, capsys):
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    with open(path, "rb") as fp:
+        monkeypatch.setattr("sys.stdin", fp)
+        taxburst.main(["-", "-o", "-", "--name", "from_pipe", "--check-tree"])
+
+    out, err = capsys.readouterr()
+    assert out.startswith("<!DOCTYPE html")
+    assert '<node name="from_pipe">' in out
+    # messages go to stderr, so they don't end up in the HTML.
+    assert "WARNING" not in out
+    assert "wrote output to '-'" in err
+
+
+def test_stdin_json_to_stdout(monkeypatch, capsys):
+    import json
+
+    path = get_example_filepath("SRR11125891.lineages.json")
+    with open(path, "rb") as fp:
+        monkeypatch.setattr("sys.stdin", fp)
+        taxburst.main(["-F", "json", "-", "--save-json", "-"])
+
+    out, err = capsys.readouterr()
+    with open(path) as fp:
+        assert json.loads(out) == json.load(fp)
+
+
+def test_stdout_with_timings():
+    # in a new process, so that nothing has captured stdout beforehand.
+    import subprocess
+    import sys
+
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    proc = subprocess.run(
+        [sys.executable, "-m", "taxburst", path, "-o", "-", "--timings"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert proc.stdout.startswith("<!DOCTYPE html")
+    assert proc.stdout.rstrip().endswith("</html>")
+    assert "peak RSS MB" in proc.stderr
+
+
+def test_two_stdouts_fail():
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    with pytest.raises(SystemExit):
+        taxburst.main([path, "-o", "-", "--save-json", "-"])
+
+
+def test_check_tree_warnings(tmp_path, capsys):
+    import json
+
+    # B's count is too small; C's rank is out of order, which is not
+    # one of the --check-tree checks.
+    tree = [
+        {
+            "name": "A",
+            "count": 5,
+            "rank": "phylum",
+            "children": [
+                {
+                    "name": "B",
+                    "count": 1,
+                    "rank": "class",
+                    "children": [{"name": "C", "count": 3, "rank": "phylum"}],
+                },
+            ],
+        },
+    ]
+    path = tmp_path / "tree.json"
+    path.write_text(json.dumps(tree))
+    output = tmp_path / "out.html"
+
+    taxburst.main([str(path), "-F", "json", "-o", str(output), "--check-tree"])
+    out = capsys.readouterr().out
+    assert "WARNING: parent node B has count 1.0, but nodes beneath sum to 3\n[3]\n" in out
+    assert "rank" not in out
+
+    with pytest.raises(Exception) as e:
+        taxburst.main([str(path), "-F", "json", "-o", str(output), "--fail-on-error"])
+    assert "some counts do not make sense" in str(e.value)
+
+    # structure problems are errors, not assertions.
+    tree[0]["children"][0]["name"] = "A"
+    path.write_text(json.dumps(tree))
+    with pytest.raises(Exception) as e:
+        taxburst.main([str(path), "-F", "json", "-o", str(output), "--check-tree"])
+    assert e.type is Exception
+    assert "duplicate name: 'A'" in str(e.value)
@@ -0,0 +1,207 @@
+"Test the HTML output code."
+
+import io
+
+import pytest
+
+from taxburst import output, parsers
+from taxburst_tst_utils import get_example_filepath
+
+good_nodes = [
+    {
+        "name": "A",
+        "count": 5,
+        "score": 0.831,
+        "rank": "Phylum",
+        "children": [
+            {"name": "B", "count": 3, "score": 0.2, "rank": "Class"},
+            {"name": "C", "count": 1, "score": 0.1, "rank": "Class"},
+        ],
+    },
+]
+
+
+def test_write_html_basic():
+    fp = io.StringIO()
+    output.write_html(good_nodes, fp, name="test")
+    content = fp.getvalue()
+
+    assert '<node name="test">' in content
+    assert '<node name="A">' in content
+    assert '<node name="B">' in content
+    assert '<node name="C">' in content
+    assert content.rstrip().endswith("</html>")
+
+
+def test_write_html_extra_attributes():
+    fp = io.StringIO()
+    output.write_html(good_nodes, fp, extra_attributes={"score": 'display="Score"'})
+    content = fp.getvalue()
+
+    assert "<score><val>0.831</val></score>" in content
+    assert "<score><val>0.2</val></score>" in content
+
+
+def test_iter_node_xml_is_lazy():
+    chunks = output.iter_node_xml(good_nodes, [], chunk_size=1)
+    first = next(chunks)
+    assert first.lstrip().startswith('<node name="A">')
+    assert "B" not in first
+
+
+def test_write_html_matches_generate_html():
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    top_nodes, name, xtra = parsers.parse_file(path, "tax_annotate")
+
+    fp = io.StringIO()
+    output.write_html(top_nodes, fp, name=name, extra_attributes=xtra)
+    streamed = fp.getvalue()
+    content = output.generate_html(top_nodes, name=name, extra_attributes=xtra)
+
+    assert streamed == content
+
+
+def test_node_ids_are_deterministic():
+    xml1 = output.make_node_xml(good_nodes[0], [])
+    xml2 = output.make_node_xml(good_nodes[0], [])
+    assert xml1 == xml2
+    assert "node1.members.0.js" in xml1
+    assert "node3.members.0.js" in xml1
+
+
+def test_deep_tree_no_recursion_limit():
+    import sys
+
+    depth = sys.getrecursionlimit() + 100
+    top = node = dict(name="n0", count=1, rank="x")
+    for i in range(1, depth):
+        child = dict(name=f"n{i}", count=1, rank="x")
+        node["children"] = [child]
+        node = child
+
+    xml = "".join(output.iter_node_xml([top], []))
+    assert xml.count("<node ") == depth
+    assert xml.count("</node>") == depth
+
+
+def test_generate_html_in_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    path = get_example_filepath("SRR11125891.summarized.csv")
+    top_nodes, name, xtra = parsers.parse_file(path, "csv_summary")
+    expected = output.generate_html(top_nodes, name=name)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(
+            pool.map(lambda _: output.generate_html(top_nodes, name=name), range(8))
+        )
+
+    for content in results:
+        assert content == expected
+
+
+def test_write_multi_html():
+    other = [
+        {"name": "A", "count": 2, "rank": "Phylum"},
+        {"name": "D", "count": 7, "score": 0.5, "rank": "Phylum"},
+    ]
+    content = output.generate_multi_html(
+        [good_nodes, other],
+        dataset_names=["first", "second"],
+        extra_attributes={"score": 'display="Score"'},
+    )
+
+    assert "<dataset>first</dataset><dataset>second</dataset>" in content
+    assert "<count><val>5.0</val><val>9.0</val></count>" in content
+    assert "<count><val>5.0</val><val>2.0</val></count>" in content
+    assert "<count><val>0.0</val><val>7.0</val></count>" in content
+    assert "<score><val>0.831</val><val></val></score>" in content
+    assert "<rank><val>Class</val><val>Class</val></rank>" in content
+    assert content.count('<node name="D">') == 1
+
+
+def test_viewer_assets_are_split_out():
+    names = output.viewer_asset_names()
+    assert set(names) == {"js", "favicon", "hiddenImage", "loadingImage", "logo"}
+    assert names["js"].startswith("taxburst-viewer.")
+    assert names["js"].endswith(".js")
+
+
+def test_write_html_external(tmp_path):
+    output_html = tmp_path / "reports" / "x.html"
+    asset_dir = tmp_path / "assets"
+    output_html.parent.mkdir()
+
+    viewer_args = output.prepare_viewer(
+        "external", str(output_html), asset_dir=str(asset_dir)
+    )
+    assert viewer_args["asset_url"] == "../assets/"
+    with open(output_html, "wt") as fp:
+        output.write_html(good_nodes, fp, **viewer_args)
+
+    content = output_html.read_text()
+    inline = output.generate_html(good_nodes)
+    assert len(content) < len(inline) / 20
+
+    js = output.viewer_asset_names()["js"]
+    assert f'<script src="../assets/{js}"></script>' in content
+    assert '<node name="A">' in content
+
+    # the JS asset is exactly the script from the self-contained page.
+    js_content = (asset_dir / js).read_text()
+    assert js_content in inline
+    assert "function load()" in js_content
+    for filename in output.viewer_asset_names().values():
+        assert (asset_dir / filename).exists()
+
+
+def test_write_html_data_only():
+    content = output.generate_html(good_nodes, viewer="data")
+    assert content.startswith("<krona ")
+    assert content.rstrip().endswith("</krona>")
+    assert '<node name="A">' in content
+
+
+def test_node_data_json():
+    import json
+
+    data = json.loads(output.node_data_json(good_nodes, ["score"]))
+
+    assert data["datasets"] == 1
+    assert data["names"] == ["A", "B", "C"]
+    assert data["parents"] == [-1, 0, 0]
+    assert [data["rank_names"][r] for r in data["ranks"]] == ["Phylum", "Class", "Class"]
+    assert data["counts"] == [5, 3, 1]
+    assert data["extra"] == {"score": ["0.831", "0.2", "0.1"]}
+
+
+def test_node_data_json_is_script_safe():
+    nodes = [{"name": "</script><b>&", "count": 1, "rank": "Phylum"}]
+    data = output.node_data_json(nodes, [])
+    assert "<" not in data
+    assert ">" not in data
+    assert "&" not in data
+
+
+def test_write_html_json_data():
+    content = output.generate_html(good_nodes, data_format="json")
+
+    assert '<script type="application/json" id="taxburst-data"' in content
+    assert '<node name="A">' not in content
+    assert '"names":["A","B","C"]' in content
+
+
+def test_write_html_json_gz_data():
+    import base64
+    import gzip
+    import re
+
+    content = output.generate_html(good_nodes, data_format="json-gz")
+
+    m = re.search(
+        r'<script type="application/json" id="taxburst-data" data-encoding="gzip\+base64">([^<]+)</script>',
+        content,
+    )
+    assert m
+    data = gzip.decompress(base64.b64decode(m.group(1))).decode("ascii")
+    assert data == output.node_data_json(good_nodes, [])
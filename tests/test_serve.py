@@ -0,0 +1,171 @@
+"Test serving a live report."
+
+import gzip
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from taxburst import serve
+from taxburst_tst_utils import get_example_filepath
+
+example = "SRR11125891.summarized.csv"
+
+
+@pytest.fixture
+def report(tmp_path):
+    filename = tmp_path / "sample.csv"
+    shutil.copy(get_example_filepath(example), filename)
+    report = serve.LiveReport(str(filename), "csv_summary")
+    assert report.refresh()
+    yield report
+    report.close()
+
+
+@pytest.fixture
+def server(report):
+    server = serve.make_server(report, "127.0.0.1", 0)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    host, port = server.server_address[:2]
+    server.url = f"http://{host}:{port}"
+    yield server
+    report.close()
+    server.shutdown()
+    server.server_close()
+
+
+def change_file(filename):
+    "Change a file's contents, without changing its size."
+    with open(filename) as fp:
+        text = fp.read()
+    text = text.replace("d__Bacteria", "d__Bactiree")
+    with open(filename, "w") as fp:
+        fp.write(text)
+
+
+def test_file_watcher(tmp_path):
+    filename = tmp_path / "x.txt"
+    filename.write_text("abc")
+    watcher = serve.FileWatcher(str(filename))
+    assert watcher.check()
+    assert not watcher.check()
+
+    # touched, but not changed
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not watcher.check()
+
+    filename.write_text("abd")
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+    assert watcher.check()
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("", False),
+        ("gzip", True),
+        ("gzip, deflate, br", True),
+        ("GZIP;q=0.5", True),
+        ("gzip;q=0", False),
+        ("gzip; q=0.0, identity", False),
+        ("deflate", False),
+        ("*", True),
+        ("*;q=0", False),
+        ("gzip;q=0, *", False),
+        ("x-gzip", True),
+    ],
+)
+def test_accepts_gzip(header, expected):
+    assert serve.accepts_gzip(header) == expected
+
+
+def test_refresh(report):
+    assert report.version == 1
+    page = report.current[2]
+    assert b'new EventSource("/events")' in page
+    assert not report.refresh()
+
+    change_file(report.filename)
+    report.watcher.stat_key = None  # mtime may not have changed yet.
+    assert report.refresh()
+    assert report.version == 2
+    assert b"d__Bactiree" in report.current[2]
+
+
+def test_refresh_error(report, capsys):
+    with open(report.filename, "w") as fp:
+        fp.write("not,a,summary\n")
+    report.watcher.stat_key = None
+
+    assert not report.refresh()
+    assert not report.refresh()
+    assert report.version == 1  # still serving the last good page
+    out = capsys.readouterr().out
+    assert out.count("WARNING: could not render") == 1
+
+
+def test_serve_page(server):
+    with urllib.request.urlopen(server.url + "/") as resp:
+        assert resp.status == 200
+        etag = resp.headers["ETag"]
+        page = resp.read()
+    assert page == server.report.current[2]
+
+    req = urllib.request.Request(server.url + "/", headers={"If-None-Match": etag})
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        urllib.request.urlopen(req)
+    assert exc.value.code == 304
+
+    req = urllib.request.Request(server.url + "/", headers={"Accept-Encoding": "gzip"})
+    with urllib.request.urlopen(req) as resp:
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert resp.headers["Vary"] == "Accept-Encoding"
+        etag_gz = resp.headers["ETag"]
+        assert gzip.decompress(resp.read()) == page
+    assert etag_gz != etag
+
+    # the plain page's ETag doesn't match the gzipped page, and vice versa.
+    req = urllib.request.Request(
+        server.url + "/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    with urllib.request.urlopen(req) as resp:
+        assert resp.status == 200
+
+    req = urllib.request.Request(
+        server.url + "/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag_gz}
+    )
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        urllib.request.urlopen(req)
+    assert exc.value.code == 304
+    assert exc.value.headers["ETag"] == etag_gz
+    assert exc.value.headers["Vary"] == "Accept-Encoding"
+
+    req = urllib.request.Request(
+        server.url + "/", headers={"Accept-Encoding": "gzip;q=0, identity"}
+    )
+    with urllib.request.urlopen(req) as resp:
+        assert resp.headers["Content-Encoding"] is None
+        assert resp.headers["ETag"] == etag
+        assert resp.read() == page
+
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        urllib.request.urlopen(server.url + "/nothing")
+    assert exc.value.code == 404
+
+
+def test_serve_events(server):
+    report = server.report
+    with urllib.request.urlopen(server.url + "/events", timeout=10) as resp:
+        assert resp.headers["Content-Type"] == "text/event-stream"
+        assert resp.readline() == f"data: {report.current[1]}\n".encode()
+        assert resp.readline() == b"\n"
+
+        change_file(report.filename)
+        report.watcher.stat_key = None
+        assert report.refresh()
+        assert resp.readline() == f"data: {report.current[1]}\n".encode()
@@ -0,0 +1,216 @@
+"Test the report service."
+
+import asyncio
+import gzip
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from taxburst import output, parsers, service
+from taxburst_tst_utils import get_example_filepath
+
+example = "SRR11125891.t0.gather.with-lineages.csv"
+example2 = "SRR11125891.summarized.csv"
+
+
+def load_example(filename):
+    with open(get_example_filepath(filename), "rb") as fp:
+        return fp.read()
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(2) as executor:
+        yield executor
+
+
+def test_render_upload():
+    page, page_gz = service.render_upload(
+        load_example(example), "tax_annotate", "sample"
+    )
+
+    top_nodes, _, xtra = parsers.parse_file(
+        get_example_filepath(example), "tax_annotate"
+    )
+    html = output.generate_html(top_nodes, name="sample", extra_attributes=xtra)
+    assert page == html.encode("utf-8")
+    assert gzip.decompress(page_gz) == page
+
+
+def test_page_cache():
+    cache = service.PageCache(max_bytes=10)
+    cache.put("a", (b"aaa", b"a"))
+    cache.put("b", (b"bbb", b"b"))
+    assert cache.get("a") == (b"aaa", b"a")  # now 'b' is least recently used
+
+    cache.put("c", (b"ccc", b"c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.nbytes == 8
+
+    cache.put("d", (b"d" * 20, b""))  # too big to cache at all
+    assert cache.get("d") is None
+    assert len(cache) == 2
+
+
+def test_render_shared_and_cached(executor):
+    data = load_example(example)
+    svc = service.ReportService(executor, max_concurrent=2)
+
+    async def run():
+        results = await asyncio.gather(
+            *[svc.render(data, "tax_annotate", name="x") for i in range(3)]
+        )
+        results.append(await svc.render(data, "tax_annotate", name="x"))
+        return results
+
+    results = asyncio.run(run())
+    assert [how for _, how in results] == ["rendered", "shared", "shared", "cache"]
+    assert len(set(value for value, _ in results)) == 1
+    assert svc.counts["renders"] == 1
+    assert svc.in_flight == {}
+
+
+def test_render_busy(executor):
+    svc = service.ReportService(executor, max_concurrent=1, max_pending=1)
+
+    async def run():
+        return await asyncio.gather(
+            svc.render(load_example(example), "tax_annotate"),
+            svc.render(load_example(example2), "csv_summary"),
+            svc.render(load_example(example), "tax_annotate"),
+        )
+
+    results = asyncio.run(run())
+    assert [how for _, how in results] == ["rendered", "busy", "shared"]
+    assert results[1][0] is None
+    assert svc.stats()["rejected"] == 1
+
+
+def test_render_error(executor):
+    svc = service.ReportService(executor)
+
+    async def run():
+        return await svc.render(b"not,a,summary\n", "csv_summary")
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+    assert svc.counts["errors"] == 1
+    assert len(svc.cache) == 0
+
+
+def request(url, data=None, headers=None):
+    "Make a request; return (status, headers, body), even for errors."
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.headers, exc.read()
+
+
+async def raw_request(host, port, request_bytes):
+    "Send a raw HTTP request, and return the response's status line."
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(request_bytes)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return status_line.decode("latin-1").strip()
+
+
+def test_service_http(executor):
+    data = load_example(example)
+    svc = service.ReportService(executor, default_format="tax_annotate")
+
+    async def run():
+        server = await asyncio.start_server(svc.handle_connection, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        url = f"http://{host}:{port}"
+
+        results = {}
+        async with server:
+            results["render"] = await asyncio.to_thread(
+                request, url + "/render?name=sample", data
+            )
+            results["again"] = await asyncio.to_thread(
+                request, url + "/render?name=sample", data, {"Accept-Encoding": "gzip"}
+            )
+            results["no_gzip"] = await asyncio.to_thread(
+                request,
+                url + "/render?name=sample",
+                data,
+                {"Accept-Encoding": "gzip;q=0, identity"},
+            )
+            results["bad_format"] = await asyncio.to_thread(
+                request, url + "/render?format=nope", data
+            )
+            results["bad_input"] = await asyncio.to_thread(
+                request, url + "/render?format=csv_summary", b"not,a,summary\n"
+            )
+            results["get_render"] = await asyncio.to_thread(request, url + "/render")
+            results["missing"] = await asyncio.to_thread(request, url + "/nothing")
+            for length in ("abc", "-5"):
+                results[f"length {length}"] = await raw_request(
+                    host,
+                    port,
+                    f"POST /render HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode(),
+                )
+            results["stats"] = await asyncio.to_thread(request, url + "/stats")
+        return results
+
+    results = asyncio.run(run())
+
+    status, headers, page = results["render"]
+    assert status == 200
+    assert headers["X-Taxburst-Render"] == "rendered"
+    assert headers["Content-Type"] == "text/html; charset=utf-8"
+    assert b'<node name="sample">' in page
+
+    status, headers, body = results["again"]
+    assert status == 200
+    assert headers["X-Taxburst-Render"] == "cache"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["ETag"] == results["render"][1]["ETag"][:-1] + '-gz"'
+    assert gzip.decompress(body) == page
+
+    status, headers, body = results["no_gzip"]
+    assert status == 200
+    assert headers["Content-Encoding"] is None
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["ETag"] == results["render"][1]["ETag"]
+    assert body == page
+
+    assert results["bad_format"][0] == 400
+    assert results["bad_input"][0] == 422
+    assert results["get_render"][0] == 405
+    assert results["missing"][0] == 404
+    assert results["length abc"] == "HTTP/1.1 400 Bad Request"
+    assert results["length -5"] == "HTTP/1.1 400 Bad Request"
+
+    status, headers, body = results["stats"]
+    stats = json.loads(body)
+    assert stats["renders"] == 1
+    assert stats["cache_hits"] == 2
+    assert stats["errors"] == 1
+    assert stats["cache_entries"] == 1
+
+
+def test_service_upload_limit(executor):
+    svc = service.ReportService(executor, max_upload=10)
+
+    async def run():
+        server = await asyncio.start_server(svc.handle_connection, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        async with server:
+            return await asyncio.to_thread(
+                request, f"http://{host}:{port}/render", b"x" * 100
+            )
+
+    status, _, _ = asyncio.run(run())
+    assert status == 413
+    assert svc.counts["renders"] == 0
@@ -0,0 +1,68 @@
+import io
+import json
+import pstats
+
+import taxburst
+from taxburst import timings
+from taxburst_tst_utils import get_example_filepath
+
+
+def test_phase_timings():
+    timer = timings.PhaseTimings()
+    with timer.phase("parse", files=1) as stats:
+        stats["rows"] = 10
+    with timer.phase("parse", files=1) as stats:
+        stats["rows"] = 5
+
+    assert list(timer.as_dict()["phases"][0]) == [
+        "name",
+        "wall_s",
+        "cpu_s",
+        "peak_rss_mb",
+        "files",
+        "rows",
+    ]
+    parse = timer.phases["parse"]
+    assert parse["files"] == 2
+    assert parse["rows"] == 15
+    assert parse["wall_s"] >= 0
+
+    fp = io.StringIO()
+    timer.report(fp)
+    assert "files=2, rows=15" in fp.getvalue()
+
+
+def test_timed_iter():
+    timer = timings.PhaseTimings()
+    assert list(timer.timed_iter("x", range(3))) == [0, 1, 2]
+    assert "x" in timer.phases
+
+
+def test_main_timings(tmp_path):
+    path = get_example_filepath("SRR11125891.t0.gather.with-lineages.csv")
+    output = tmp_path / "xxx.html"
+    timings_json = tmp_path / "timings.json"
+    profile = tmp_path / "run.prof"
+    taxburst.main(
+        [
+            path,
+            "-F",
+            "tax_annotate",
+            "-o",
+            str(output),
+            "--timings-json",
+            str(timings_json),
+            "--profile",
+            str(profile),
+        ]
+    )
+
+    with open(timings_json) as fp:
+        d = json.load(fp)
+    phases = {p["name"]: p for p in d["phases"]}
+    assert set(phases) == {"parse", "check", "render", "node_data"}
+    assert phases["parse"]["rows"] == 1536
+    assert phases["parse"]["nodes"] == 2982
+    assert d["total"]["wall_s"] >= phases["render"]["wall_s"]
+
+    pstats.Stats(str(profile))  # is a valid profile
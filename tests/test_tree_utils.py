@@ -67,3 +67,330 @@ def test_tricky_combo():
     assert checks.trees_are_equal(tree1, copy1)
     assert checks.trees_are_equal(tree2, copy2)
     assert checks.trees_are_equal(tree3, copy3)
+
+
+def test_merge_trees_simple():
+    other = [
+        {
+            "name": "A",
+            "count": 2,
+            "rank": "Phylum",
+            "children": [{"name": "D", "count": 2, "rank": "Class"}],
+        },
+        {"name": "E", "count": 1, "rank": "Phylum"},
+    ]
+    merged = tree_utils.merge_trees([good_nodes, other], attributes=["score"])
+
+    assert [n["name"] for n in merged] == ["A", "E"]
+    a = merged[0]
+    assert a["counts"] == [5, 2]
+    assert a["count"] == 7
+    assert a["score"] == [0.831, None]
+    assert [(c["name"], c["counts"]) for c in a["children"]] == [
+        ("B", [3, 0]),
+        ("C", [1, 0]),
+        ("D", [0, 2]),
+    ]
+    assert merged[1]["counts"] == [0, 1]
+    checks.check_structure(merged)
+
+    # originals are untouched
+    assert "counts" not in good_nodes[0]
+
+
+def test_merge_trees_examples():
+    from taxburst import parsers
+
+    tree1 = parsers.parse_file(
+        get_example_filepath("SRR11125891.singleM.profile.tsv"), "SingleM"
+    )[0]
+    tree2 = parsers.parse_file(
+        get_example_filepath("SRR11125891.summarized.csv"), "csv_summary"
+    )[0]
+    tree3 = parsers.parse_file(
+        get_example_filepath("SRR11125891.t0.gather.with-lineages.csv"), "tax_annotate"
+    )[0]
+    trees = [tree1, tree2, tree3]
+
+    merged = tree_utils.merge_trees(trees)
+    checks.check_structure(merged)
+
+    # same set of names as augment_tree
+    aug_tree = tree_utils.augment_tree(tree1, [tree2, tree3])
+    aug_names = {n["name"] for n in tree_utils.nodes_beneath_top(aug_tree)}
+    merged_nodes = tree_utils.collect_all_nodes(merged)
+    assert {n["name"] for n in merged_nodes} == aug_names
+
+    # per-sample totals are preserved
+    for i, tree in enumerate(trees):
+        assert sum(n["counts"][i] for n in merged) == sum(n["count"] for n in tree)
+
+
+def test_prune_tree_min_fraction():
+    pruned = tree_utils.prune_tree(good_nodes, min_fraction=0.5)
+
+    assert [n["name"] for n in pruned] == ["A"]
+    children = pruned[0]["children"]
+    assert [(c["name"], c["count"], c["rank"]) for c in children] == [
+        ("B", 3, "Class"),
+        ("other (A)", 1, "Class"),
+    ]
+    checks.check_structure(pruned)
+    checks.check_all_counts(pruned)
+
+    # original is unchanged
+    assert len(good_nodes[0]["children"]) == 2
+
+
+def test_prune_tree_max_children():
+    tree = [
+        {"name": "X", "count": 1, "rank": "Phylum"},
+        {"name": "Y", "count": 5, "rank": "Phylum"},
+        {"name": "Z", "count": 2, "rank": "Phylum"},
+    ]
+    pruned = tree_utils.prune_tree(tree, max_children=2)
+    assert [(n["name"], n["count"]) for n in pruned] == [
+        ("Y", 5),
+        ("Z", 2),
+        ("other", 1),
+    ]
+
+
+def test_prune_tree_example():
+    from taxburst import parsers
+
+    tree = parsers.parse_file(
+        get_example_filepath("SRR11125891.t0.gather.with-lineages.csv"), "tax_annotate"
+    )[0]
+    n_before = len(tree_utils.collect_all_nodes(tree))
+    pruned = tree_utils.prune_tree(tree, min_fraction=0.01, max_children=5)
+    pruned_nodes = tree_utils.collect_all_nodes(pruned)
+
+    assert len(pruned_nodes) < n_before / 5
+    checks.check_structure(pruned)
+    assert sum(n["count"] for n in pruned) == sum(n["count"] for n in tree)
+    for node in tree_utils.nodes_beneath_top(pruned):
+        children = node.get("children", [])
+        assert len(children) <= 6  # 5 + "other"
+
+
+def test_prune_tree_merged_counts():
+    other = [{"name": "A", "count": 2, "rank": "Phylum"}]
+    merged = tree_utils.merge_trees([good_nodes, other])
+    pruned = tree_utils.prune_tree(merged, max_children=1)
+
+    assert pruned[0]["children"][1]["name"] == "other (A)"
+    assert pruned[0]["children"][1]["counts"] == [1, 0]
+
+
+example_inputs = [
+    ("SRR11125891.summarized.csv", "csv_summary"),
+    ("SRR11125891.t0.gather.with-lineages.csv", "tax_annotate"),
+    ("SRR11125891.singleM.profile.tsv", "SingleM"),
+    ("SRR11125891.krona.tsv", "krona"),
+    ("SRR11125891.lineages.json", "json"),
+    ("small.tax.csv", "csv_summary"),
+]
+
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def use_numpy(request):
+    if request.param:
+        pytest.importorskip("numpy")
+    return request.param
+
+
+@pytest.mark.parametrize("filename,input_format", example_inputs)
+def test_aggregation_examples(filename, input_format, use_numpy):
+    from taxburst import parsers
+
+    tree = parsers.parse_file(get_example_filepath(filename), input_format)[0]
+    flat = tree_utils.flatten_tree(tree)
+    assert flat.nodes == tree_utils.collect_all_nodes(tree)
+    counts = [float(n["count"]) for n in flat.nodes]
+    assert list(flat.counts) == counts
+
+    # pushing the unassigned counts back up the tree gives the counts again.
+    own = tree_utils.unassigned_counts(flat, use_numpy=use_numpy)
+    sums = tree_utils.subtree_sums(flat, own, use_numpy=use_numpy)
+    assert sums == pytest.approx(counts)
+
+    top_total = sum(float(n["count"]) for n in tree)
+    levels = tree_utils.level_totals(flat, use_numpy=use_numpy)
+    assert levels[0] == pytest.approx(top_total)
+    assert len(levels) == max(flat.depths) + 1
+
+    by_rank = tree_utils.rank_totals(tree, use_numpy=use_numpy)
+    assert sum(by_rank.values()) == pytest.approx(sum(counts))
+    assert by_rank[tree[0]["rank"]] == pytest.approx(top_total)
+
+    # relative abundance matches the original normalize_tree_counts exactly.
+    fractions = tree_utils.relative_abundance(flat, use_numpy=use_numpy)
+    assert fractions == [c / top_total for c in counts]
+
+    by_total = tree_utils.copy_tree(tree)
+    tree_utils.normalize_tree_counts(by_total, use_numpy=use_numpy)
+    assert [n["count"] for n in tree_utils.nodes_beneath_top(by_total)] == fractions
+
+    by_level = tree_utils.copy_tree(tree)
+    tree_utils.normalize_tree_counts(by_level, by="level", use_numpy=use_numpy)
+    level_flat = tree_utils.flatten_tree(by_level)
+    for total in tree_utils.level_totals(level_flat, use_numpy=use_numpy):
+        assert total == pytest.approx(1.0)
+
+
+def test_aggregation_numpy_matches_python():
+    pytest.importorskip("numpy")
+    from taxburst import parsers
+
+    for filename, input_format in example_inputs:
+        tree = parsers.parse_file(get_example_filepath(filename), input_format)[0]
+        flat = tree_utils.flatten_tree(tree)
+        for func in (tree_utils.unassigned_counts, tree_utils.level_totals):
+            assert func(flat, use_numpy=True) == pytest.approx(
+                func(flat, use_numpy=False)
+            )
+        own = tree_utils.unassigned_counts(flat)
+        assert tree_utils.subtree_sums(flat, own, use_numpy=True) == pytest.approx(
+            tree_utils.subtree_sums(flat, own, use_numpy=False)
+        )
+
+
+def test_normalize_by_level():
+    a_copy = tree_utils.copy_tree(good_nodes)
+    tree_utils.normalize_tree_counts(a_copy, by="level")
+    assert a_copy[0]["count"] == 1
+    assert a_copy[0]["children"][0]["count"] == 3 / 4
+    assert a_copy[0]["children"][1]["count"] == 1 / 4
+
+    with pytest.raises(Exception):
+        tree_utils.normalize_tree_counts(a_copy, by="nope")
+
+
+def test_flatten_compact_tree():
+    from taxburst.compact import CompactTree
+
+    tree = CompactTree.from_nodes(good_nodes)
+    flat = tree_utils.flatten_tree(tree)
+    assert list(flat.parents) == [-1, 0, 0]
+    assert list(flat.depths) == [0, 1, 1]
+    assert list(flat.counts) == [5, 3, 1]
+    assert flat.parents == tree_utils.flatten_tree(good_nodes).parents
+    assert tree_utils.subtree_sums(flat, [1, 3, 1]) == [5, 3, 1]
+
+
+def test_tree_index_simple():
+    tree = tree_utils.copy_tree(good_nodes)
+    index = tree_utils.TreeIndex(tree)
+
+    assert len(index) == 3
+    assert index["B"] is tree[0]["children"][0]
+    assert "Z" not in index
+    assert index.get("Z") is None
+    assert index.parent("B") is tree[0]
+    assert index.parent("A") is None
+    assert index.depth("C") == 1
+    assert index.lineage("C") == ["A", "C"]
+    assert index.find(["A", "C"]) is tree[0]["children"][1]
+    assert index.find("A;C") is tree[0]["children"][1]
+    assert index.find(["C"]) is None
+    assert index.find(["B", "C"]) is None
+    assert [n["name"] for n in index.at_rank("Class")] == ["B", "C"]
+    assert index.at_rank("Genus") == []
+    assert not index.bad_names
+
+    assert tree_utils.TreeIndex.of(index) is index
+
+
+def test_tree_index_updates():
+    tree = tree_utils.copy_tree(good_nodes)
+    index = tree_utils.TreeIndex(tree)
+
+    index.add(dict(name="D", count=1, rank="Order"), "B")
+    assert tree[0]["children"][0]["children"][0]["name"] == "D"
+    assert index.lineage("D") == ["A", "B", "D"]
+
+    index.add(dict(name="E", count=2, rank="Phylum"))
+    assert tree[-1]["name"] == "E"
+    assert index.depth("E") == 0
+
+    index.update("B", name="B2", count=4, rank="Order")
+    assert tree[0]["children"][0]["name"] == "B2"
+    assert "B" not in index
+    assert index.lineage("D") == ["A", "B2", "D"]
+    assert [n["name"] for n in index.at_rank("Order")] == ["D", "B2"]
+    assert [n["name"] for n in index.at_rank("Class")] == ["C"]
+
+    removed = index.remove("B2")
+    assert removed["name"] == "B2"
+    assert [c["name"] for c in tree[0]["children"]] == ["C"]
+    assert "D" not in index and "B2" not in index
+    assert index.at_rank("Order") == []
+
+    # the index matches a fresh one.
+    fresh = tree_utils.TreeIndex(tree)
+    assert fresh.by_name == index.by_name
+    assert fresh.depths == index.depths
+
+
+def test_tree_index_bad_names():
+    tree = [
+        {"name": "A", "count": 1, "rank": "Phylum"},
+        {"name": "", "count": 1, "rank": "Phylum"},
+        {"name": "A", "count": 1, "rank": "Phylum"},
+    ]
+    index = tree_utils.TreeIndex(tree)
+    assert index["A"] is tree[0]
+    assert index.bad_names == [tree[1], tree[2]]
+
+    assert index.all_named("A") == [tree[0], tree[2]]
+
+    index.remove("A")
+    assert index.bad_names == [tree[0], tree[1]]
+    assert index.all_named("A") == [tree[1]]
+
+
+def test_augment_tree_duplicate_names():
+    # 'X' is in two places; their children are combined, as are the
+    # children of same-named nodes in the other trees.
+    def node(name, rank, *children):
+        d = {"name": name, "count": 1, "rank": rank}
+        if children:
+            d["children"] = list(children)
+        return d
+
+    tree1 = [
+        node("A", "superkingdom", node("X", "phylum", node("P", "class"))),
+        node("D", "superkingdom", node("X", "phylum", node("Q", "class"))),
+    ]
+    tree2 = [node("A", "superkingdom", node("X", "phylum", node("R", "class")))]
+
+    aug_tree = tree_utils.augment_tree(tree1, [tree2])
+    for top_node in aug_tree:
+        (x,) = top_node["children"]
+        assert {c["name"] for c in x["children"]} == {"P", "Q", "R"}
+
+
+@pytest.mark.parametrize("filename,input_format", example_inputs)
+def test_tree_index_examples(filename, input_format):
+    from taxburst import parsers
+    from taxburst.compact import CompactTree
+    from taxburst.frozen import freeze
+
+    tree = parsers.parse_file(get_example_filepath(filename), input_format)[0]
+    flat = tree_utils.flatten_tree(tree)
+
+    for t in (tree, CompactTree.from_nodes(tree), freeze(tree)):
+        index = tree_utils.TreeIndex(t)
+        assert len(index) == len(flat.nodes)
+        for node, depth in zip(tree_utils.nodes_beneath_top(t), flat.depths):
+            name = node["name"]
+            assert index.depth(name) == depth
+            lineage = index.lineage(name)
+            assert len(lineage) == depth + 1
+            assert index.find(lineage)["name"] == name
+
+        by_rank = tree_utils.rank_totals(t)
+        for rank, total in by_rank.items():
+            nodes = index.at_rank(rank)
+            assert sum(float(n["count"]) for n in nodes) == pytest.approx(total)